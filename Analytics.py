@@ -0,0 +1,110 @@
+import argparse
+import json
+from AnswerLog import read_answers
+
+# Question statistics from answer logs (Server.py --answer-log FILE): how many players got each
+# question right and how long they took. The logs are read one answer at a time and only
+# counters and a fixed-size latency histogram are kept per question, so archives of any size
+# are read in constant memory (it grows with the number of different questions, not answers).
+#
+# Usage: python Analytics.py answers.jsonl                       hardest questions first
+#        python Analytics.py answers.log answers.log.worker-*    several files (of any format) together
+#        python Analytics.py answers.jsonl --json > stats.json
+
+# Answer times are counted in buckets of this many seconds; slower answers share the last bucket
+BUCKET_SECONDS = 0.05
+BUCKETS = 2400
+
+
+class LatencyHistogram:
+    """Answer times in fixed-width buckets (the server's power-of-two timing buckets are too coarse
+    to tell a 3 second question from a 5 second one)"""
+
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.buckets[min(BUCKETS - 1, int(seconds / BUCKET_SECONDS))] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """Upper bound (in seconds) of the bucket holding the given fraction of the answers"""
+        needed = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= needed and seen > 0:
+                return min((i + 1) * BUCKET_SECONDS, self.max)
+        return self.max
+
+
+class QuestionStats:
+    """Answers to one question across all games"""
+
+    def __init__(self):
+        self.answers = 0
+        self.correct = 0
+        self.options = [0, 0, 0, 0, 0]
+        self.latency = LatencyHistogram()
+
+    def add(self, answer, correct, latency):
+        self.answers += 1
+        if correct:
+            self.correct += 1
+        self.options[answer] += 1
+        self.latency.observe(max(0.0, latency))
+
+    def report(self):
+        latency = self.latency
+        return {"answers": self.answers,
+                "accuracy": round(self.correct / self.answers, 4),
+                "options": dict(zip(("other", "1", "2", "3", "4"), self.options)),
+                "latency_avg_s": round(latency.total / latency.count, 3),
+                "latency_p50_s": round(latency.percentile(0.5), 3),
+                "latency_p90_s": round(latency.percentile(0.9), 3),
+                "latency_max_s": round(latency.max, 3)}
+
+
+def analyse(paths):
+    """Returns (number of answers, {question: QuestionStats})"""
+    questions = {}
+    total = 0
+    for path in paths:
+        for received, room, round_number, question, player, answer, correct, latency in read_answers(path):
+            stats = questions.get(question)
+            if stats is None:
+                stats = questions[question] = QuestionStats()
+            stats.add(answer, correct, latency)
+            total += 1
+    return total, questions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-question accuracy and answer times from answer logs")
+    parser.add_argument("logs", nargs="+", help="files written by Server.py --answer-log (any format)")
+    parser.add_argument("--limit", type=int, help="show only this many questions")
+    parser.add_argument("--json", action="store_true", help="print the statistics as JSON")
+    args = parser.parse_args()
+
+    try:
+        total, questions = analyse(args.logs)
+    except (OSError, ValueError, KeyError) as e:
+        parser.error(str(e))
+    # Hardest (lowest accuracy) first
+    ordered = sorted(questions.items(), key=lambda item: item[1].correct / item[1].answers)[:args.limit]
+    if args.json:
+        print(json.dumps({"answers": total, "questions": {text: stats.report() for text, stats in ordered}},
+                         indent=1, ensure_ascii=False))
+    else:
+        print(f"{total} answers to {len(questions)} questions")
+        for text, stats in ordered:
+            report = stats.report()
+            print(f"{report['accuracy'] * 100:5.1f}% correct  {report['answers']:>7} answers  "
+                  f"avg {report['latency_avg_s']:.2f}s  p50<={report['latency_p50_s']:.2f}s  "
+                  f"p90<={report['latency_p90_s']:.2f}s  {text}")
@@ -0,0 +1,251 @@
+import csv
+import json
+import queue
+import struct
+import sys
+import threading
+from array import array
+from ServerLog import log
+
+# Answer export (--answer-log): every scored answer of every round, for analytics after the
+# games (Analytics.py) - which questions are hard, how long players take to answer.
+#
+#  - the game loop only collects the answers of a round in a list; batches of them go
+#    through a bounded queue to a writer thread, which formats and writes them, so the
+#    loop never waits for the disk. When the writer falls behind and the queue is full,
+#    batches are dropped (and counted) instead of blocking the game.
+#  - one event per answer: (received, room, round, question, player, answer, correct, latency)
+#      received  time.time() when the server got the answer
+#      answer    1-4, 0 for anything else
+#      latency   seconds between the question and the answer
+#    A player who changes their answer appears once, with the answer that was scored.
+#
+# Formats (--answer-log-format):
+#   jsonl    one JSON object per line
+#   csv      a header line and one row per answer
+#   columns  compact binary blocks, one per batch: the columns are arrays of numbers and the
+#            strings (rooms, questions, players) are stored once per block and referred to by index
+
+FIELDS = ("received", "room", "round", "question", "player", "answer", "correct", "latency")
+
+# Binary block: magic, number of rows, length of the JSON list of strings; then the strings
+# and the columns (little-endian) in this order
+BLOCK_MAGIC = b"KAL1"
+BLOCK_HEADER = struct.Struct("<4sII")
+COLUMNS = (("received", "d"), ("round", "I"), ("latency", "f"), ("answer", "B"), ("correct", "B"),
+           ("room", "I"), ("question", "I"), ("player", "I"))
+STRING_COLUMNS = ("room", "question", "player")
+
+# Batches waiting for the writer thread; more than this and new batches are dropped
+MAX_QUEUED_BATCHES = 256
+
+
+class JsonLinesWriter:
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, events):
+        dumps = json.dumps
+        self.file.write("".join(dumps(dict(zip(FIELDS, event)), ensure_ascii=False) + "\n" for event in events))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.file)
+        if self.file.tell() == 0:
+            self.writer.writerow(FIELDS)
+
+    def write(self, events):
+        self.writer.writerows(events)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ColumnsWriter:
+    def __init__(self, path):
+        self.file = open(path, "ab")
+
+    def write(self, events):
+        strings = []
+        string_index = {}
+        columns = {name: array(typecode) for name, typecode in COLUMNS}
+        for position, name in enumerate(FIELDS):
+            column = columns[name]
+            if name in STRING_COLUMNS:
+                for event in events:
+                    value = event[position]
+                    index = string_index.get(value)
+                    if index is None:
+                        index = string_index[value] = len(strings)
+                        strings.append(value)
+                    column.append(index)
+            else:
+                column.extend(event[position] for event in events)
+        encoded_strings = json.dumps(strings, ensure_ascii=False).encode()
+        chunks = [BLOCK_HEADER.pack(BLOCK_MAGIC, len(events), len(encoded_strings)), encoded_strings]
+        for name, _ in COLUMNS:
+            column = columns[name]
+            if sys.byteorder == "big":
+                column.byteswap()
+            chunks.append(column.tobytes())
+        self.file.write(b"".join(chunks))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+WRITERS = {"jsonl": JsonLinesWriter, "csv": CsvWriter, "columns": ColumnsWriter}
+
+
+class AnswerLog:
+    """Hands the answers of the rounds to a background writer thread"""
+
+    enabled = True
+
+    def __init__(self, path, call_later, file_format="jsonl", batch_size=4096, flush_interval=1.0):
+        # Opened here, so a bad path fails when the server starts and not in the thread
+        self.writer = WRITERS[file_format](path)
+        # Schedules the hand-over of a partial batch (server.call_later, so it works with every engine)
+        self.call_later = call_later
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.batch = []
+        self.flush_scheduled = False
+        self.queue = queue.Queue(MAX_QUEUED_BATCHES)
+        # Answers lost because the writer couldn't keep up
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.write_batches, name="answer-log", daemon=True)
+        self.thread.start()
+
+    def add(self, events):
+        """Answers of one round (a list of event tuples, see FIELDS)"""
+        batch = self.batch
+        batch.extend(events)
+        if len(batch) >= self.batch_size:
+            self.hand_over()
+        elif not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.call_later(self.flush_interval, self.flush)
+
+    def hand_over(self):
+        batch = self.batch
+        self.batch = []
+        try:
+            self.queue.put_nowait(batch)
+        except queue.Full:
+            if self.dropped == 0:
+                log.warning("The answer log can't keep up, dropping answers")
+            self.dropped += len(batch)
+
+    def flush(self):
+        """Hand over a partial batch (also the timer callback)"""
+        self.flush_scheduled = False
+        if self.batch:
+            self.hand_over()
+
+    def write_batches(self):
+        """Writer thread: formats and writes batches until close() sends None"""
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+            try:
+                self.writer.write(batch)
+                if self.queue.empty():
+                    self.writer.flush()
+            except (OSError, ValueError) as e:
+                log.error("Answer log write failed: %s", e)
+                self.dropped += len(batch)
+        self.writer.close()
+
+    def close(self):
+        """Write out everything still queued and stop the writer thread"""
+        if not self.thread.is_alive():
+            return
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+
+
+class NullAnswerLog:
+    """Used when the answer export is off - every call does nothing"""
+
+    enabled = False
+    dropped = 0
+
+    def add(self, events):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def read_columns(file):
+    """Yield the events of the binary columnar format, one block in memory at a time"""
+    while True:
+        header = file.read(BLOCK_HEADER.size)
+        if len(header) < BLOCK_HEADER.size:
+            return
+        magic, rows, strings_length = BLOCK_HEADER.unpack(header)
+        if magic != BLOCK_MAGIC:
+            raise ValueError("not an answer log block")
+        strings = json.loads(file.read(strings_length))
+        columns = {}
+        for name, typecode in COLUMNS:
+            column = array(typecode)
+            data = file.read(rows * column.itemsize)
+            if len(data) < rows * column.itemsize:
+                # Cut off by a crash in the middle of a write
+                return
+            column.frombytes(data)
+            if sys.byteorder == "big":
+                column.byteswap()
+            if name in STRING_COLUMNS:
+                column = [strings[index] for index in column]
+            elif name == "correct":
+                column = [value == 1 for value in column]
+            columns[name] = column
+        yield from zip(*(columns[name] for name in FIELDS))
+
+
+def read_answers(path):
+    """Yield the events of an answer log of any format (see FIELDS), one at a time"""
+    with open(path, "rb") as f:
+        start = f.read(len(BLOCK_MAGIC))
+    if start == BLOCK_MAGIC:
+        with open(path, "rb") as f:
+            yield from read_columns(f)
+    elif start.startswith(b"{"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                record = json.loads(line)
+                yield tuple(record[name] for name in FIELDS)
+    elif start:
+        with open(path, encoding="utf-8", newline="") as f:
+            rows = csv.reader(f)
+            if next(rows) != list(FIELDS):
+                raise ValueError(f"{path} is not an answer log")
+            for row in rows:
+                if len(row) != len(FIELDS):
+                    break
+                yield (float(row[0]), row[1], int(row[2]), row[3], row[4], int(row[5]),
+                       row[6] == "True", float(row[7]))
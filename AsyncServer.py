@@ -0,0 +1,176 @@
+import asyncio
+import time
+from BinaryProtocol import BinaryDecoder
+from FrameDecoder import FrameDecoder
+from RelayProtocol import RelayedClient
+from Server import my_server
+from ServerLog import log, SAMPLE_CONNECTIONS
+
+class async_server(my_server):
+    """Kahoot server engine built on asyncio streams.
+
+    Uses the same protocol, Player model and game logic as my_server - only the
+    networking is different. Instead of waking up every 0.1s to poll select.select,
+    every client gets its own lightweight coroutine that sleeps until data arrives,
+    so thousands of players can stay connected on one core.
+    """
+
+    def __init__(self, port, **buffer_options):
+        super().__init__(port, engine="asyncio", **buffer_options)
+        # writer -> time its transport buffer went above the high watermark
+        self.slow_since = {}
+        # writer -> its decoder (replaced when the client switches to the binary protocol)
+        self.decoders = {}
+
+    def run_server(self):
+        log.info("Kahoot Server (asyncio engine) is now listening...")
+        try:
+            asyncio.run(self.serve())
+        finally:
+            self.server_socket.close()
+
+    async def serve(self):
+        """Accept connections on the already bound server socket forever"""
+        self.start_early_timers()
+        # The listening socket was created and bound by my_server.__init__,
+        # asyncio just takes it over. Every wakeup of the listener accepts up to backlog connections.
+        server = await asyncio.start_server(self.handle_connection, sock=self.server_socket,
+                                            backlog=self.backlog)
+        if self.metrics_socket:
+            await asyncio.start_server(self.handle_metrics_connection, sock=self.metrics_socket)
+        async with server:
+            await server.serve_forever()
+
+    async def handle_metrics_connection(self, reader, writer):
+        """Answer one request on the local metrics port"""
+        await reader.read(4096)
+        body = self.render_metrics().encode()
+        writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; charset=utf-8\r\n"
+                     + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+        writer.close()
+
+    async def handle_connection(self, reader, writer):
+        """Coroutine that serves one client for its whole lifetime"""
+        # The StreamWriter plays the role the socket plays in my_server:
+        # it is stored in self.clients and in Player.client_socket.
+        # The transport does the output buffering; it pauses writing above the
+        # high watermark and resumes once the buffer drains below the low watermark.
+        if self.is_full():
+            self.metrics.add("connections.rejected")
+            log.warning("Connection limit of %d reached, rejecting a client", self.max_connections,
+                        extra=SAMPLE_CONNECTIONS)
+            writer.write(b"SERVER_FULL\n")
+            writer.close()
+            return
+        writer.transport.set_write_buffer_limits(self.high_watermark, self.low_watermark)
+        self.clients.append(writer)
+        self.last_seen[writer] = time.monotonic()
+        self.recorder.connected(writer)
+        self.metrics.add("connections.accepted")
+        self.send_to(writer, "NAME_REQUEST")
+        self.deliver()
+        log.debug("New client connected from %s", writer.get_extra_info('peername'), extra=SAMPLE_CONNECTIONS)
+
+        self.decoders[writer] = FrameDecoder()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                self.metrics.add("bytes_in", len(data))
+                handled = self.handle_messages(writer, self.decoders[writer].feed(data))
+                # Everything the messages produced goes out before the next read
+                self.deliver()
+                if not handled:
+                    break
+        except (ConnectionError, ValueError):
+            pass
+
+        self.slow_since.pop(writer, None)
+        self.decoders.pop(writer, None)
+        self.remove_client(writer)
+        self.deliver()
+
+    def enable_binary(self, writer):
+        self.send_to(writer, "PROTO:BINARY")
+        self.binary_clients.add(writer)
+        # Relayed clients have no decoder here, their relay decodes what they send
+        if writer in self.decoders:
+            self.decoders[writer] = BinaryDecoder()
+
+    def call_later(self, delay, callback, *args, room=None):
+        """Timers run on the asyncio event loop (which keeps its own heap of deadlines)"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Before the loop runs (rooms restored from the journal): serve() moves these over
+            return self.scheduler.call_later(delay, self.run_timer, room, callback, args)
+        return loop.call_later(delay, self.run_timer, room, callback, args)
+
+    def run_timer(self, room, callback, args):
+        super().run_timer(room, callback, args)
+        self.deliver()
+
+    def start_early_timers(self):
+        """Hand the timers set before the event loop started over to it"""
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        for when, _, timer in self.scheduler.heap:
+            if not timer.cancelled:
+                loop.call_later(max(0.0, when - now), self.run_early_timer, timer)
+        self.scheduler.heap.clear()
+
+    def run_early_timer(self, timer):
+        if not timer.cancelled:
+            timer.cancelled = True
+            timer.callback(*timer.args)
+
+    def cancel_timer(self, timer):
+        if timer is not None:
+            timer.cancel()
+
+    def deliver(self):
+        """Hand the outbox to the transports, in order"""
+        outbox = self.outbox
+        if not outbox:
+            return
+        write_bytes = self.write_bytes
+        pairs = iter(outbox)
+        for client_socket, data in zip(pairs, pairs):
+            write_bytes(client_socket, data)
+        outbox.clear()
+
+    def write_bytes(self, client_socket, data):
+        """Queue already encoded data on the client's transport (never blocks)"""
+        if client_socket.__class__ is RelayedClient:
+            client_socket.queue(data)
+            return
+        if client_socket.is_closing():
+            return
+        client_socket.write(data)
+        # Counted when handed to the transport - asyncio doesn't tell when it is actually sent
+        self.metrics.add("bytes_out", len(data))
+        self.check_slow_client(client_socket)
+
+    def set_relay_buffer(self, writer):
+        writer.transport.set_write_buffer_limits(self.relay_buffer // 4, self.relay_buffer // 16)
+
+    def check_slow_client(self, writer):
+        """Drop a client whose transport buffer stays too full for too long"""
+        buffered = writer.transport.get_write_buffer_size()
+        # The watermarks of the transport: relay links have bigger ones (set_relay_buffer)
+        low_watermark, high_watermark = writer.transport.get_write_buffer_limits()
+        if buffered <= low_watermark:
+            self.slow_since.pop(writer, None)
+            return
+        if buffered <= high_watermark and writer not in self.slow_since:
+            return
+
+        now = time.monotonic()
+        slow_since = self.slow_since.setdefault(writer, now)
+        max_buffer = self.relay_buffer if writer in self.relays else self.max_output_buffer
+        if buffered > max_buffer or now - slow_since > self.slow_timeout:
+            log.warning("Evicting slow client %s (%d bytes not delivered)", writer.get_extra_info('peername'), buffered)
+            # abort() drops the buffered data right away; handle_connection then cleans up the player
+            writer.transport.abort()
@@ -0,0 +1,741 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from AnswerLog import read_answers
+from BinaryProtocol import BinaryDecoder, encode_answer
+from Connection import Connection
+from FrameDecoder import FrameDecoder
+from Journal import Journal
+from Leaderboard import Leaderboard
+from LoadTester import LoadTest
+from Player import Player
+from PlayerColumns import PlayerColumns
+from QuizBank import QuizBank
+from RelayProtocol import RelayLink
+from Room import DEFAULT_PIN
+from Server import my_server
+from ServerLog import setup_logging, stop_logging
+
+# Only on Unix: raises the open file limit for the many-clients check
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Micro-benchmarks for the server's game logic. No clients are needed: players get
+# fake sockets, and the server just buffers whatever it would send to them.
+#
+# Usage: python Benchmark.py [benchmark name ...]   (no names = run all)
+
+class FakeSocket:
+    """Stands in for a client socket - only needs to be hashable and have a fileno"""
+    next_fileno = 1000
+
+    def __init__(self):
+        FakeSocket.next_fileno += 1
+        self.number = FakeSocket.next_fileno
+
+    def fileno(self):
+        return self.number
+
+
+def add_fake_client(room):
+    server = room.server
+    client_socket = FakeSocket()
+    server.clients.append(client_socket)
+    server.connections[client_socket] = Connection(client_socket, server.high_watermark,
+                                                   server.low_watermark, server.max_output_buffer)
+    server.room_of[client_socket] = room
+    return client_socket
+
+
+def make_room(player_count, binary=False, **options):
+    """Create a server with one room that has an admin and player_count players
+    (binary=True: the players use the binary protocol)"""
+    server = my_server(0, **options)
+    room = server.get_room(DEFAULT_PIN)
+    room.players.add(Player("admin", 0, True, add_fake_client(room), None))
+    for i in range(player_count):
+        player = Player(f"player{i}", 0, False, add_fake_client(room), None)
+        player.token = f"{room.pin}-{i:016x}"
+        room.sessions[player.token] = player
+        if binary:
+            player.binary = True
+            server.binary_clients.add(player.client_socket)
+        room.players.add(player)
+        room.columns.add(player)
+        room.leaderboard.add(player)
+    return room
+
+
+def make_relayed_room(player_count, relay_count):
+    """Like make_room, but the players play through relay_count relays"""
+    server = my_server(0)
+    room = server.get_room(DEFAULT_PIN)
+    room.players.add(Player("admin", 0, True, add_fake_client(room), None))
+    for _ in range(relay_count):
+        link_socket = add_fake_client(room)
+        del server.room_of[link_socket]
+        link = RelayLink(server, link_socket, room)
+        server.relays[link_socket] = link
+        room.relays.append(link)
+    for i in range(player_count):
+        client = room.relays[i % relay_count].add_client(str(i))
+        server.room_of[client] = room
+        player = Player(f"player{i}", 0, False, client, None)
+        room.players.add(player)
+        room.columns.add(player)
+        room.leaderboard.add(player)
+    return room
+
+
+def drain_output(server):
+    """Pretend everything buffered was sent, return how many bytes that was"""
+    for room in server.rooms.values():
+        server.collect(room)
+    server.deliver()
+    total = 0
+    for client_socket in server.pending_writes:
+        connection = server.connections[client_socket]
+        total += connection.buffered
+        connection.out_chunks.clear()
+        connection.buffered = 0
+    server.pending_writes.clear()
+    return total
+
+
+def play_rounds(room, rounds):
+    """Play some rounds where every player answers (half of them correctly)"""
+    i = 0
+    for _ in range(rounds):
+        room.send_question("QUESTION:2+2?|3|4|5|6|2")
+        for player in room.players.non_admin_players():
+            room.columns.record_answer(player, "2" if i % 2 else "1")
+            i += 1
+        room.calculate_round_results()
+        drain_output(room.server)
+
+
+def bench_answers():
+    """Cost of handling one answer, for growing numbers of players"""
+    print("players | per answer")
+    for player_count in (10, 100, 1000, 10000):
+        room = make_room(player_count)
+        # The server prints a lot - don't measure the terminal
+        with contextlib.redirect_stdout(io.StringIO()):
+            room.start_game()
+            room.send_question("QUESTION:2+2?|3|4|5|6|2")
+            players = list(room.players.non_admin_players())[:-1]
+            start = time.perf_counter()
+            for player in players:
+                room.handle_answer(player, "2")
+            elapsed = time.perf_counter() - start
+        print(f"{player_count:7} | {elapsed / len(players) * 1e6:8.2f} us")
+        room.server.server_socket.close()
+
+
+def bench_round_results():
+    """Cost of scoring a round and building the scoreboard"""
+    print("players | per round")
+    for player_count in (100, 1000, 10000):
+        room = make_room(player_count)
+        with contextlib.redirect_stdout(io.StringIO()):
+            room.start_game()
+            play_rounds(room, 2)
+            start = time.perf_counter()
+            play_rounds(room, 3)
+            elapsed = time.perf_counter() - start
+        print(f"{player_count:7} | {elapsed / 3 * 1000:8.2f} ms")
+        room.server.server_socket.close()
+
+
+def bench_round_bytes():
+    """Bytes sent per round with the full scoreboard vs. the per-player summary"""
+    print("players | full scoreboard | summary")
+    for player_count in (10, 100, 1000, 3000):
+        sizes = []
+        for mode in ("full", "summary"):
+            room = make_room(player_count, scoreboard=mode)
+            with contextlib.redirect_stdout(io.StringIO()):
+                room.start_game()
+                play_rounds(room, 1)
+                room.send_question("QUESTION:2+2?|3|4|5|6|2")
+                drain_output(room.server)
+                for player in room.players.non_admin_players():
+                    room.columns.record_answer(player, "2")
+                room.calculate_round_results()
+            sizes.append(drain_output(room.server))
+            room.server.server_socket.close()
+        print(f"{player_count:7} | {sizes[0]:13,} B | {sizes[1]:,} B")
+
+
+def bench_protocol():
+    """Text lines vs. the binary protocol: cost per answer and bytes per round"""
+    # Decoding and handling one answer, as it arrives from a client
+    room = make_room(2)
+    server = room.server
+    player = next(room.players.non_admin_players())
+    with contextlib.redirect_stdout(io.StringIO()):
+        room.start_game()
+        room.send_question("QUESTION:2+2?|3|4|5|6|2")
+    drain_output(server)
+    repeats = 100000
+    print("protocol | per answer (decode + handle) | bytes per answer")
+    for label, decoder, data in (("text", FrameDecoder(), b"2\n"),
+                                 ("binary", BinaryDecoder(), encode_answer("2"))):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            server.handle_messages(player.client_socket, decoder.feed(data))
+        elapsed = time.perf_counter() - start
+        print(f"{label:8} | {elapsed / repeats * 1e9:25.0f} ns | {len(data)}")
+    server.server_socket.close()
+
+    # Everything a round sends: the question, the results and the scoreboard summaries
+    print("players | text round | binary round")
+    for player_count in (10, 100, 1000, 3000):
+        sizes = []
+        for binary in (False, True):
+            room = make_room(player_count, binary=binary)
+            with contextlib.redirect_stdout(io.StringIO()):
+                room.start_game()
+                play_rounds(room, 1)
+                room.send_question("QUESTION:2+2?|3|4|5|6|2")
+                for player in room.players.non_admin_players():
+                    room.columns.record_answer(player, "2")
+                room.calculate_round_results()
+            sizes.append(drain_output(room.server))
+            room.server.server_socket.close()
+        print(f"{player_count:7} | {sizes[0]:8,} B | {sizes[1]:,} B")
+
+
+def bench_core():
+    """The game core alone: one round as events in, messages out - and what delivering them costs"""
+    print("players | game logic | messages | delivery")
+    for player_count in (1000, 10000):
+        room = make_room(player_count)
+        server = room.server
+        players = list(room.players.non_admin_players())
+        logic = delivery = 0.0
+        messages = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            room.start_game()
+            drain_output(server)
+            for i in range(3):
+                start = time.perf_counter()
+                room.send_question("QUESTION:2+2?|3|4|5|6|2")
+                for j, player in enumerate(players):
+                    room.handle_answer(player, "2" if j % 2 else "1")
+                logic += time.perf_counter() - start
+                # The room's outbox is flat: socket, bytes, socket, bytes ...
+                messages += len(room.outbox) // 2
+                start = time.perf_counter()
+                server.collect(room)
+                server.deliver()
+                delivery += time.perf_counter() - start
+                drain_output(server)
+        print(f"{player_count:7} | {logic / 3 * 1000:7.1f} ms | {messages // 3:8,} | {delivery / 3 * 1000:.1f} ms")
+        server.server_socket.close()
+
+
+def bench_broadcast():
+    """Cost per recipient of broadcasting one message"""
+    message = "SYSTEM:" + "x" * 100
+    print("recipients | per recipient")
+    for player_count in (100, 1000, 10000):
+        room = make_room(player_count)
+        repeats = 20
+        start = time.perf_counter()
+        for _ in range(repeats):
+            room.broadcast(message)
+            room.server.collect(room)
+            room.server.deliver()
+        elapsed = time.perf_counter() - start
+        drain_output(room.server)
+        print(f"{len(room.server.clients):10} | {elapsed / repeats / len(room.server.clients) * 1e9:8.0f} ns")
+        room.server.server_socket.close()
+
+
+def bench_relay():
+    """Server work for one round with every player on their own connection vs. behind relays"""
+    print("players | relays | per round | sockets written | bytes sent")
+    for player_count in (1000, 10000):
+        for relay_count in (0, 10):
+            room = make_relayed_room(player_count, relay_count) if relay_count else make_room(player_count)
+            server = room.server
+            with contextlib.redirect_stdout(io.StringIO()):
+                room.start_game()
+                drain_output(server)
+                elapsed = 0.0
+                for i in range(3):
+                    start = time.perf_counter()
+                    room.send_question("QUESTION:2+2?|3|4|5|6|2")
+                    # Every player answers: one line each, or one ANSWERS line per relay
+                    if relay_count:
+                        for link in room.relays:
+                            server.handle_messages(link.link_socket, ["ANSWERS:" + ",".join(
+                                f"{client_id}=2" for client_id in link.clients)])
+                    else:
+                        for player in list(room.players.non_admin_players()):
+                            server.handle_messages(player.client_socket, ["2"])
+                    server.deliver()
+                    elapsed += time.perf_counter() - start
+                    sockets = len(server.pending_writes)
+                    sent = drain_output(server)
+            print(f"{player_count:7} | {relay_count:6} | {elapsed / 3 * 1e3:6.1f} ms | {sockets:15,} | {sent:,} B")
+            server.server_socket.close()
+
+
+def bench_metrics():
+    """Cost of handling one answer message with metrics turned off and on"""
+    print("metrics | per answer")
+    for enabled in (False, True):
+        room = make_room(1000, metrics=enabled)
+        with contextlib.redirect_stdout(io.StringIO()):
+            room.start_game()
+            room.send_question("QUESTION:2+2?|3|4|5|6|2")
+            players = list(room.players.non_admin_players())[:-1]
+            start = time.perf_counter()
+            for player in players:
+                room.server.process_message(player.client_socket, "2")
+            elapsed = time.perf_counter() - start
+        print(f"{'on' if enabled else 'off':>7} | {elapsed / len(players) * 1e6:8.2f} us")
+        room.server.server_socket.close()
+
+
+def bench_journal():
+    """Journal cost per answer (group commit vs. an fsync per answer) and recovery time"""
+    print("journal              | per answer | fsyncs")
+    rounds = 5
+    for label, journal, commit_every in (("off", False, None), ("group commit", True, 1000),
+                                         ("fsync every answer", True, 1)):
+        with tempfile.TemporaryDirectory() as directory:
+            room = make_room(1000, journal_dir=directory if journal else None)
+            server = room.server
+            players = list(room.players.non_admin_players())
+            fsyncs = 0
+            with contextlib.redirect_stdout(io.StringIO()):
+                room.start_game()
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    room.send_question("QUESTION:2+2?|3|4|5|6|2")
+                    for i, player in enumerate(players):
+                        server.process_message(player.client_socket, "2")
+                        # What the commit timer does: one write and one fsync for everything since the last one
+                        if journal and i % commit_every == commit_every - 1:
+                            server.journal.commit()
+                            fsyncs += 1
+                    drain_output(server)
+                elapsed = time.perf_counter() - start
+            print(f"{label:20} | {elapsed / (rounds * len(players)) * 1e6:7.2f} us | {fsyncs}")
+            server.server_socket.close()
+
+    # Recovery: replay a journal of many rounds, then start from a snapshot of the same state
+    print("recovery of 1000 players, 50 rounds | records | time")
+    with tempfile.TemporaryDirectory() as directory:
+        journal = Journal(directory, lambda delay, callback: None, fsync=False)
+        journal.record("start", "1")
+        for i in range(1000):
+            journal.record("join", "1", f"1-{i:016x}", f"player{i}", False)
+        for _ in range(50):
+            journal.record("question", "1", "2", 0)
+            for i in range(1000):
+                journal.record_answer("1", f"1-{i:016x}", "1234"[i % 4])
+            journal.record("round", "1")
+        journal.commit()
+        record_count = 1 + 1000 + 50 * 1002
+        with contextlib.redirect_stderr(io.StringIO()):
+            start = time.perf_counter()
+            rooms = Journal(directory, None).recover()
+            replay_time = time.perf_counter() - start
+            journal.snapshot(rooms)
+            start = time.perf_counter()
+            Journal(directory, None).recover()
+            snapshot_time = time.perf_counter() - start
+        print(f"{'replay journal':35} | {record_count:7} | {replay_time * 1000:6.1f} ms")
+        print(f"{'load snapshot':35} | {0:7} | {snapshot_time * 1000:6.1f} ms")
+
+
+def bench_recorder():
+    """Traffic recording cost per answer (--record), and the size of the recording"""
+    print("recording | per answer | bytes per answer")
+    rounds = 5
+    for label, record in (("off", False), ("on", True)):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "session.rec")
+            room = make_room(1000, record_file=path if record else None)
+            server = room.server
+            players = list(room.players.non_admin_players())
+            for player in players:
+                server.recorder.connected(player.client_socket)
+            server.recorder.flush()
+            size_before = os.path.getsize(path) if record else 0
+            with contextlib.redirect_stdout(io.StringIO()):
+                room.start_game()
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    room.send_question("QUESTION:2+2?|3|4|5|6|2")
+                    for player in players:
+                        server.handle_messages(player.client_socket, ["2"])
+                    # What the flush timer does
+                    server.recorder.flush()
+                    drain_output(server)
+                elapsed = time.perf_counter() - start
+            size = os.path.getsize(path) - size_before if record else 0
+            answers = rounds * len(players)
+            print(f"{label:9} | {elapsed / answers * 1e6:7.2f} us | {size / answers:.1f}")
+            server.server_socket.close()
+
+
+def bench_answer_log():
+    """Answer export (--answer-log): game loop cost per answer, writer thread time, file size and
+    how fast Analytics.py reads it back"""
+    print("format  | loop per answer | writer catch-up | bytes per answer | read per answer")
+    rounds = 5
+    for file_format in (None, "jsonl", "csv", "columns"):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "answers")
+            room = make_room(1000, answer_log=path if file_format else None,
+                             answer_log_format=file_format or "jsonl")
+            server = room.server
+            players = list(room.players.non_admin_players())
+            with contextlib.redirect_stdout(io.StringIO()):
+                room.start_game()
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    room.send_question("QUESTION:2+2?|3|4|5|6|2")
+                    for player in players:
+                        server.handle_messages(player.client_socket, ["2"])
+                    drain_output(server)
+                # What the flush timer does
+                server.answer_log.flush()
+                elapsed = time.perf_counter() - start
+                # The rest happens on the writer thread while the loop goes on
+                start = time.perf_counter()
+                server.answer_log.close()
+                catch_up = time.perf_counter() - start
+            answers = rounds * len(players)
+            label = file_format or "off"
+            if file_format is None:
+                print(f"{label:7} | {elapsed / answers * 1e6:12.2f} us |")
+            else:
+                start = time.perf_counter()
+                read = sum(1 for _ in read_answers(path))
+                reading = time.perf_counter() - start
+                assert read == answers
+                print(f"{label:7} | {elapsed / answers * 1e6:12.2f} us | {catch_up * 1000:12.1f} ms | "
+                      f"{os.path.getsize(path) / answers:16.1f} | {reading / answers * 1e6:11.2f} us")
+            server.server_socket.close()
+
+
+def bench_logging():
+    """Cost of handling one answer message at different log levels (log written to /dev/null)"""
+    print("log level        | per answer")
+    for level, sample_every in (("WARNING", 1), ("INFO", 1), ("DEBUG", 100), ("DEBUG", 1)):
+        setup_logging(level, sample_every, os.devnull)
+        room = make_room(1000)
+        room.start_game()
+        room.send_question("QUESTION:2+2?|3|4|5|6|2")
+        players = list(room.players.non_admin_players())[:-1]
+        start = time.perf_counter()
+        for player in players:
+            room.server.process_message(player.client_socket, "2")
+        # Include the time the writer thread needs to catch up
+        stop_logging()
+        elapsed = time.perf_counter() - start
+        label = level if sample_every == 1 else f"{level} 1/{sample_every}"
+        print(f"{label:16} | {elapsed / len(players) * 1e6:8.2f} us")
+        room.server.server_socket.close()
+
+
+def write_quiz_files(directory, count):
+    """Write the same quiz of count questions as .json, .jsonl and .csv files"""
+    questions = [{"question": f"Question number {i}?", "options": ["one", "two", "three", "four"],
+                  "answer": i % 4 + 1} for i in range(count)]
+    paths = {}
+    for extension in (".json", ".jsonl", ".csv"):
+        paths[extension] = os.path.join(directory, f"quiz{count}{extension}")
+        with open(paths[extension], "w") as f:
+            if extension == ".json":
+                json.dump(questions, f)
+            elif extension == ".jsonl":
+                f.writelines(json.dumps(question) + "\n" for question in questions)
+            else:
+                f.write("question,option1,option2,option3,option4,answer\n")
+                f.writelines(f"{q['question']},one,two,three,four,{q['answer']}\n" for q in questions)
+    return paths
+
+
+def bench_quiz():
+    """Sending a typed QUESTION: line vs. the next pre-encoded quiz question, and loading quiz files"""
+    with tempfile.TemporaryDirectory() as directory:
+        room = make_room(1000)
+        room.quiz = QuizBank(write_quiz_files(directory, 1000)[".json"])
+        room.start_game()
+        repeats = 1000
+        start = time.perf_counter()
+        for i in range(repeats):
+            room.send_question(f"QUESTION:Question number {i}?|one|two|three|four|{i % 4 + 1}")
+            room.server.collect(room)
+            room.server.deliver()
+        typed = time.perf_counter() - start
+        drain_output(room.server)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            room.next_question()
+            room.server.collect(room)
+            room.server.deliver()
+        preloaded = time.perf_counter() - start
+        drain_output(room.server)
+        print(f"send to 1000 players: QUESTION: line {typed / repeats * 1e6:.1f} us, "
+              f"NEXT {preloaded / repeats * 1e6:.1f} us")
+        room.server.server_socket.close()
+
+        print("questions | format | load time | first question")
+        for count in (1000, 200000):
+            for extension, path in write_quiz_files(directory, count).items():
+                start = time.perf_counter()
+                bank = QuizBank(path)
+                loaded = time.perf_counter() - start
+                start = time.perf_counter()
+                bank.get(0)
+                first = time.perf_counter() - start
+                lazy = " (lazy)" if bank.mapped is not None else ""
+                print(f"{count:9} | {extension + lazy:13} | {loaded * 1000:7.1f} ms | {first * 1e6:.1f} us")
+                if bank.mapped is not None:
+                    bank.mapped.close()
+
+
+def bench_timers():
+    """How late timers fire when the loop sleeps until the next deadline (no polling)"""
+    print("  timers | wakeups | late p50 | late p99 | late max")
+    for timer_count in (100, 5000):
+        # Without the heartbeat timer, which would keep the scheduler busy forever
+        server = my_server(0, heartbeat_interval=0)
+        lateness = []
+
+        def fired(deadline):
+            lateness.append(time.monotonic() - deadline)
+
+        now = time.monotonic()
+        for _ in range(timer_count):
+            deadline = now + random.uniform(0.05, 2.0)
+            server.scheduler.call_at(deadline, fired, deadline)
+        # A quarter of them are cancelled again, like answer windows of rounds that ended early
+        for _, _, timer in random.sample(server.scheduler.heap, timer_count // 4):
+            server.scheduler.cancel(timer)
+
+        # The same steps as run_selector_loop, without clients
+        wakeups = 0
+        while len(server.scheduler):
+            server.selector.select(server.loop_timeout())
+            server.scheduler.run_due()
+            wakeups += 1
+        lateness.sort()
+        print(f"{timer_count:8} | {wakeups:7} | {lateness[len(lateness) // 2] * 1000:5.2f} ms | "
+              f"{lateness[int(len(lateness) * 0.99)] * 1000:5.2f} ms | {lateness[-1] * 1000:5.2f} ms")
+        server.server_socket.close()
+
+
+def accept_one(server):
+    """The accept path before batching: one connection per wakeup of the loop"""
+    client_socket, addr = server.server_socket.accept()
+    server.add_client(client_socket)
+    server.send_to(client_socket, "NAME_REQUEST")
+
+
+def bench_many_clients():
+    """More clients than select() can watch (FD_SETSIZE is 1024): a real selectors server and
+    1100 LoadTester bots on this machine - every one of them must join, get the question and its result"""
+    players = 1100
+    # The server and the bots each hold one file descriptor per connection
+    if resource is not None:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = players + 200
+        if soft != resource.RLIM_INFINITY and soft < wanted:
+            if hard != resource.RLIM_INFINITY and hard < wanted:
+                print(f"skipped: the open file limit is {hard}, {wanted} needed")
+                return
+            # Also inherited by the server process
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Server.py"),
+                               "--port", str(port), "--engine", "selectors", "--log-level", "WARNING"])
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        test = LoadTest("127.0.0.1", port, players, rounds=1, answer_delay=0.05, accuracy=0.7,
+                        connect_concurrency=200)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = asyncio.run(test.run())
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+    print("clients | joined | got the question | got the result | time")
+    print(f"{players:7} | {results['joined']:6} | {len(test.question_latencies):16} | "
+          f"{len(test.result_latencies):14} | {elapsed:.2f}s")
+    if not (results["joined"] == len(test.question_latencies) == len(test.result_latencies) == players):
+        raise RuntimeError(f"only {results['joined']} of {players} clients joined and played "
+                           f"({results['errors']} connection errors)")
+
+
+def bench_joins():
+    """A class joining at once: accepting the connections and announcing the joins"""
+    # Clients that are already connected (queued in the listen backlog) when the server wakes up
+    print("connections | accept         | wakeups | time")
+    for label, accept in (("one per wakeup", accept_one), ("batched", my_server.handle_new_connection)):
+        server = my_server(0)
+        address = ("127.0.0.1", server.server_socket.getsockname()[1])
+        connection_count = 1000
+        clients = [socket.create_connection(address) for _ in range(connection_count)]
+        wakeups = 0
+        start = time.perf_counter()
+        while len(server.clients) < connection_count:
+            server.selector.select()
+            accept(server)
+            wakeups += 1
+        elapsed = time.perf_counter() - start
+        print(f"{connection_count:11} | {label:14} | {wakeups:7} | {elapsed * 1000:6.1f} ms")
+        for client_socket in clients + server.clients:
+            client_socket.close()
+        server.server_socket.close()
+
+    # Names arrive in bursts of 50 per lobby interval; every join used to be broadcast at once
+    print("players | lobby updates  | per join | bytes sent")
+    for player_count in (500, 2000):
+        for label, lobby_interval in (("every join", 0), ("batched", 0.5)):
+            room = make_room(0, lobby_interval=lobby_interval)
+            sockets = [add_fake_client(room) for _ in range(player_count)]
+            sent = 0
+            start = time.perf_counter()
+            for i, client_socket in enumerate(sockets):
+                room.register_player(client_socket, f"player{i}")
+                if i % 50 == 49:
+                    # What the lobby timer does when it fires
+                    room.send_lobby_update()
+                sent += drain_output(room.server)
+            room.send_lobby_update()
+            elapsed = time.perf_counter() - start
+            sent += drain_output(room.server)
+            print(f"{player_count:7} | {label:14} | {elapsed / player_count * 1e6:5.1f} us | {sent:,} B")
+            room.server.server_socket.close()
+
+
+class ObjectLayoutPlayer:
+    """The player layout before PlayerColumns: a plain object with its points as an attribute"""
+
+    def __init__(self, name, client_socket):
+        self.name = name
+        self.points = 0
+        self.admin = False
+        self.client_socket = client_socket
+        self.addr = None
+
+    def GetPoints(self):
+        return self.points
+
+    def AddPoint(self):
+        self.points += 1
+
+
+def bench_players():
+    """Memory per player and scoring time: objects + answer dict vs. PlayerColumns"""
+    player_count = 50000
+    sockets = [FakeSocket() for _ in range(player_count)]
+    names = [f"player{i}" for i in range(player_count)]
+    answers = ["1234"[i % 4] for i in range(player_count)]
+    print(f"{player_count} players | bytes per player | scoring one round")
+
+    # Before: every player an object with a __dict__, answers in a dict keyed by socket,
+    # and every correct player re-positioned on the leaderboard one by one
+    tracemalloc.start()
+    players = [ObjectLayoutPlayer(names[i], sockets[i]) for i in range(player_count)]
+    waiting_for_answers = {player.client_socket: answers[i] for i, player in enumerate(players)}
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    leaderboard = Leaderboard()
+    for player in players:
+        leaderboard.add(player)
+    start = time.perf_counter()
+    for player in players:
+        if player.client_socket in waiting_for_answers:
+            if waiting_for_answers[player.client_socket] == "2":
+                leaderboard.add_point(player)
+    elapsed = time.perf_counter() - start
+    print(f"objects + dict        | {memory / player_count:16.0f} | {elapsed * 1000:8.1f} ms")
+
+    # After: slotted players, points and answers in columns, one batched comparison per round
+    tracemalloc.start()
+    players = [Player(names[i], 0, False, sockets[i], None) for i in range(player_count)]
+    columns = PlayerColumns()
+    for i, player in enumerate(players):
+        columns.add(player)
+        columns.record_answer(player, answers[i])
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    leaderboard = Leaderboard()
+    for player in players:
+        leaderboard.add(player)
+    start = time.perf_counter()
+    correct, wrong, missing, distribution = columns.score_round("2")
+    leaderboard.update_many(correct)
+    elapsed = time.perf_counter() - start
+    label = "columns (numpy)" if numpy_available() else "columns"
+    print(f"{label:21} | {memory / player_count:16.0f} | {elapsed * 1000:8.1f} ms")
+
+
+def numpy_available():
+    import PlayerColumns
+    return PlayerColumns.numpy is not None
+
+
+BENCHMARKS = {
+    "answers": bench_answers,
+    "round": bench_round_results,
+    "round_bytes": bench_round_bytes,
+    "core": bench_core,
+    "broadcast": bench_broadcast,
+    "metrics": bench_metrics,
+    "logging": bench_logging,
+    "quiz": bench_quiz,
+    "timers": bench_timers,
+    "players": bench_players,
+    "protocol": bench_protocol,
+    "joins": bench_joins,
+    "many_clients": bench_many_clients,
+    "journal": bench_journal,
+    "relay": bench_relay,
+    "recorder": bench_recorder,
+    "answer_log": bench_answer_log,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cyber Kahoot server micro-benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run: {', '.join(BENCHMARKS)}")
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark '{name}'")
+
+    for name in args.names or BENCHMARKS:
+        print(f"=== {name} ===")
+        BENCHMARKS[name]()
+        print()
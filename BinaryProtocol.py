@@ -0,0 +1,135 @@
+import struct
+
+# Compact binary protocol, an alternative to the text protocol for clients that ask for it.
+#
+# Negotiation: after NAME_REQUEST (and ROOM:<pin>, if any) the client sends the text line
+# PROTO:BINARY and waits for the server's PROTO:BINARY answer before sending anything else.
+# From then on both sides send binary frames only (the name and admin commands travel as
+# TEXT frames). Text clients never send PROTO:BINARY and keep using the text protocol,
+# both kinds can play in the same game.
+#
+# Every frame starts with a one-byte opcode (all below 0x20), big-endian integers:
+#   0x01-0x04  answer (client -> server)   the opcode itself is the chosen option, 1 byte in total
+#   0x10 TEXT      !BI  length, then UTF-8 text - any text protocol message
+#   0x11 QUESTION  !BHHHHH  byte lengths of the question and the 4 options, then the UTF-8 strings
+#   0x12 RESULT    !BBI  outcome (see RESULT_*), the player's points after the round
+#   0x13 RANK      !BBIIIII  flags (RANK_FINAL), rank, players, points,
+#                            rank and points after the previous round (0 = no previous round)
+
+OP_TEXT = 0x10
+OP_QUESTION = 0x11
+OP_RESULT = 0x12
+OP_RANK = 0x13
+
+RESULT_WRONG = 0
+RESULT_CORRECT = 1
+RESULT_NO_ANSWER = 2
+
+RANK_FINAL = 1
+
+TEXT_HEADER = struct.Struct("!BI")
+QUESTION_HEADER = struct.Struct("!BHHHHH")
+# The QUESTION frame stores the byte length of the question and of each option in 2 bytes
+MAX_QUESTION_FIELD_SIZE = 0xFFFF
+RESULT_FRAME = struct.Struct("!BBI")
+RANK_FRAME = struct.Struct("!BBIIIII")
+
+# Answers as the strings the game logic compares
+ANSWERS = (None, "1", "2", "3", "4")
+
+
+def encode_text(message):
+    data = message.encode()
+    return TEXT_HEADER.pack(OP_TEXT, len(data)) + data
+
+
+def encode_question(text, options):
+    """QUESTION frame - the correct answer is never part of it"""
+    fields = [text.encode()] + [option.encode() for option in options]
+    return QUESTION_HEADER.pack(OP_QUESTION, *[len(field) for field in fields]) + b"".join(fields)
+
+
+def encode_result(outcome, points):
+    return RESULT_FRAME.pack(OP_RESULT, outcome, points)
+
+
+def encode_rank(rank, total, points, previous_rank=0, previous_points=0, final=False):
+    return RANK_FRAME.pack(OP_RANK, RANK_FINAL if final else 0, rank, total, points,
+                           previous_rank, previous_points)
+
+
+def encode_answer(option):
+    return bytes((int(option),))
+
+
+class BinaryDecoder:
+    """Incremental decoder for binary frames, the binary counterpart of FrameDecoder.
+
+    feed() returns the decoded messages:
+      - int 1-4 for an answer
+      - str for a TEXT frame
+      - (OP_QUESTION, text, [4 options])
+      - (OP_RESULT, outcome, points)
+      - (OP_RANK, flags, rank, total, points, previous_rank, previous_points)
+    """
+
+    def __init__(self, max_frame_size=1024 * 1024):
+        self.buffer = bytearray()
+        self.max_frame_size = max_frame_size
+
+    def feed(self, data):
+        self.buffer += data
+        buffer = self.buffer
+        messages = []
+        position = 0
+        buffer_size = len(buffer)
+
+        while position < buffer_size:
+            opcode = buffer[position]
+            if opcode <= 4:
+                if opcode == 0:
+                    raise ValueError("Invalid answer 0")
+                messages.append(opcode)
+                position += 1
+            elif opcode == OP_TEXT:
+                if buffer_size - position < TEXT_HEADER.size:
+                    break
+                length = TEXT_HEADER.unpack_from(buffer, position)[1]
+                if length > self.max_frame_size:
+                    raise ValueError(f"Frame of {length} bytes is too large")
+                start = position + TEXT_HEADER.size
+                if buffer_size < start + length:
+                    break
+                messages.append(buffer[start:start + length].decode("utf-8", "replace"))
+                position = start + length
+            elif opcode == OP_QUESTION:
+                if buffer_size - position < QUESTION_HEADER.size:
+                    break
+                lengths = QUESTION_HEADER.unpack_from(buffer, position)[1:]
+                start = position + QUESTION_HEADER.size
+                if buffer_size < start + sum(lengths):
+                    break
+                fields = []
+                for length in lengths:
+                    fields.append(buffer[start:start + length].decode("utf-8", "replace"))
+                    start += length
+                messages.append((OP_QUESTION, fields[0], fields[1:]))
+                position = start
+            elif opcode == OP_RESULT:
+                if buffer_size - position < RESULT_FRAME.size:
+                    break
+                messages.append(RESULT_FRAME.unpack_from(buffer, position))
+                position += RESULT_FRAME.size
+            elif opcode == OP_RANK:
+                if buffer_size - position < RANK_FRAME.size:
+                    break
+                messages.append(RANK_FRAME.unpack_from(buffer, position))
+                position += RANK_FRAME.size
+            else:
+                raise ValueError(f"Unknown binary opcode 0x{opcode:02x}")
+
+        if position:
+            del buffer[:position]
+        if len(buffer) > self.max_frame_size:
+            raise ValueError(f"Incomplete frame is larger than {self.max_frame_size} bytes")
+        return messages
@@ -0,0 +1,87 @@
+import time
+from collections import deque
+from itertools import islice
+from FrameDecoder import FrameDecoder
+
+# Most chunks handed to one sendmsg() call (Linux allows up to 1024)
+MAX_CHUNKS_PER_SEND = 512
+
+class Connection:
+    """State of one client socket: the incremental input decoder and a bounded,
+    non-blocking output buffer.
+
+    Game logic never calls send() on a client socket directly any more - messages
+    are queued here and written out when the socket is ready, so one slow player
+    can't freeze the game for everyone else.
+
+    The buffer is a queue of immutable chunks, not one big bytearray: a broadcast
+    encodes its message once and every Connection just keeps a reference to the same
+    bytes. All queued chunks are then written with a single sendmsg() call.
+    """
+
+    def __init__(self, client_socket, high_watermark, low_watermark, max_buffer):
+        self.client_socket = client_socket
+        self.decoder = FrameDecoder()
+        self.out_chunks = deque()
+        # Total bytes in out_chunks
+        self.buffered = 0
+        # sendmsg() writes many chunks in one syscall; Windows doesn't have it
+        self.can_sendmsg = hasattr(client_socket, "sendmsg")
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.max_buffer = max_buffer
+        # Time when the buffer went above the high watermark, None while the client keeps up
+        self.slow_since = None
+        # True while the socket is registered for write-readiness
+        self.write_registered = False
+
+    def queue(self, data):
+        """Append encoded bytes to the output buffer (the bytes object is shared, not copied)"""
+        self.out_chunks.append(data)
+        self.buffered += len(data)
+        if self.slow_since is None and self.buffered > self.high_watermark:
+            self.slow_since = time.monotonic()
+
+    def has_pending(self):
+        return self.buffered > 0
+
+    def flush(self):
+        """Write as much of the buffer as the socket accepts right now.
+
+        Short writes are fine - whatever wasn't sent stays at the front of the buffer.
+        Returns the number of bytes written. Raises OSError if the connection is broken.
+        """
+        total = 0
+        while self.out_chunks:
+            batch = list(islice(self.out_chunks, MAX_CHUNKS_PER_SEND))
+            try:
+                if self.can_sendmsg:
+                    sent = self.client_socket.sendmsg(batch)
+                else:
+                    sent = self.client_socket.send(b"".join(batch))
+            except (BlockingIOError, InterruptedError):
+                break
+            self.consume(sent)
+            total += sent
+
+        if self.buffered <= self.low_watermark:
+            self.slow_since = None
+        return total
+
+    def consume(self, sent):
+        """Drop sent bytes from the front of the chunk queue"""
+        self.buffered -= sent
+        while sent:
+            chunk = self.out_chunks[0]
+            if sent < len(chunk):
+                # Short write in the middle of a chunk - keep the rest without copying it
+                self.out_chunks[0] = memoryview(chunk)[sent:]
+                return
+            sent -= len(chunk)
+            self.out_chunks.popleft()
+
+    def is_too_slow(self, now, slow_timeout):
+        """Check if this client can't keep up and should be evicted"""
+        if self.buffered > self.max_buffer:
+            return True
+        return self.slow_since is not None and now - self.slow_since > slow_timeout
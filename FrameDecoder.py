@@ -0,0 +1,67 @@
+class FrameDecoder:
+    """Incremental decoder for the Kahoot protocol, one per connection.
+
+    Data from recv() is appended to a bytearray that is kept between reads, so a
+    message split over two reads (or a UTF-8 character split in the middle) is simply
+    completed by the next read instead of being mangled.
+
+    Two kinds of frames are understood:
+      - text lines:             MESSAGE\\n
+      - length-prefixed frames: #<length>\\n<length bytes of payload>
+    Length-prefixed frames are used for multi-line messages like ROUND_OVER and
+    GAME_OVER. They are only accepted when length_prefixed=True (the client side),
+    so a player name starting with '#' still works on the server.
+    """
+
+    def __init__(self, length_prefixed=False, max_frame_size=1024 * 1024):
+        self.buffer = bytearray()
+        self.length_prefixed = length_prefixed
+        self.max_frame_size = max_frame_size
+
+    def feed(self, data):
+        """Add received bytes and return the list of complete messages (as str)"""
+        self.buffer += data
+        messages = []
+        position = 0
+        buffer_size = len(self.buffer)
+
+        # Decode straight from a memoryview so each frame is copied only once (into its str)
+        with memoryview(self.buffer) as view:
+            while position < buffer_size:
+                line_end = self.buffer.find(b"\n", position)
+                if line_end == -1:
+                    break
+
+                if self.length_prefixed and self.buffer[position] == ord("#"):
+                    length = int(self.buffer[position + 1:line_end])
+                    if length > self.max_frame_size:
+                        raise ValueError(f"Frame of {length} bytes is too large")
+                    frame_end = line_end + 1 + length
+                    if frame_end > buffer_size:
+                        # The payload didn't fully arrive yet
+                        break
+                    messages.append(str(view[line_end + 1:frame_end], "utf-8", "replace"))
+                    position = frame_end
+                else:
+                    messages.append(str(view[position:line_end], "utf-8", "replace"))
+                    position = line_end + 1
+
+        # Drop everything consumed in one go
+        if position:
+            del self.buffer[:position]
+        if len(self.buffer) > self.max_frame_size:
+            raise ValueError(f"Incomplete frame is larger than {self.max_frame_size} bytes")
+        return messages
+
+
+def frame_prefix(length):
+    """Header of a length-prefixed frame with a payload of length bytes"""
+    return b"#%d\n" % length
+
+
+def encode_frame(message):
+    """Encode one message for sending - multi-line messages get a length prefix"""
+    data = message.encode()
+    if "\n" in message:
+        return frame_prefix(len(data)) + data
+    return data + b"\n"
@@ -0,0 +1,221 @@
+import glob
+import json
+import os
+from ServerLog import log
+
+# Crash-safe game state: every event that changes a game is appended to a journal file,
+# and a restarted server replays it to get its rooms, players and scores back.
+#
+#  - records are JSON arrays, one per line: ["join", pin, token, name, admin],
+#    ["answer", pin, token, answer], ["leave", pin, token], ["round", pin] ... (see apply_record)
+#  - group commit: records are collected in memory and written with one write() and
+#    one fsync() per commit interval, not one fsync per event. A crash loses at most
+#    the last interval (0 = commit in the same loop iteration, before replies go out).
+#  - snapshots: every snapshot_every records the whole state is written to
+#    snapshot.json and a new journal file is started, so recovery reads one small
+#    snapshot plus the events after it instead of the whole history.
+#
+# Files in the journal directory:
+#   snapshot.json          {"generation": g, "rooms": {pin: room state}}
+#   journal-<g>.log        events after snapshot g (older files are deleted after a snapshot)
+
+SNAPSHOT_FILE = "snapshot.json"
+ANSWER_PREFIX = '["answer","'
+
+def new_room_state():
+    return {"started": False, "quiz": None, "quiz_position": 0, "round": 0,
+            "correct": None, "answers": {}, "sessions": {}}
+
+
+def apply_record(rooms, record):
+    """Replay one journal record on the rooms state (pin -> room state)"""
+    event, pin = record[0], record[1]
+    room = rooms.get(pin)
+    if room is None:
+        if event == "close":
+            return
+        room = rooms[pin] = new_room_state()
+
+    if event == "answer":
+        # The most frequent record - checked first
+        if room["correct"] is not None:
+            room["answers"][record[2]] = record[3]
+    elif event == "leave":
+        # A player who left during a round lost their answer, like in the live room
+        room["answers"].pop(record[2], None)
+    elif event == "join":
+        token, name, admin = record[2], record[3], record[4]
+        room["sessions"][token] = [name, 0, admin]
+    elif event == "question":
+        room["round"] += 1
+        room["correct"] = record[2]
+        room["quiz_position"] = record[3]
+        room["answers"] = {}
+    elif event == "round":
+        # Scores are not journaled one by one: the answers of the round already say who scored
+        correct = room["correct"]
+        sessions = room["sessions"]
+        for token, answer in room["answers"].items():
+            if answer == correct and token in sessions:
+                sessions[token][1] += 1
+        room["correct"] = None
+        room["answers"] = {}
+    elif event == "start":
+        room["started"] = True
+    elif event == "stop":
+        room["started"] = False
+        room["correct"] = None
+        room["answers"] = {}
+    elif event == "quiz":
+        room["quiz"] = record[2]
+        room["quiz_position"] = 0
+    elif event == "close":
+        del rooms[pin]
+
+
+class Journal:
+    """Append-only journal of game events with batched fsync and periodic snapshots"""
+
+    enabled = True
+
+    def __init__(self, directory, call_later, commit_interval=0.05, snapshot_every=100000, fsync=True):
+        self.directory = directory
+        # Schedules the group commit (server.call_later, so it works with every engine)
+        self.call_later = call_later
+        self.commit_interval = commit_interval
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        # Encoded records waiting for the next commit
+        self.pending = []
+        self.commit_scheduled = False
+        self.records_since_snapshot = 0
+        self.generation = 0
+        self.file = None
+        # Returns the current state of every room, for snapshots (set by the server)
+        self.state_provider = None
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def journal_files(self):
+        """(generation, path) of every journal file, oldest first"""
+        files = []
+        for path in glob.glob(self.path("journal-*.log")):
+            try:
+                files.append((int(os.path.basename(path)[8:-4]), path))
+            except ValueError:
+                pass
+        return sorted(files)
+
+    def recover(self):
+        """Read the last snapshot and replay the journal after it, returns the rooms state"""
+        rooms = {}
+        generation = 0
+        try:
+            with open(self.path(SNAPSHOT_FILE), encoding="utf-8") as f:
+                snapshot = json.load(f)
+            rooms = snapshot["rooms"]
+            generation = snapshot["generation"]
+        except FileNotFoundError:
+            pass
+
+        replayed = 0
+        for file_generation, path in self.journal_files():
+            if file_generation < generation:
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        if line.startswith(ANSWER_PREFIX) and line.endswith('"]\n'):
+                            # Written by record_answer: no escapes, a split is enough (and much faster)
+                            record = ["answer"] + line[len(ANSWER_PREFIX):-3].split('","')
+                        else:
+                            record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A record torn by the crash can only be the last one written
+                        log.warning("Journal %s: ignoring a broken record", os.path.basename(path))
+                        break
+                    apply_record(rooms, record)
+                    replayed += 1
+            generation = max(generation, file_generation)
+        self.generation = generation
+        log.info("Journal recovered %d rooms (%d records replayed)", len(rooms), replayed)
+        return rooms
+
+    def record(self, *fields):
+        """Add an event to the next commit"""
+        self.add_line(json.dumps(fields, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def record_answer(self, pin, token, answer):
+        """The per-answer record, formatted without json.dumps (PINs, tokens and digits need no escaping)"""
+        self.add_line(f'["answer","{pin}","{token}","{answer}"]\n')
+
+    def add_line(self, line):
+        self.pending.append(line)
+        if not self.commit_scheduled:
+            self.commit_scheduled = True
+            self.call_later(self.commit_interval, self.commit)
+
+    def commit(self):
+        """Group commit (also the timer callback): write what is pending, snapshot when it is time"""
+        self.commit_scheduled = False
+        self.write_pending()
+        if self.records_since_snapshot >= self.snapshot_every and self.state_provider:
+            self.snapshot(self.state_provider())
+
+    def write_pending(self):
+        """Write everything pending with one write() and one fsync()"""
+        if not self.pending:
+            return
+        if self.file is None:
+            self.file = open(self.path(f"journal-{self.generation}.log"), "a", encoding="utf-8")
+        self.file.write("".join(self.pending))
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.records_since_snapshot += len(self.pending)
+        self.pending.clear()
+
+    def snapshot(self, rooms):
+        """Write the whole state and start a new journal file; older journal files are deleted"""
+        self.write_pending()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        # Events from now on go to the next generation's file, the snapshot covers everything before
+        self.generation += 1
+        temporary = self.path(SNAPSHOT_FILE + ".tmp")
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"generation": self.generation, "rooms": rooms}, f, ensure_ascii=False,
+                      separators=(",", ":"))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        # Atomic: a crash leaves either the old or the new snapshot, never half of one
+        os.replace(temporary, self.path(SNAPSHOT_FILE))
+        if self.fsync and hasattr(os, "O_DIRECTORY"):
+            directory = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        for generation, path in self.journal_files():
+            if generation < self.generation:
+                os.remove(path)
+        self.records_since_snapshot = 0
+
+
+class NullJournal:
+    """Used when the journal is turned off - every call does nothing"""
+
+    enabled = False
+
+    def record(self, *fields):
+        pass
+
+    def record_answer(self, pin, token, answer):
+        pass
+
+    def commit(self):
+        pass
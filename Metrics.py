@@ -0,0 +1,89 @@
+class Histogram:
+    """Timing histogram with power-of-two microsecond buckets.
+
+    Recording is one bit_length() and one list increment, so it is cheap enough
+    to call for every message.
+    """
+
+    def __init__(self):
+        # bucket i counts values below 2**i microseconds
+        self.buckets = [0] * 40
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.buckets[min(39, int(seconds * 1e6).bit_length())] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """Upper bound (in seconds) of the bucket holding the given fraction of the values"""
+        needed = fraction * self.count
+        seen = 0
+        for i in range(len(self.buckets)):
+            seen += self.buckets[i]
+            if seen >= needed and seen > 0:
+                return min(2 ** i / 1e6, self.max)
+        return self.max
+
+
+class Metrics:
+    """Counters and timing histograms of one server process"""
+
+    enabled = True
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+    def add(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def render(self, gauges):
+        """Plain-text report: one line per gauge, counter and histogram"""
+        lines = []
+        for name, value in gauges.items():
+            lines.append(f"{name} {value}")
+        for name in sorted(self.counters):
+            value = self.counters[name]
+            if isinstance(value, float):
+                value = f"{value:.6f}"
+            lines.append(f"{name} {value}")
+        for name in sorted(self.histograms):
+            histogram = self.histograms[name]
+            if histogram.count == 0:
+                continue
+            lines.append(f"{name} count={histogram.count} "
+                         f"avg={histogram.total / histogram.count * 1000:.3f}ms "
+                         f"p50<={histogram.percentile(0.5) * 1000:.3f}ms "
+                         f"p99<={histogram.percentile(0.99) * 1000:.3f}ms "
+                         f"max={histogram.max * 1000:.3f}ms")
+        return "\n".join(lines) + "\n"
+
+
+class NullMetrics:
+    """Used when metrics are turned off - every call does nothing.
+
+    The server also checks `enabled` before taking timestamps, so a disabled
+    server doesn't even read the clock.
+    """
+
+    enabled = False
+
+    def observe(self, name, seconds):
+        pass
+
+    def add(self, name, amount=1):
+        pass
+
+    def render(self, gauges):
+        return "Metrics are turned off (start the server with --metrics)\n"
@@ -1,22 +1,38 @@
 class Player:
+    # __slots__: no per-player __dict__, which matters with tens of thousands of players
+    __slots__ = ("name", "own_points", "admin", "client_socket", "addr", "columns", "slot", "binary", "token")
+
     def __init__(self, name, points, admin, client_socket, addr):
         self.name = name
-        self.points = points
+        # Points of a player who isn't in a game; once added to a room's PlayerColumns
+        # the points live in its points column (columns/slot are set by PlayerColumns)
+        self.own_points = points
         self.admin = admin
         self.client_socket = client_socket
         self.addr = addr
+        self.columns = None
+        self.slot = None
+        # True if the client talks the binary protocol (see BinaryProtocol)
+        self.binary = False
+        # Session token the player can come back with after a disconnect (RESUME:<token>)
+        self.token = None
 
     def GetPoints(self):
-        return self.points
+        if self.columns is None:
+            return self.own_points
+        return self.columns.points[self.slot]
 
     def SetPoints(self, num):
-        self.points = num
+        if self.columns is None:
+            self.own_points = num
+        else:
+            self.columns.points[self.slot] = num
 
     def AddPoint(self):
-        self.points += 1
+        self.SetPoints(self.GetPoints() + 1)
     
     def RemPoint(self):
-        self.points -= 1
+        self.SetPoints(self.GetPoints() - 1)
     
     def GetName(self):
         return self.name
@@ -0,0 +1,123 @@
+from array import array
+
+# NumPy is optional: with it a round is scored with whole-array operations,
+# without it the same columns are scanned with bytearray.find/count (also in C).
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Codes in the answers column
+NO_ANSWER = 0
+OTHER_ANSWER = 255
+OPTIONS = (1, 2, 3, 4)
+
+def answer_code(answer):
+    """Answer string ("1".."4") -> its code in the answers column"""
+    if answer in ("1", "2", "3", "4"):
+        return int(answer)
+    return OTHER_ANSWER
+
+
+class PlayerColumns:
+    """Round state of a room's players stored by column instead of per object.
+
+    Every non-admin player gets an integer slot. Points live in an array of 64-bit
+    integers and the current answers in a bytearray (one byte per player), so a
+    round is scored by comparing the whole answers column with the correct answer
+    at once, and counting the answers per option comes for free.
+    Slots of players who left are reused by the next player who joins.
+    """
+
+    def __init__(self):
+        self.players = []
+        self.points = array("q")
+        self.answers = bytearray()
+        self.free_slots = []
+        # Players with an answer in the current round
+        self.answered = 0
+
+    def __len__(self):
+        return len(self.players) - len(self.free_slots)
+
+    def add(self, player):
+        points = player.GetPoints()
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.players[slot] = player
+            self.points[slot] = points
+            self.answers[slot] = NO_ANSWER
+        else:
+            slot = len(self.players)
+            self.players.append(player)
+            self.points.append(points)
+            self.answers.append(NO_ANSWER)
+        player.columns = self
+        player.slot = slot
+
+    def remove(self, player):
+        if player.columns is not self:
+            return
+        slot = player.slot
+        # The player keeps their points when they leave the columns
+        player.own_points = self.points[slot]
+        player.columns = None
+        player.slot = None
+        if self.answers[slot] != NO_ANSWER:
+            self.answered -= 1
+        self.players[slot] = None
+        self.points[slot] = 0
+        self.answers[slot] = NO_ANSWER
+        self.free_slots.append(slot)
+
+    def record_answer(self, player, answer):
+        """Store a player's answer (a second answer replaces the first), returns how many answered"""
+        slot = player.slot
+        if self.answers[slot] == NO_ANSWER:
+            self.answered += 1
+        self.answers[slot] = answer_code(answer)
+        return self.answered
+
+    def clear_answers(self):
+        self.answers = bytearray(len(self.players))
+        self.answered = 0
+
+    def slots_with(self, code):
+        """Slots whose answer has this code, in slot order"""
+        if numpy is not None:
+            column = numpy.frombuffer(self.answers, dtype=numpy.uint8)
+            return numpy.flatnonzero(column == code).tolist()
+        slots = []
+        find = self.answers.find
+        slot = find(code)
+        while slot != -1:
+            slots.append(slot)
+            slot = find(code, slot + 1)
+        return slots
+
+    def score_round(self, correct_answer):
+        """Give a point to everyone who answered correctly.
+
+        Returns (correct players, wrong players, players without an answer,
+        {option: number of players who chose it}).
+        """
+        correct_code = answer_code(correct_answer)
+        distribution = {option: self.answers.count(option) for option in OPTIONS}
+
+        correct_slots = self.slots_with(correct_code) if correct_code != OTHER_ANSWER else []
+        if numpy is not None and correct_slots:
+            # One vectorised add on the points column (a view, nothing is copied)
+            numpy.frombuffer(self.points, dtype=numpy.int64)[correct_slots] += 1
+        else:
+            points = self.points
+            for slot in correct_slots:
+                points[slot] += 1
+
+        players = self.players
+        correct = [players[slot] for slot in correct_slots]
+        wrong = []
+        for code in OPTIONS + (OTHER_ANSWER,):
+            if code != correct_code:
+                wrong.extend(players[slot] for slot in self.slots_with(code))
+        missing = [players[slot] for slot in self.slots_with(NO_ANSWER) if players[slot] is not None]
+        return correct, wrong, missing, distribution
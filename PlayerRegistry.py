@@ -0,0 +1,80 @@
+from itertools import chain
+from RelayProtocol import RelayedClient
+
+
+class PlayerRegistry:
+    """Indexed collection of the players in one game.
+
+    Looking a player up by socket or file descriptor is a dict lookup instead of a
+    scan over the whole list, and the number of non-admin players and the admin
+    are kept up to date on every add/remove, so nobody has to count them again.
+    Players who play through a relay node are kept apart: messages for all of them
+    go to their relay once instead of to each of them (see direct_players).
+    """
+
+    def __init__(self):
+        # Dicts keep insertion order, so iterating gives players in join order.
+        # by_socket has the players on their own connection, relayed the ones behind a relay.
+        self.by_socket = {}
+        self.relayed = {}
+        self.by_fileno = {}
+        # socket -> fileno it had when added (a closed socket reports -1)
+        self.filenos = {}
+        self.admin = None
+        self.non_admin_count = 0
+
+    def add(self, player):
+        if player.client_socket.__class__ is RelayedClient:
+            self.relayed[player.client_socket] = player
+        else:
+            self.by_socket[player.client_socket] = player
+        # asyncio StreamWriters (and relayed clients) have no fileno(), they are only indexed by object
+        fileno = getattr(player.client_socket, "fileno", None)
+        if fileno is not None:
+            self.filenos[player.client_socket] = fileno()
+            self.by_fileno[fileno()] = player
+
+        if player.IsAdmin():
+            self.admin = player
+        else:
+            self.non_admin_count += 1
+
+    def remove(self, player):
+        if (self.by_socket.pop(player.client_socket, None) is None
+                and self.relayed.pop(player.client_socket, None) is None):
+            return
+        fileno = self.filenos.pop(player.client_socket, None)
+        if fileno is not None and self.by_fileno.get(fileno) is player:
+            del self.by_fileno[fileno]
+
+        if player is self.admin:
+            self.admin = None
+        elif not player.IsAdmin():
+            self.non_admin_count -= 1
+
+    def find_by_socket(self, client_socket):
+        player = self.by_socket.get(client_socket)
+        if player is None and self.relayed:
+            return self.relayed.get(client_socket)
+        return player
+
+    def find_by_fileno(self, fileno):
+        return self.by_fileno.get(fileno)
+
+    def non_admin_players(self):
+        """Iterate over all players except the admin, in join order (relayed players last)"""
+        for player in self:
+            if not player.IsAdmin():
+                yield player
+
+    def direct_players(self):
+        """Players on their own connection - relayed players are reached through their relay"""
+        return self.by_socket.values()
+
+    def __len__(self):
+        return len(self.by_socket) + len(self.relayed)
+
+    def __iter__(self):
+        if not self.relayed:
+            return iter(self.by_socket.values())
+        return chain(self.by_socket.values(), self.relayed.values())
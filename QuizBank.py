@@ -0,0 +1,204 @@
+import csv
+import json
+import mmap
+import os
+from array import array
+from BinaryProtocol import MAX_QUESTION_FIELD_SIZE, encode_question
+from FrameDecoder import encode_frame
+from ServerLog import log
+
+# Quiz files are parsed and checked once when they are loaded, and every question's
+# QUESTION frames (text and binary, without the correct answer) are encoded right away - sending the next
+# question is then just handing the same bytes to every player.
+#
+# Supported files:
+#   .json   [{"question": "2+2?", "options": ["3", "4", "5", "6"], "answer": 2, "time": 20}, ...]
+#           (or {"title": ..., "questions": [...]}; "time" - seconds to answer - is optional)
+#   .jsonl  one such question object per line
+#   .csv    question,option1,option2,option3,option4,answer[,time]  (a header line is allowed)
+#
+# Big .jsonl and .csv files (above LAZY_LOAD_SIZE) are not read whole: they are
+# memory-mapped, only the start of every line is remembered, and a question is
+# parsed the first time it is asked. Use one of these formats for huge banks.
+
+LAZY_LOAD_SIZE = 1024 * 1024
+
+class QuizError(ValueError):
+    """A quiz file or one of its questions is invalid"""
+
+
+class Question:
+    """One checked question with its ready-to-send QUESTION frame"""
+    __slots__ = ("text", "options", "correct_answer", "time_limit", "frame", "binary_frame")
+
+    def __init__(self, text, options, correct_answer, time_limit=None):
+        text = str(text).strip()
+        options = [str(option).strip() for option in options]
+        correct_answer = str(correct_answer).strip()
+        if not text:
+            raise QuizError("question text is empty")
+        if len(options) != 4:
+            raise QuizError(f"needs 4 options, got {len(options)}")
+        if correct_answer not in ("1", "2", "3", "4"):
+            raise QuizError(f"answer must be 1-4, got '{correct_answer}'")
+        # '|' separates the fields on the wire
+        for field in [text] + options:
+            if "|" in field:
+                raise QuizError(f"'|' is not allowed in '{field}'")
+            if len(field.encode()) > MAX_QUESTION_FIELD_SIZE:
+                raise QuizError(f"'{field[:20]}...' is longer than {MAX_QUESTION_FIELD_SIZE} bytes")
+        # Seconds players get for this question (None = the server's --answer-time)
+        if time_limit is not None and str(time_limit).strip() != "":
+            try:
+                time_limit = float(time_limit)
+            except ValueError:
+                raise QuizError(f"time must be a number of seconds, got '{time_limit}'")
+            if not 0 < time_limit < 86400:
+                raise QuizError(f"time must be between 0 and 86400 seconds, got {time_limit}")
+        else:
+            time_limit = None
+        self.text = text
+        self.options = options
+        self.correct_answer = correct_answer
+        self.time_limit = time_limit
+        self.frame = encode_frame("QUESTION:" + "|".join([text] + options))
+        self.binary_frame = encode_question(text, options)
+
+    @classmethod
+    def from_message(cls, message):
+        """Parse an admin's QUESTION:text|option1|option2|option3|option4|answer[|time] line"""
+        parts = message.split(":", 1)[1].split("|")
+        if len(parts) not in (6, 7):
+            raise QuizError(f"needs 6 fields (7 with a time limit), got {len(parts)}")
+        return cls(parts[0], parts[1:5], parts[5], parts[6] if len(parts) == 7 else None)
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise QuizError("question must be an object")
+        try:
+            return cls(data["question"], data["options"], data["answer"], data.get("time"))
+        except (KeyError, TypeError) as e:
+            raise QuizError(f"missing or invalid field {e}")
+
+    @classmethod
+    def from_row(cls, row):
+        if len(row) not in (6, 7):
+            raise QuizError(f"needs 6 columns (7 with a time limit), got {len(row)}")
+        return cls(row[0], row[1:5], row[5], row[6] if len(row) == 7 else None)
+
+
+def is_csv_header(row):
+    return len(row) in (6, 7) and row[5].strip().lower() in ("answer", "correct", "correct_answer")
+
+
+class QuizBank:
+    """The questions of one quiz file, shared by every room that plays it"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        # Eagerly loaded banks keep every Question here
+        self.questions = None
+        # Lazily loaded banks: the mapped file, the offset of every question line
+        # and the questions parsed so far (index -> Question)
+        self.mapped = None
+        self.line_offsets = None
+        self.parsed = {}
+
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in (".json", ".jsonl", ".csv"):
+            raise QuizError(f"unknown quiz format '{extension}' (use .json, .jsonl or .csv)")
+        self.format = extension
+        size = os.path.getsize(path)
+        if extension != ".json" and size > LAZY_LOAD_SIZE:
+            self.index_lines()
+        else:
+            self.load_all()
+        if len(self) == 0:
+            raise QuizError("quiz has no questions")
+        log.info("Quiz '%s' loaded: %d questions%s", self.name, len(self),
+                 " (read lazily)" if self.mapped is not None else "")
+
+    def load_all(self):
+        """Parse, check and encode every question right away"""
+        with open(self.path, encoding="utf-8", newline="") as f:
+            if self.format == ".json":
+                try:
+                    data = json.load(f)
+                except json.JSONDecodeError as e:
+                    raise QuizError(f"invalid JSON: {e}")
+                if isinstance(data, dict):
+                    data = data.get("questions", [])
+                if not isinstance(data, list):
+                    raise QuizError("expected a list of questions")
+                items = [(i + 1, Question.from_dict, item) for i, item in enumerate(data)]
+            elif self.format == ".jsonl":
+                items = [(i + 1, self.parse_json_line, line) for i, line in enumerate(f) if line.strip()]
+            else:
+                rows = [row for row in csv.reader(f) if row]
+                if rows and is_csv_header(rows[0]):
+                    rows = rows[1:]
+                items = [(i + 1, Question.from_row, row) for i, row in enumerate(rows)]
+
+        self.questions = []
+        for number, parse, item in items:
+            try:
+                self.questions.append(parse(item))
+            except QuizError as e:
+                raise QuizError(f"question {number}: {e}")
+
+    def index_lines(self):
+        """Remember where every line starts - the questions themselves are parsed on demand"""
+        with open(self.path, "rb") as f:
+            self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offsets = array("q")
+        position = 0
+        size = len(self.mapped)
+        while position < size:
+            line_end = self.mapped.find(b"\n", position)
+            if line_end == -1:
+                line_end = size
+            if line_end > position and self.mapped[position:line_end].strip():
+                offsets.append(position)
+            position = line_end + 1
+        if offsets and self.format == ".csv" and is_csv_header(self.read_row(offsets[0])):
+            offsets.pop(0)
+        self.line_offsets = offsets
+
+    def read_line(self, offset):
+        line_end = self.mapped.find(b"\n", offset)
+        if line_end == -1:
+            line_end = len(self.mapped)
+        return self.mapped[offset:line_end].decode("utf-8")
+
+    def read_row(self, offset):
+        return next(csv.reader([self.read_line(offset)]), [])
+
+    def parse_json_line(self, line):
+        try:
+            return Question.from_dict(json.loads(line))
+        except json.JSONDecodeError as e:
+            raise QuizError(f"invalid JSON: {e}")
+
+    def __len__(self):
+        if self.questions is not None:
+            return len(self.questions)
+        return len(self.line_offsets)
+
+    def get(self, index):
+        """The question at index (raises QuizError if a lazily read line is invalid)"""
+        if self.questions is not None:
+            return self.questions[index]
+        question = self.parsed.get(index)
+        if question is None:
+            offset = self.line_offsets[index]
+            try:
+                if self.format == ".csv":
+                    question = Question.from_row(self.read_row(offset))
+                else:
+                    question = self.parse_json_line(self.read_line(offset))
+            except (QuizError, UnicodeDecodeError) as e:
+                raise QuizError(f"question {index + 1}: {e}")
+            self.parsed[index] = question
+        return question
@@ -0,0 +1,146 @@
+import json
+import re
+import time
+
+# Traffic recording (--record): every message the server receives, per connection and with
+# its time, so a session can be replayed later without any clients (Replay.py).
+#
+# The file is text, one event per line:
+#   #kahoot-traffic 1 {"scoreboard": "summary", ...}     header: the server's game options
+#   <microseconds since start> <connection> <event> [data]
+# Events:
+#   +            connection opened
+#   -            connection closed (for whatever reason: the client left, timeout, eviction ...)
+#   m <message>  a text message (or binary TEXT frame) - backslashes, \n and \r are escaped
+#   a <1-4>      a binary answer
+#   x <opcode>   an invalid binary frame (the server disconnected the client for it)
+#   p <pin>      the server picked the PIN of a new game (connection 0)
+#   t <token>    the server picked the random part of a session token (connection 0)
+# The PINs and tokens make a replay deterministic: it hands out the same ones, so ROOM:<pin>
+# and RESUME:<token> lines still find their game. The file contains session tokens - keep it private.
+
+FORMAT_HEADER = "#kahoot-traffic 1 "
+UNESCAPES = {"\\\\": "\\", "\\n": "\n", "\\r": "\r"}
+
+
+def escape(message):
+    if "\\" in message or "\n" in message or "\r" in message:
+        return message.replace("\\", "\\\\").replace("\n", "\\n").replace("\r", "\\r")
+    return message
+
+
+def unescape(message):
+    if "\\" not in message:
+        return message
+    return re.sub(r"\\[\\nr]", lambda match: UNESCAPES[match.group()], message)
+
+
+class TrafficRecorder:
+    """Writes the traffic of one server process to a recording file"""
+
+    enabled = True
+
+    def __init__(self, path, call_later, options, flush_interval=1.0):
+        self.file = open(path, "w", encoding="utf-8")
+        self.file.write(FORMAT_HEADER + json.dumps(options) + "\n")
+        self.file.flush()
+        # Schedules the flush (server.call_later, so it works with every engine)
+        self.call_later = call_later
+        self.flush_interval = flush_interval
+        self.start = time.monotonic()
+        # Socket -> connection number in the file (0 is the server itself)
+        self.connections = {}
+        self.next_connection = 1
+        # Lines waiting for the next flush
+        self.lines = []
+        self.flush_scheduled = False
+
+    def timestamp(self):
+        return int((time.monotonic() - self.start) * 1e6)
+
+    def add(self, line):
+        self.lines.append(line)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.call_later(self.flush_interval, self.flush)
+
+    def connected(self, client_socket):
+        connection = self.next_connection
+        self.next_connection += 1
+        self.connections[client_socket] = connection
+        self.add(f"{self.timestamp()} {connection} +\n")
+
+    def disconnected(self, client_socket):
+        connection = self.connections.pop(client_socket, None)
+        if connection is not None:
+            self.add(f"{self.timestamp()} {connection} -\n")
+
+    def messages(self, client_socket, messages):
+        """Everything decoded from one read of a client (str, int answers, invalid binary frames)"""
+        connection = self.connections.get(client_socket)
+        if connection is None:
+            return
+        prefix = f"{self.timestamp()} {connection} "
+        for message in messages:
+            if message.__class__ is str:
+                self.add(f"{prefix}m {escape(message)}\n")
+            elif message.__class__ is int:
+                self.add(f"{prefix}a {message}\n")
+            else:
+                self.add(f"{prefix}x {message[0]}\n")
+
+    def pin(self, pin):
+        self.add(f"{self.timestamp()} 0 p {pin}\n")
+
+    def token(self, token):
+        self.add(f"{self.timestamp()} 0 t {token}\n")
+
+    def flush(self):
+        """Write the collected lines (also the timer callback)"""
+        self.flush_scheduled = False
+        if self.lines:
+            self.file.write("".join(self.lines))
+            self.file.flush()
+            self.lines.clear()
+
+
+class NullRecorder:
+    """Used when recording is off - every call does nothing"""
+
+    enabled = False
+
+    def connected(self, client_socket):
+        pass
+
+    def disconnected(self, client_socket):
+        pass
+
+    def messages(self, client_socket, messages):
+        pass
+
+    def pin(self, pin):
+        pass
+
+    def token(self, token):
+        pass
+
+    def flush(self):
+        pass
+
+
+def read_recording(path):
+    """Returns (server options, list of events); an event is (seconds, connection, kind, data)"""
+    with open(path, encoding="utf-8") as f:
+        header = f.readline()
+        if not header.startswith(FORMAT_HEADER):
+            raise ValueError(f"{path} is not a traffic recording")
+        options = json.loads(header[len(FORMAT_HEADER):])
+        events = []
+        for line in f:
+            if not line.endswith("\n"):
+                # Cut off by a crash in the middle of a write
+                break
+            fields = line[:-1].split(" ", 3)
+            data = unescape(fields[3]) if len(fields) > 3 else None
+            events.append((int(fields[0]) / 1e6, int(fields[1]), fields[2], data))
+    return options, events
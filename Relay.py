@@ -0,0 +1,486 @@
+import argparse
+import selectors
+import socket
+import time
+from BinaryProtocol import BinaryDecoder, encode_text
+from Connection import Connection
+from FrameDecoder import encode_frame, frame_prefix
+from RelayProtocol import RelayDecoder, all_header, to_header, shared_header, you_header
+from Scheduler import Scheduler
+from ServerLog import log, setup_logging, SAMPLE_CONNECTIONS
+
+# Relay node: serves the players of one game from its own connections, so the server
+# doesn't have to. The relay connects to the server once (RELAY:<pin>), and from then on:
+#  - a message for everyone (GAME_STARTED, QUESTION, ROUND_OVER, GAME_OVER ...) reaches the
+#    relay once and is copied to its clients here, not in the server's game loop
+#  - answers of its clients go to the server in batches (one ANSWERS line per batch_interval)
+#  - messages for one player arrive addressed to them and are passed on untouched
+# Relays accept other relays as clients too, so a tree of relays can serve tens of thousands
+# of players from one server. Clients connect to a relay exactly like to the server.
+#
+#   python Relay.py --upstream 10.0.0.5:12345 --pin 4821 --port 12400
+#   python Relay.py --upstream 127.0.0.1:12400 --pin 4821 --port 12401    (a relay below the first one)
+#
+# See RelayProtocol.py for what goes over the link.
+
+# Heartbeat for both client protocols, encoded once
+PING_FRAMES = (encode_frame("PING"), encode_text("PING"))
+# Answers sent in one ANSWERS line at most
+MAX_BATCH = 4096
+
+
+class Downstream:
+    """One connection accepted by the relay: a player or another relay"""
+    __slots__ = ("connection", "client_id", "binary", "joined", "forwarded", "child", "descendants",
+                 "last_seen")
+
+    def __init__(self, connection, client_id):
+        self.connection = connection
+        # The id the upstream knows this client by
+        self.client_id = client_id
+        self.binary = False
+        # True once the server said the client is in the game (JOINED) - it gets the ALL messages
+        self.joined = False
+        # True once something of this client went upstream (the server knows it then)
+        self.forwarded = False
+        # A relay below this one, and the ids of the clients behind it
+        self.child = False
+        self.descendants = None
+        self.last_seen = time.monotonic()
+
+
+class relay_node:
+    """Relay process between the server (or a relay closer to it) and many clients"""
+
+    def __init__(self, port, upstream_host, upstream_port, pin, batch_interval=0.01,
+                 heartbeat_interval=15.0, idle_timeout=60.0, backlog=1024, high_watermark=64 * 1024,
+                 low_watermark=16 * 1024, max_output_buffer=1024 * 1024, slow_timeout=10.0,
+                 relay_buffer=64 * 1024 * 1024):
+        self.pin = pin
+        self.batch_interval = batch_interval
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.max_output_buffer = max_output_buffer
+        self.slow_timeout = slow_timeout
+        self.relay_buffer = relay_buffer
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.scheduler = Scheduler()
+        self.selector = selectors.DefaultSelector()
+
+        # Attach to the game before accepting anyone
+        self.upstream = socket.create_connection((upstream_host, upstream_port), timeout=10)
+        self.upstream_decoder = RelayDecoder()
+        early_messages = self.attach()
+        self.upstream.setblocking(False)
+        self.upstream_connection = Connection(self.upstream, relay_buffer, relay_buffer, relay_buffer)
+        self.selector.register(self.upstream, selectors.EVENT_READ)
+
+        self.server_socket = socket.socket()
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind(('', port))
+        self.server_socket.listen(backlog)
+        self.server_socket.setblocking(False)
+        self.selector.register(self.server_socket, selectors.EVENT_READ)
+
+        # Client id -> Downstream, for everyone connected here (players and relays below)
+        self.clients = {}
+        self.next_id = 1
+        # Players in the game, by protocol (client id -> Downstream), and the relays below this one
+        self.text_members = {}
+        self.binary_members = {}
+        self.children = {}
+        # Shared part of the current scoreboard (SHARED), completed per player by YOU messages
+        self.shared = b""
+        # "<id>=<answer>" waiting for the next ANSWERS line
+        self.answers = []
+        self.batch_timer = None
+        # Connections with unsent data (Downstream objects, and None for the upstream)
+        self.pending_writes = set()
+        if heartbeat_interval and idle_timeout:
+            self.scheduler.call_later(heartbeat_interval, self.check_heartbeats)
+        self.handle_upstream_messages(early_messages)
+
+    def attach(self):
+        """Ask the upstream for the game (blocking, once at startup), returns what came after the answer"""
+        self.upstream.sendall(f"RELAY:{self.pin}\n".encode())
+        while True:
+            data = self.upstream.recv(65536)
+            if not data:
+                raise ConnectionError("upstream closed the connection")
+            messages = self.upstream_decoder.feed(data)
+            for i, message in enumerate(messages):
+                if message == f"RELAY:{self.pin}":
+                    return messages[i + 1:]
+                if message.__class__ is str and message.startswith(("ROOM_NOT_FOUND", "SERVER_FULL")):
+                    raise ConnectionError(f"game {self.pin} not found upstream ({message}) - "
+                                          f"start the relay once the host has joined")
+
+    def run_server(self):
+        log.info("Relay for game %s is now listening...", self.pin)
+        while True:
+            for key, events in self.selector.select(self.scheduler.next_timeout()):
+                if key.fileobj is self.server_socket:
+                    self.handle_new_connection()
+                elif key.fileobj is self.upstream:
+                    if events & selectors.EVENT_READ:
+                        self.read_upstream()
+                    if events & selectors.EVENT_WRITE:
+                        self.pending_writes.add(None)
+                elif key.data.connection is not None:
+                    if events & selectors.EVENT_READ:
+                        self.read_downstream(key.data)
+                    if events & selectors.EVENT_WRITE and key.data.connection is not None:
+                        self.pending_writes.add(key.data)
+            self.scheduler.run_due()
+            if not self.batch_interval:
+                self.flush_answers()
+            self.flush_pending()
+
+    # --- upstream ---
+
+    def send_upstream(self, line):
+        """Queue one line for the upstream; batched answers go first, so nothing overtakes them"""
+        if self.answers:
+            self.flush_answers()
+        self.upstream_connection.queue((line + "\n").encode())
+        self.pending_writes.add(None)
+
+    def add_answer(self, item):
+        self.answers.append(item)
+        if len(self.answers) >= MAX_BATCH:
+            self.flush_answers()
+        elif self.batch_interval and self.batch_timer is None:
+            self.batch_timer = self.scheduler.call_later(self.batch_interval, self.flush_answers)
+
+    def flush_answers(self):
+        """Send the batched answers as one ANSWERS line (also the batch timer callback)"""
+        self.scheduler.cancel(self.batch_timer)
+        self.batch_timer = None
+        if not self.answers:
+            return
+        self.upstream_connection.queue(("ANSWERS:" + ",".join(self.answers) + "\n").encode())
+        self.pending_writes.add(None)
+        self.answers = []
+
+    def read_upstream(self):
+        try:
+            data = self.upstream.recv(262144)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.upstream_lost()
+        self.handle_upstream_messages(self.upstream_decoder.feed(data))
+
+    def upstream_lost(self):
+        log.warning("Upstream connection lost, closing %d clients", len(self.clients))
+        for downstream in list(self.clients.values()):
+            self.close_downstream(downstream, notify=False)
+        raise SystemExit(1)
+
+    def handle_upstream_messages(self, messages):
+        for message in messages:
+            if message.__class__ is str:
+                self.handle_upstream_line(message)
+                continue
+            kind, client_id, payload = message
+            if kind == "ALL":
+                self.fan_out(client_id, payload)
+            elif kind == "SHARED":
+                self.shared = payload
+                header = shared_header(len(payload))
+                for child in self.children.values():
+                    self.queue(child, header)
+                    self.queue(child, payload)
+            else:
+                downstream, inner_id = self.route(client_id)
+                if downstream is None:
+                    continue
+                if inner_id is not None:
+                    # For a client behind a relay below this one
+                    header = to_header if kind == "TO" else you_header
+                    self.queue(downstream, header(inner_id.encode(), len(payload)))
+                elif kind == "YOU":
+                    # The text frame is the shared part followed by the player's own part
+                    self.queue(downstream, frame_prefix(len(self.shared) + len(payload)))
+                    self.queue(downstream, self.shared)
+                self.queue(downstream, payload)
+
+    def handle_upstream_line(self, line):
+        if line == "PING":
+            self.upstream_connection.queue(b"PONG\n")
+            self.pending_writes.add(None)
+        elif line.startswith(("JOINED:", "DROP:")):
+            event, client_id = line.split(":", 1)
+            downstream, inner_id = self.route(client_id)
+            if downstream is None:
+                return
+            if inner_id is not None:
+                if event == "DROP":
+                    downstream.descendants.discard(inner_id)
+                self.queue(downstream, f"{event}:{inner_id}\n".encode())
+            elif event == "JOINED":
+                downstream.joined = True
+                members = self.binary_members if downstream.binary else self.text_members
+                members[downstream.client_id] = downstream
+            else:
+                # The server disconnected this client (e.g. it came back on another connection)
+                self.close_downstream(downstream, notify=False)
+        else:
+            log.info("Message from upstream: %s", line)
+
+    def route(self, client_id):
+        """(Downstream, id below it) for an id from upstream - the id below is None for our own players"""
+        own_id, separator, inner_id = client_id.partition(".")
+        downstream = self.clients.get(own_id)
+        if separator:
+            if downstream is None or not downstream.child:
+                return None, None
+            return downstream, inner_id
+        if downstream is None or downstream.child:
+            return None, None
+        return downstream, None
+
+    def fan_out(self, text, binary):
+        """An ALL message: the same bytes for every player here and for every relay below"""
+        queue = self.queue
+        if text:
+            for downstream in self.text_members.values():
+                queue(downstream, text)
+        if binary:
+            for downstream in self.binary_members.values():
+                queue(downstream, binary)
+        if self.children:
+            header = all_header(len(text), len(binary))
+            for child in self.children.values():
+                queue(child, header)
+                queue(child, text)
+                queue(child, binary)
+
+    # --- downstream ---
+
+    def handle_new_connection(self):
+        """Accept every waiting connection and ask for a name, like the server does"""
+        while True:
+            try:
+                client_socket, addr = self.server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                log.warning("Could not accept a connection: %s", e)
+                return
+            client_socket.setblocking(False)
+            connection = Connection(client_socket, self.high_watermark, self.low_watermark, self.max_output_buffer)
+            downstream = Downstream(connection, str(self.next_id))
+            self.next_id += 1
+            self.clients[downstream.client_id] = downstream
+            self.selector.register(client_socket, selectors.EVENT_READ, downstream)
+            self.queue(downstream, b"NAME_REQUEST\n")
+            log.debug("New client connected from %s", addr, extra=SAMPLE_CONNECTIONS)
+
+    def queue(self, downstream, data):
+        if data:
+            downstream.connection.queue(data)
+            self.pending_writes.add(downstream)
+
+    def read_downstream(self, downstream):
+        connection = downstream.connection
+        try:
+            data = connection.client_socket.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.close_downstream(downstream, notify=True)
+            return
+        downstream.last_seen = time.monotonic()
+        try:
+            messages = connection.decoder.feed(data)
+        except ValueError as e:
+            log.warning("Protocol error from client: %s", e)
+            self.close_downstream(downstream, notify=True)
+            return
+        for message in messages:
+            if downstream.child:
+                self.handle_child_message(downstream, message)
+            else:
+                self.handle_client_message(downstream, message)
+            if downstream.connection is None:
+                return
+
+    def handle_client_message(self, downstream, message):
+        """A message of a player connected here"""
+        if message.__class__ is int:
+            # A binary answer
+            if downstream.joined:
+                self.add_answer(f"{downstream.client_id}={message}")
+            return
+        if message.__class__ is not str:
+            log.warning("Protocol error from client: unexpected binary frame 0x%02x", message[0])
+            self.close_downstream(downstream, notify=True)
+            return
+        message = message.strip()
+        if not message or message == "PONG":
+            return
+
+        if downstream.joined:
+            if message.isdigit():
+                self.add_answer(f"{downstream.client_id}={message}")
+                return
+        elif message.startswith("RELAY:") and not downstream.forwarded:
+            self.attach_child(downstream, message.split(":", 1)[1].strip())
+            return
+        elif message.startswith("ROOM:"):
+            # This relay serves one game only
+            pin = message.split(":", 1)[1].strip()
+            reply = f"ROOM:{pin}" if pin == self.pin else f"ROOM_NOT_FOUND:{pin}"
+            self.send_text(downstream, reply)
+            return
+        elif message == "PROTO:BINARY" and not downstream.binary:
+            # The server answers PROTO:BINARY - after that the client only sends binary frames
+            downstream.binary = True
+            downstream.connection.decoder = BinaryDecoder()
+        downstream.forwarded = True
+        self.send_upstream(f"{downstream.client_id}:{message}")
+
+    def send_text(self, downstream, message):
+        self.queue(downstream, encode_text(message) if downstream.binary else encode_frame(message))
+
+    def attach_child(self, downstream, pin):
+        """A relay below this one (RELAY:<pin>)"""
+        if pin != self.pin:
+            self.send_text(downstream, f"ROOM_NOT_FOUND:{pin}")
+            return
+        downstream.child = True
+        downstream.descendants = set()
+        connection = downstream.connection
+        connection.high_watermark = self.relay_buffer // 4
+        connection.low_watermark = self.relay_buffer // 16
+        connection.max_buffer = self.relay_buffer
+        self.children[downstream.client_id] = downstream
+        self.send_text(downstream, f"RELAY:{pin}")
+        log.info("Relay %s attached", downstream.client_id)
+
+    def handle_child_message(self, child, message):
+        """A line of a relay below this one - its client ids get the relay's id in front"""
+        prefix = child.client_id + "."
+        if message == "PONG":
+            return
+        if message.startswith("ANSWERS:"):
+            for item in message[8:].split(","):
+                self.add_answer(prefix + item)
+        elif message.startswith("CLOSE:"):
+            child.descendants.discard(message[6:])
+            self.send_upstream("CLOSE:" + prefix + message[6:])
+        else:
+            child.descendants.add(message.split(":", 1)[0])
+            self.send_upstream(prefix + message)
+
+    def close_downstream(self, downstream, notify):
+        """Disconnect a client; notify=True tells the upstream (False: the upstream asked for it)"""
+        connection = downstream.connection
+        if connection is None:
+            return
+        downstream.connection = None
+        self.clients.pop(downstream.client_id, None)
+        self.text_members.pop(downstream.client_id, None)
+        self.binary_members.pop(downstream.client_id, None)
+        self.children.pop(downstream.client_id, None)
+        self.pending_writes.discard(downstream)
+        self.selector.unregister(connection.client_socket)
+        connection.client_socket.close()
+        if not notify:
+            return
+        if downstream.child:
+            log.info("Relay %s disconnected with %d clients", downstream.client_id, len(downstream.descendants))
+            for inner_id in downstream.descendants:
+                self.send_upstream(f"CLOSE:{downstream.client_id}.{inner_id}")
+        elif downstream.forwarded:
+            self.send_upstream(f"CLOSE:{downstream.client_id}")
+
+    def check_heartbeats(self):
+        """Timer callback: PING quiet clients, drop the ones that stayed silent too long"""
+        self.scheduler.call_later(self.heartbeat_interval, self.check_heartbeats)
+        now = time.monotonic()
+        for downstream in list(self.clients.values()):
+            idle = now - downstream.last_seen
+            if idle >= self.idle_timeout:
+                log.info("Dropping client %s: silent for %d seconds", downstream.client_id, idle,
+                         extra=SAMPLE_CONNECTIONS)
+                self.close_downstream(downstream, notify=True)
+            elif idle >= self.heartbeat_interval:
+                # Relays below answer a plain PING line too
+                self.queue(downstream, PING_FRAMES[downstream.binary])
+
+    def flush_pending(self):
+        """Write out buffered data, watch for write-readiness where needed and evict slow clients"""
+        now = time.monotonic()
+        for downstream in list(self.pending_writes):
+            if downstream is None:
+                connection = self.upstream_connection
+            else:
+                connection = downstream.connection
+                if connection is None:
+                    self.pending_writes.discard(downstream)
+                    continue
+            try:
+                connection.flush()
+            except OSError:
+                if downstream is None:
+                    self.upstream_lost()
+                self.close_downstream(downstream, notify=True)
+                continue
+
+            if not connection.has_pending():
+                self.pending_writes.discard(downstream)
+                self.set_write_interest(connection, downstream, False)
+            elif downstream is not None and connection.is_too_slow(now, self.slow_timeout):
+                log.warning("Evicting slow client %s (%d bytes not delivered)", downstream.client_id,
+                            connection.buffered)
+                self.close_downstream(downstream, notify=True)
+            else:
+                self.set_write_interest(connection, downstream, True)
+
+    def set_write_interest(self, connection, downstream, wanted):
+        if connection.write_registered == wanted:
+            return
+        events = selectors.EVENT_READ
+        if wanted:
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(connection.client_socket, events, downstream)
+        connection.write_registered = wanted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cyber Kahoot relay node")
+    parser.add_argument("--upstream", default="127.0.0.1:12345",
+                        help="host:port of the server, or of another relay")
+    parser.add_argument("--pin", default="0", help="PIN of the game this relay serves (0 = the default game)")
+    parser.add_argument("--port", type=int, default=12400, help="port the relay's clients connect to")
+    parser.add_argument("--batch-interval", type=float, default=0.01,
+                        help="seconds answers are collected before they go upstream in one line "
+                             "(0 = one line per loop iteration)")
+    parser.add_argument("--backlog", type=int, default=1024,
+                        help="connections the kernel queues while the relay is busy (listen backlog)")
+    parser.add_argument("--heartbeat", type=float, default=15.0,
+                        help="seconds of silence after which a client gets a PING (0 = no heartbeats)")
+    parser.add_argument("--idle-timeout", type=float, default=60.0,
+                        help="a client that sent nothing (not even PONG) for this many seconds is disconnected")
+    parser.add_argument("--relay-buffer", type=int, default=64 * 1024 * 1024,
+                        help="bytes a relay below this one may have unsent before it is disconnected as too slow")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="INFO")
+    parser.add_argument("--log-file", help="write the log to this file instead of the terminal")
+    args = parser.parse_args()
+
+    setup_logging(level=args.log_level, log_file=args.log_file)
+    upstream_host, _, upstream_port = args.upstream.rpartition(":")
+    try:
+        relay = relay_node(args.port, upstream_host or "127.0.0.1", int(upstream_port), args.pin,
+                           batch_interval=args.batch_interval, heartbeat_interval=args.heartbeat,
+                           idle_timeout=args.idle_timeout, backlog=args.backlog, relay_buffer=args.relay_buffer)
+    except (ConnectionError, OSError) as e:
+        parser.exit(1, f"Relay could not attach to {args.upstream}: {e}\n")
+    relay.run_server()
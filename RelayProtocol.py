@@ -0,0 +1,181 @@
+# The link between the server and a relay node (Relay.py).
+#
+# A relay connects to the server once, answers NAME_REQUEST with RELAY:<pin> and, once the
+# server answered RELAY:<pin> too, carries the traffic of all its own clients over that
+# single connection. Relays can connect to other relays the same way, forming a tree.
+#
+# Relay -> server: text lines
+#   <id>:<message>         a message of the relayed client <id> (its name, RESUME:..., PROTO:BINARY ...)
+#   ANSWERS:<id>=<answer>,<id>=<answer>,...   answers of many clients in one line
+#   CLOSE:<id>             the client disconnected
+#   PONG                   heartbeat answer
+#
+# Server -> relay: a header line, for most of them followed by <length> bytes that are passed on as they are
+#   ALL:<text length>,<binary length>   one message for every client in the game: the text protocol
+#                                       version, then the binary one
+#   TO:<id>,<length>       bytes for one client, already encoded for its protocol
+#   SHARED:<length>        shared part of the next scoreboard (the relay keeps it)
+#   YOU:<id>,<length>      the client's own part of that scoreboard - the relay sends it as one
+#                          text frame: the shared part followed by these bytes
+#   JOINED:<id>            the client is in the game now and gets the ALL messages
+#   DROP:<id>              the server disconnected the client
+#   PING                   heartbeat
+#
+# Client ids are chosen by the relay that accepted the client. A relay that passes on the
+# clients of another relay puts the id of that relay in front ("<relay id>.<client id>"),
+# so the server's TO and YOU frames find their way down the tree.
+
+# Header lines that are followed by a payload
+PAYLOAD_HEADERS = (b"ALL:", b"TO:", b"SHARED:", b"YOU:")
+
+
+def all_header(text_length, binary_length):
+    return b"ALL:%d,%d\n" % (text_length, binary_length)
+
+
+def to_header(client_id, length):
+    return b"TO:%s,%d\n" % (client_id, length)
+
+
+def shared_header(length):
+    return b"SHARED:%d\n" % length
+
+
+def you_header(client_id, length):
+    return b"YOU:%s,%d\n" % (client_id, length)
+
+
+class RelayDecoder:
+    """Incremental decoder for what the server sends to a relay.
+
+    feed() returns the decoded messages:
+      - ("ALL", text bytes, binary bytes)
+      - ("TO", client id, bytes), ("YOU", client id, bytes), ("SHARED", None, bytes)
+      - str for every other line (JOINED:<id>, DROP:<id>, PING, RELAY:<pin> ...)
+    Payloads are never decoded - the relay only passes them on.
+    """
+
+    def __init__(self, max_frame_size=64 * 1024 * 1024):
+        self.buffer = bytearray()
+        self.max_frame_size = max_frame_size
+
+    def feed(self, data):
+        self.buffer += data
+        buffer = self.buffer
+        messages = []
+        position = 0
+        buffer_size = len(buffer)
+
+        while position < buffer_size:
+            line_end = buffer.find(b"\n", position)
+            if line_end == -1:
+                break
+            line = bytes(buffer[position:line_end])
+            if not line.startswith(PAYLOAD_HEADERS):
+                messages.append(line.decode("utf-8", "replace"))
+                position = line_end + 1
+                continue
+
+            kind, fields = line.split(b":", 1)
+            if kind == b"ALL":
+                text_length, binary_length = [int(field) for field in fields.split(b",")]
+                length = text_length + binary_length
+            elif kind == b"SHARED":
+                length = int(fields)
+            else:
+                client_id, length = fields.rsplit(b",", 1)
+                length = int(length)
+            if length > self.max_frame_size:
+                raise ValueError(f"Frame of {length} bytes is too large")
+            start = line_end + 1
+            if buffer_size < start + length:
+                # The payload didn't fully arrive yet
+                break
+            payload = bytes(buffer[start:start + length])
+            if kind == b"ALL":
+                messages.append(("ALL", payload[:text_length], payload[text_length:]))
+            elif kind == b"SHARED":
+                messages.append(("SHARED", None, payload))
+            else:
+                messages.append((kind.decode(), client_id.decode(), payload))
+            position = start + length
+
+        if position:
+            del buffer[:position]
+        if len(buffer) > self.max_frame_size:
+            raise ValueError(f"Incomplete frame is larger than {self.max_frame_size} bytes")
+        return messages
+
+
+class RelayLink:
+    """The server's side of a relay connection: the relay's clients and the room they play in"""
+
+    def __init__(self, server, link_socket, room):
+        self.server = server
+        self.link_socket = link_socket
+        self.room = room
+        # Client id (str) -> RelayedClient
+        self.clients = {}
+        # Set when the relay disconnected - its clients are removed without telling it
+        self.closed = False
+
+    def send(self, header, data=None):
+        # Through the room's outbox: in order with everything else the game sends
+        self.room.outbox.extend((self.link_socket, header))
+        if data:
+            self.room.outbox.extend((self.link_socket, data))
+
+    def broadcast(self, frames):
+        """One message (encoded for both protocols) for every client of the relay in the game"""
+        text_frame, binary_frame = frames
+        self.send(all_header(len(text_frame), len(binary_frame)), text_frame)
+        if binary_frame:
+            self.room.outbox.extend((self.link_socket, binary_frame))
+
+    def send_shared(self, shared):
+        self.send(shared_header(len(shared)), shared)
+
+    def client(self, client_id):
+        """The relayed client with this id, None if it isn't known yet"""
+        return self.clients.get(client_id)
+
+    def add_client(self, client_id):
+        client = RelayedClient(self, client_id)
+        self.clients[client_id] = client
+        return client
+
+    def forget(self, client):
+        if self.clients.pop(client.client_id, None) is not None and not self.closed:
+            self.send(b"DROP:%s\n" % client.header_id)
+
+
+class RelayedClient:
+    """A client that plays through a relay. It takes the place of the client socket
+    (Player.client_socket, the server's dicts) - everything sent to it goes over the link."""
+
+    __slots__ = ("link", "client_id", "header_id")
+
+    def __init__(self, link, client_id):
+        self.link = link
+        self.client_id = client_id
+        self.header_id = client_id.encode()
+
+    def queue(self, data):
+        """Bytes for this client only (already encoded for its protocol).
+
+        Called while the server delivers its outbox, so the bytes go straight to the
+        link's connection - they keep their place among the other messages for the relay.
+        """
+        link = self.link
+        link.server.write_bytes(link.link_socket, to_header(self.header_id, len(data)))
+        link.server.write_bytes(link.link_socket, data)
+
+    def queue_summary(self, personal):
+        """The client's own part of a scoreboard whose shared part went to the relay with send_shared"""
+        self.link.send(you_header(self.header_id, len(personal)), personal)
+
+    def joined(self):
+        self.link.send(b"JOINED:%s\n" % self.header_id)
+
+    def close(self):
+        self.link.forget(self)
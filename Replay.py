@@ -0,0 +1,241 @@
+import argparse
+import hashlib
+import json
+import time
+from collections import deque
+from Connection import Connection
+from Recorder import read_recording
+from Scheduler import Scheduler
+from Server import my_server
+from ServerLog import setup_logging, stop_logging
+
+# Plays a traffic recording (Server.py --record FILE) back into the game logic - no sockets,
+# no clients, the same messages in the same order. Timers (answer windows, auto-advance,
+# lobby updates) run on the recording's clock, so rounds close exactly where they did.
+#
+# What comes out:
+#   - throughput of the whole session and the latency of every message type and of the
+#     end-of-round scoring (round.results)
+#   - a digest of everything the server sent to each connection: two versions of the server
+#     that play a recording the same way have the same digest
+#
+# Usage: python Replay.py session.rec                    as fast as possible
+#        python Replay.py session.rec --realtime         with the recorded pauses (--speed 10 = 10x faster)
+#        python Replay.py session.rec --json > new.json
+#        python Replay.py session.rec --baseline old.json    compare with an earlier run
+
+# Recorded messages of one read (the same timestamp and connection) are handled together
+MESSAGE_KINDS = ("m", "a", "x")
+
+
+class ReplaySocket:
+    """Stands in for a client socket: takes everything the server sends and hashes it"""
+
+    def __init__(self, number):
+        self.number = number
+        self.digest = hashlib.sha256()
+        self.bytes_sent = 0
+
+    def sendmsg(self, chunks):
+        total = 0
+        for chunk in chunks:
+            self.digest.update(chunk)
+            total += len(chunk)
+        self.bytes_sent += total
+        return total
+
+    def setblocking(self, flag):
+        pass
+
+    def close(self):
+        pass
+
+
+class replay_server(my_server):
+    """my_server fed from a recording: no listening socket, no selector and a virtual clock.
+
+    PINs and session tokens come from the recording, so ROOM:<pin> and RESUME:<token>
+    lines find the same games they found when the session was recorded.
+    """
+
+    def __init__(self, options, pins, tokens, **server_options):
+        super().__init__(None, heartbeat_interval=0, **options, **server_options)
+        self.selector.close()
+        self.selector = None
+        # Seconds since the start of the recording
+        self.now = 0.0
+        self.scheduler = Scheduler(clock=lambda: self.now)
+        self.recorded_pins = deque(pins)
+        self.recorded_tokens = deque(tokens)
+
+    def add_client(self, client_socket):
+        self.clients.append(client_socket)
+        self.connections[client_socket] = Connection(client_socket, self.high_watermark,
+                                                     self.low_watermark, self.max_output_buffer)
+
+    def new_pin(self):
+        if self.recorded_pins:
+            return self.recorded_pins.popleft()
+        return super().new_pin()
+
+    def new_token(self):
+        if self.recorded_tokens:
+            return self.recorded_tokens.popleft()
+        return super().new_token()
+
+    def advance(self, until):
+        """Run every timer due up to `until`, each at its own deadline"""
+        scheduler = self.scheduler
+        while True:
+            scheduler.drop_cancelled()
+            if not scheduler.heap or scheduler.heap[0][0] > until:
+                break
+            self.now = scheduler.heap[0][0]
+            scheduler.run_due(self.now)
+            self.flush_pending()
+        self.now = max(self.now, until)
+
+
+def group_events(events):
+    """Yield (seconds, connection, kind, data) for connects/disconnects and
+    (seconds, connection, "messages", [message, ...]) for the messages of one read"""
+    batch = None
+    for seconds, connection, kind, data in events:
+        if kind in MESSAGE_KINDS:
+            if kind == "a":
+                message = int(data)
+            elif kind == "x":
+                message = (int(data),)
+            else:
+                message = data
+            if batch is not None and batch[0] == seconds and batch[1] == connection:
+                batch[3].append(message)
+                continue
+            if batch is not None:
+                yield batch
+            batch = (seconds, connection, "messages", [message])
+            continue
+        if batch is not None:
+            yield batch
+            batch = None
+        if kind in ("+", "-"):
+            yield seconds, connection, kind, data
+    if batch is not None:
+        yield batch
+
+
+def top_scores(room, count=10):
+    """[name, points] of the best players of a game - sessions keep the points of players who left"""
+    players = [player for player in room.sessions.values() if not player.IsAdmin()]
+    players.sort(key=lambda player: -player.GetPoints())
+    return [[player.GetName(), player.GetPoints()] for player in players[:count]]
+
+
+def replay(path, realtime=False, speed=1.0, metrics=True):
+    """Play a recording, returns the report (a dict)"""
+    options, events = read_recording(path)
+    pins = [data for _, _, kind, data in events if kind == "p"]
+    tokens = [data for _, _, kind, data in events if kind == "t"]
+    server = replay_server(options, pins, tokens, metrics=metrics)
+
+    sockets = {}
+    message_count = 0
+    sleeping = 0.0
+    wall_start = time.perf_counter()
+    for seconds, connection, kind, data in group_events(events):
+        if realtime:
+            delay = wall_start + seconds / speed - time.perf_counter()
+            if delay > 0:
+                # Sleeps don't count as processing time
+                time.sleep(delay)
+                sleeping += delay
+        server.advance(seconds)
+        if kind == "+":
+            client_socket = sockets[connection] = ReplaySocket(connection)
+            server.add_client(client_socket)
+            server.send_to(client_socket, "NAME_REQUEST")
+        elif kind == "-":
+            server.remove_client(sockets[connection])
+        else:
+            message_count += len(data)
+            server.handle_messages(sockets[connection], data)
+        server.flush_pending()
+    elapsed = time.perf_counter() - wall_start - sleeping
+
+    digest = hashlib.sha256()
+    bytes_sent = 0
+    for number in sorted(sockets):
+        digest.update(b"%d:%s\n" % (number, sockets[number].digest.hexdigest().encode()))
+        bytes_sent += sockets[number].bytes_sent
+
+    report = {
+        "recording": path,
+        "recorded_seconds": round(events[-1][0], 3) if events else 0.0,
+        "connections": len(sockets),
+        "messages": message_count,
+        "seconds": round(elapsed, 4),
+        "messages_per_second": round(message_count / elapsed) if elapsed else 0,
+        "bytes_sent": bytes_sent,
+        "output_digest": digest.hexdigest(),
+        "scores": {pin: top_scores(room) for pin, room in sorted(server.rooms.items())},
+        "timings": {},
+    }
+    for name, histogram in sorted(getattr(server.metrics, "histograms", {}).items()):
+        if histogram.count:
+            report["timings"][name] = {"count": histogram.count,
+                                       "avg_ms": round(histogram.total / histogram.count * 1000, 4),
+                                       "p99_ms": round(histogram.percentile(0.99) * 1000, 4),
+                                       "total_ms": round(histogram.total * 1000, 3)}
+    return report
+
+
+def print_report(report, baseline=None):
+    print(f"{report['recording']}: {report['connections']} connections, {report['messages']} messages "
+          f"({report['recorded_seconds']}s recorded)")
+    print(f"  replayed in {report['seconds'] * 1000:.1f}ms, {report['messages_per_second']} messages/s, "
+          f"{report['bytes_sent']} bytes sent")
+    for name, timing in report["timings"].items():
+        print(f"  {name:<22} count={timing['count']:<7} avg={timing['avg_ms']:.4f}ms "
+              f"p99<={timing['p99_ms']:.4f}ms total={timing['total_ms']:.1f}ms")
+    for pin, scores in report["scores"].items():
+        print(f"  room {pin}: " + ", ".join(f"{name} {points}" for name, points in scores))
+    print(f"  output digest {report['output_digest']}")
+    if baseline is None:
+        return
+    same = baseline["output_digest"] == report["output_digest"]
+    print(f"baseline {baseline['recording']}: output {'identical' if same else 'DIFFERENT'}, "
+          f"{report['messages_per_second'] / max(baseline['messages_per_second'], 1):.2f}x the messages/s")
+    for name, timing in report["timings"].items():
+        old = baseline["timings"].get(name)
+        if old:
+            print(f"  {name:<22} avg {old['avg_ms']:.4f}ms -> {timing['avg_ms']:.4f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play a traffic recording back into the game logic")
+    parser.add_argument("recording", help="file written by Server.py --record")
+    parser.add_argument("--realtime", action="store_true",
+                        help="keep the recorded pauses between messages (default: as fast as possible)")
+    parser.add_argument("--speed", type=float, default=1.0, help="with --realtime, play this many times faster")
+    parser.add_argument("--no-metrics", action="store_true",
+                        help="don't time the messages (throughput without the cost of the histograms)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON (to compare later with --baseline)")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare with")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="WARNING")
+    args = parser.parse_args()
+
+    setup_logging(level=args.log_level)
+    try:
+        report = replay(args.recording, args.realtime, args.speed, not args.no_metrics)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    finally:
+        stop_logging()
+    if args.json:
+        print(json.dumps(report, indent=1))
+    else:
+        baseline = None
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        print_report(report, baseline)
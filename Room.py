@@ -0,0 +1,701 @@
+import logging
+import time
+from collections import deque
+from BinaryProtocol import (encode_text, encode_result, encode_rank,
+                            RESULT_CORRECT as OUTCOME_CORRECT, RESULT_WRONG as OUTCOME_WRONG,
+                            RESULT_NO_ANSWER as OUTCOME_NO_ANSWER)
+from FrameDecoder import encode_frame, frame_prefix
+from Leaderboard import Leaderboard
+from Player import Player
+from PlayerColumns import PlayerColumns, NO_ANSWER, OPTIONS, OTHER_ANSWER, answer_code
+from PlayerRegistry import PlayerRegistry
+from QuizBank import Question, QuizError
+from RelayProtocol import RelayedClient
+from ServerLog import log, SAMPLE_ANSWERS, SAMPLE_CONNECTIONS, SAMPLE_MESSAGES
+
+# Clients that don't send ROOM:<pin> before their name play in this room
+DEFAULT_PIN = "0"
+# Most questions an admin can queue ahead of time (QUEUE:)
+MAX_QUEUED_QUESTIONS = 100
+
+# Result messages are the same for many players - encoded once
+RESULT_CORRECT = encode_frame("RESULT:✓ Correct! +1 point")
+RESULT_WRONG = encode_frame("RESULT:✗ Wrong answer!")
+RESULT_NO_ANSWER = encode_frame("RESULT:⏰ Time is up! No answer")
+
+# Messages are encoded for both protocols and indexed with player.binary:
+# frames[False] for text clients, frames[True] for binary ones
+
+class Room:
+    """One game, identified by its PIN.
+
+    A room owns everything about a single game: its players (the first one to join
+    is the admin), the leaderboard and the current question. The server only moves
+    bytes around and hands each message to the room the client joined.
+
+    The room is the game's core and does no I/O: every event (a message, a join, an
+    answer, a timer) only changes its state and appends what has to be sent to its
+    outbox, as client socket + encoded bytes pairs, and the connections it wants closed
+    to `disconnects`. Whoever drives the room - the server's loops, Benchmark.py,
+    Replay.py - collects both after each event and carries them out (my_server.collect).
+    """
+
+    def __init__(self, pin, server, scoreboard="summary", top_k=10, quiz=None):
+        self.pin = pin
+        # Timers, the journal, metrics, settings and quiz files - the room never touches
+        # the server's sockets, connections or outbox
+        self.server = server
+        # Outbound messages in the order the game produced them: client socket, bytes, client socket, bytes ...
+        self.outbox = []
+        # Client sockets whose connection the driver should close (a session that was taken over)
+        self.disconnects = []
+        # Players indexed by socket/fileno, with the admin and non-admin count kept up to date
+        self.players = PlayerRegistry()
+        # Non-admin players sorted by score, kept up to date as points are awarded
+        self.leaderboard = Leaderboard()
+        # "summary": everyone gets the top K plus their own place (fixed size per player)
+        # "full": everyone gets the whole scoreboard (grows with the number of players)
+        self.scoreboard = scoreboard
+        self.top_k = top_k
+        # player -> (rank, points) at the end of the previous round
+        self.previous_places = {}
+        self.game_started = False
+        # Points and current answers of the non-admin players, one slot per player
+        self.columns = PlayerColumns()
+        self.current_correct_answer = None
+        # When the current question was sent (for the round duration metric)
+        self.round_started_at = None
+        # With the answer log on (--answer-log): time.time() of the question and player -> time of their answer
+        self.question_asked_at = None
+        self.answer_received = {}
+        # Loaded quiz (a QuizBank shared with other rooms) and the index of the next question NEXT sends
+        self.quiz = quiz
+        self.quiz_position = 0
+        # Questions the admin queued ahead of time (QUEUE:...). They go before the quiz's
+        # questions, each one server.queue_pause seconds after the previous round ended.
+        self.question_queue = deque()
+        # Timers from server.call_later(..., room=self): the end of the answer window and the automatic next question.
+        # round_number tells a timer of an old round apart from the current one.
+        self.round_timer = None
+        self.advance_timer = None
+        self.round_number = 0
+        # Joins since the last lobby update: announced together by send_lobby_update,
+        # so N players joining at once cost N messages instead of N*N
+        self.pending_joins = []
+        self.lobby_timer = None
+        # Every player who joined, by session token - players who disconnected stay here
+        # (with their points) so they can come back with RESUME:<token>
+        self.sessions = {}
+        # The open question, sent again to players who come back during the round
+        self.current_question = None
+        # Closes the room when nobody came back within the server's session timeout
+        self.close_timer = None
+        # Relay nodes (RelayLink) attached to this game: a message for everyone goes to each
+        # relay once, and the relay passes it on to its own players
+        self.relays = []
+
+    def handle_message(self, player, message):
+        """Handle a message from a player who already joined this room.
+
+        Returns the message type, which the server uses to label its latency metrics.
+        """
+        if message.startswith("START_GAME") and player.IsAdmin():
+            self.start_game()
+            return "START_GAME"
+        elif message.startswith("QUESTION:") and player.IsAdmin():
+            self.send_question(message)
+            return "QUESTION"
+        elif message == "NEXT" and player.IsAdmin():
+            self.next_question()
+            return "NEXT"
+        elif message.startswith("QUEUE:") and player.IsAdmin():
+            self.queue_question(message)
+            return "QUEUE"
+        elif message == "CLEAR_QUEUE" and player.IsAdmin():
+            self.question_queue.clear()
+            self.send_queue_depth()
+            return "CLEAR_QUEUE"
+        elif message.startswith("LOAD_QUIZ:") and player.IsAdmin():
+            self.load_quiz(message.split(":", 1)[1].strip())
+            return "LOAD_QUIZ"
+        elif message.startswith("STOP_GAME") and player.IsAdmin():
+            self.stop_game()
+            return "STOP_GAME"
+        elif message.startswith("STATS") and player.IsAdmin():
+            # Server metrics for the admin (one multi-line message)
+            self.send_text(player, "STATS:\n" + self.server.render_metrics())
+            return "STATS"
+        elif message.isdigit() and self.game_started:
+            # Player answered a question
+            self.handle_answer(player, message)
+            return "ANSWER"
+        else:
+            log.info("Unknown message type: '%s'", message, extra=SAMPLE_MESSAGES)
+            return "UNKNOWN"
+
+    def register_player(self, client_socket, name, binary=False):
+        """Register a new player with their name (binary: the client speaks the binary protocol)"""
+        # Players behind a relay never host the game
+        is_admin = len(self.players) == 0 and client_socket.__class__ is not RelayedClient
+        player = Player(name, 0, is_admin, client_socket, None)
+        player.binary = binary
+        # The PIN in front tells a sharded server's router where the session lives
+        player.token = f"{self.pin}-{self.server.new_token()}"
+        self.sessions[player.token] = player
+        self.server.cancel_timer(self.close_timer)
+        self.close_timer = None
+        self.add_player(player)
+        self.server.journal.record("join", self.pin, player.token, name, is_admin)
+        
+        if is_admin:
+            self.send_text(player, "ROLE:ADMIN")
+            self.send_text(player, f"SESSION:{player.token}")
+            log.info("Player '%s' joined room %s as ADMIN", name, self.pin)
+        else:
+            self.send_text(player, "ROLE:PLAYER")
+            self.send_text(player, f"SESSION:{player.token}")
+            log.info("Player '%s' joined room %s as PLAYER", name, self.pin, extra=SAMPLE_CONNECTIONS)
+            # Notify only non-admin players about new players, a batch at a time
+            self.pending_joins.append(name)
+            if self.server.lobby_interval <= 0:
+                self.send_lobby_update()
+            elif self.lobby_timer is None:
+                self.lobby_timer = self.server.call_later(self.server.lobby_interval, self.send_lobby_update, room=self)
+
+    def resume_player(self, client_socket, token, binary=False):
+        """A player came back with their session token, returns False if there is no such session"""
+        player = self.sessions.get(token)
+        if player is None:
+            return False
+        old_socket = player.client_socket
+        if old_socket is not None:
+            # The old connection is still open (e.g. it died without us noticing) - the new one
+            # wins: the player leaves the game with it, and the driver closes it
+            self.remove_player(player)
+            self.disconnects.append(old_socket)
+        if player.IsAdmin() and self.players.admin is not None:
+            return False
+        player.client_socket = client_socket
+        player.binary = binary
+        self.server.cancel_timer(self.close_timer)
+        self.close_timer = None
+        self.add_player(player)
+
+        self.send_text(player, "ROLE:ADMIN" if player.IsAdmin() else "ROLE:PLAYER")
+        self.send_text(player, f"SESSION:{token}")
+        self.send_text(player, f"SYSTEM:Welcome back, {player.GetName()}! You have {player.GetPoints()} points.")
+        log.info("Player '%s' is back in room %s", player.GetName(), self.pin, extra=SAMPLE_CONNECTIONS)
+        if player.IsAdmin() and self.question_queue:
+            self.send_queue_depth()
+        if self.game_started and not player.IsAdmin():
+            self.send_text(player, "GAME_STARTED")
+            if self.current_question is not None:
+                # The round is still open - they can still answer it
+                frames = (self.current_question.frame, self.current_question.binary_frame)
+                self.outbox.extend((client_socket, frames[player.binary]))
+        return True
+
+    def add_player(self, player):
+        """Put a new or returning player in the game"""
+        self.players.add(player)
+        if not player.IsAdmin():
+            self.columns.add(player)
+            self.leaderboard.add(player)
+        if player.client_socket.__class__ is RelayedClient:
+            # From now on their relay passes this game's broadcasts on to them
+            player.client_socket.joined()
+
+    def send_lobby_update(self):
+        """Announce the players who joined since the last update (also a timer callback)"""
+        self.server.cancel_timer(self.lobby_timer)
+        self.lobby_timer = None
+        joined = self.pending_joins
+        if not joined:
+            return
+        self.pending_joins = []
+        if len(joined) == 1:
+            message = f"SYSTEM:{joined[0]} joined the game!"
+        else:
+            message = f"SYSTEM:+{len(joined)} players joined, {self.players.non_admin_count} total"
+        self.broadcast_to_players(message)
+
+    def start_game(self):
+        """Start the game"""
+        # Announce the last joins before the game starts
+        self.send_lobby_update()
+        self.game_started = True
+        self.server.journal.record("start", self.pin)
+        self.broadcast("GAME_STARTED")
+        log.info("Game in room %s has started! %d players in the game.", self.pin, self.players.non_admin_count)
+        if self.question_queue:
+            # Questions queued before the start: the first one follows the announcement after the pause
+            self.advance_timer = self.server.call_later(self.server.queue_pause, self.auto_next, room=self)
+
+    def send_question(self, message):
+        """Send a question the admin typed to all players"""
+        # Format: QUESTION:question_text|option1|option2|option3|option4|correct_answer
+        try:
+            question = Question.from_message(message)
+        except QuizError as e:
+            log.info("Invalid question in room %s: %s", self.pin, e)
+            self.send_to_admin(f"QUIZ_ERROR:Invalid question: {e}")
+            return
+        self.ask_question(question)
+
+    def load_quiz(self, name):
+        """Switch this room to a quiz file from the server's quiz directory"""
+        try:
+            self.quiz = self.server.get_quiz(name)
+        except (QuizError, OSError) as e:
+            log.info("Room %s could not load quiz '%s': %s", self.pin, name, e)
+            # Just "No such file or directory" etc. - the admin doesn't need the server's paths
+            reason = e.strerror if isinstance(e, OSError) and e.strerror else e
+            self.send_to_admin(f"QUIZ_ERROR:Could not load '{name}': {reason}")
+            return
+        self.quiz_position = 0
+        self.server.journal.record("quiz", self.pin, self.quiz.name)
+        self.send_to_admin(f"QUIZ:{self.quiz.name}|{len(self.quiz)}")
+
+    def queue_question(self, message):
+        """Keep a question the admin typed ahead of time; it goes out by itself after the current round"""
+        if len(self.question_queue) >= MAX_QUEUED_QUESTIONS:
+            self.send_to_admin(f"QUIZ_ERROR:The queue is full ({MAX_QUEUED_QUESTIONS} questions)")
+            return
+        try:
+            question = Question.from_message(message)
+        except QuizError as e:
+            log.info("Invalid question in room %s: %s", self.pin, e)
+            self.send_to_admin(f"QUIZ_ERROR:Invalid question: {e}")
+            return
+        self.question_queue.append(question)
+        self.send_queue_depth()
+        if self.game_started and self.current_correct_answer is None and self.advance_timer is None:
+            # No round is open and nothing is scheduled - no reason to wait
+            self.next_question()
+
+    def send_queue_depth(self):
+        self.send_to_admin(f"QUEUED:{len(self.question_queue)}")
+
+    def next_question(self):
+        """Send the next queued question, or else the next question of the loaded quiz
+        (either one is already parsed and encoded)"""
+        if self.question_queue:
+            question = self.question_queue.popleft()
+            if self.ask_question(question):
+                self.send_queue_depth()
+            else:
+                # Nobody to ask yet - it stays first in line
+                self.question_queue.appendleft(question)
+            return
+        if self.quiz is None:
+            self.send_to_admin("QUIZ_ERROR:No quiz loaded")
+            return
+        if self.quiz_position >= len(self.quiz):
+            self.send_to_admin("QUIZ_END")
+            return
+        try:
+            question = self.quiz.get(self.quiz_position)
+        except QuizError as e:
+            # Only possible for lazily read banks - skip the broken question
+            log.warning("Quiz '%s': %s", self.quiz.name, e)
+            self.quiz_position += 1
+            self.send_to_admin(f"QUIZ_ERROR:Skipped {e}")
+            return
+        # Moved on before asking, so the journal records the position after this question
+        self.quiz_position += 1
+        if not self.ask_question(question):
+            self.quiz_position -= 1
+
+    def ask_question(self, question):
+        """Send a checked Question to all players, returns False if there is nobody to ask"""
+        # Check how many players are in the game (excluding admin)
+        if self.players.non_admin_count == 0:
+            log.warning("No players in room %s! Wait for players to join.", self.pin)
+            # Send error message to admin
+            self.send_to_admin("ROUND_OVER:\n⚠️ No players in the game! Wait for players to join first.\n")
+            return False
+        
+        # Store the correct answer - the frame players get doesn't contain it
+        self.current_correct_answer = question.correct_answer
+        self.current_question = question
+        self.server.journal.record("question", self.pin, question.correct_answer, self.quiz_position)
+        self.columns.clear_answers()
+        self.round_number += 1
+        self.server.cancel_timer(self.advance_timer)
+        self.server.cancel_timer(self.round_timer)
+        self.advance_timer = self.round_timer = None
+        if self.server.metrics.enabled:
+            self.round_started_at = time.perf_counter()
+        if self.server.answer_log.enabled:
+            self.question_asked_at = time.time()
+            self.answer_received.clear()
+        
+        # Only send to non-admin players - the frames were encoded once when the question was created
+        self.send_to_players((question.frame, question.binary_frame))
+        
+        # Timed round: the round closes when the time is up, even if not everyone answered
+        time_limit = question.time_limit or self.server.answer_time
+        if time_limit:
+            self.broadcast_to_players(f"SYSTEM:⏱ You have {time_limit:g} seconds to answer!")
+            self.round_timer = self.server.call_later(time_limit, self.close_round, self.round_number, room=self)
+        
+        log.info("Question sent to %d players in room %s: %s", self.players.non_admin_count, self.pin, question.text)
+        log.debug("Correct answer: %s", self.current_correct_answer)
+        # The list of names is only built when somebody is going to read it
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Waiting for players: %s", [player.GetName() for player in self.players.non_admin_players()])
+        return True
+
+    def close_round(self, round_number):
+        """Timer callback: the answer window is over"""
+        self.round_timer = None
+        if round_number != self.round_number or self.current_correct_answer is None:
+            return
+        log.info("Time is up in room %s: %d/%d players answered", self.pin,
+                 self.columns.answered, self.players.non_admin_count)
+        self.calculate_round_results()
+
+    def auto_next(self):
+        """Timer callback: move on to the next quiz question by itself"""
+        self.advance_timer = None
+        if self.game_started and (self.question_queue or self.quiz is not None):
+            self.next_question()
+
+    def cancel_timers(self):
+        self.server.cancel_timer(self.round_timer)
+        self.server.cancel_timer(self.advance_timer)
+        self.server.cancel_timer(self.lobby_timer)
+        self.server.cancel_timer(self.close_timer)
+        self.round_timer = self.advance_timer = self.lobby_timer = self.close_timer = None
+
+    def calculate_round_results(self):
+        """Calculate results after all players answered (or the time ran out)"""
+        log.debug("Calculating results of room %s...", self.pin)
+        metrics = self.server.metrics
+        if metrics.enabled:
+            scoring_start = time.perf_counter()
+        self.server.cancel_timer(self.round_timer)
+        self.round_timer = None
+        
+        # The whole answers column is compared with the correct answer at once
+        correct, wrong, missing, distribution = self.columns.score_round(self.current_correct_answer)
+        self.leaderboard.update_many(correct)
+        correct_count = len(correct)
+        wrong_count = len(wrong)
+        if self.server.answer_log.enabled:
+            self.export_answers()
+        
+        send = self.outbox.extend
+        # Binary clients get the outcome with their points in a 6-byte RESULT frame
+        for players, text_frame, outcome in ((correct, RESULT_CORRECT, OUTCOME_CORRECT),
+                                             (wrong, RESULT_WRONG, OUTCOME_WRONG),
+                                             (missing, RESULT_NO_ANSWER, OUTCOME_NO_ANSWER)):
+            for player in players:
+                if player.binary:
+                    send((player.client_socket, encode_result(outcome, player.GetPoints())))
+                else:
+                    send((player.client_socket, text_frame))
+        if log.isEnabledFor(logging.DEBUG):
+            for player in correct:
+                log.debug("  ✓ %s answered correctly!", player.GetName(), extra=SAMPLE_ANSWERS)
+            for player in wrong:
+                log.debug("  ✗ %s answered wrong.", player.GetName(), extra=SAMPLE_ANSWERS)
+        
+        round_summary = f"\n--- ROUND RESULTS ---\n"
+        round_summary += f"Correct answers: {correct_count}\n"
+        round_summary += f"Wrong answers: {wrong_count}\n"
+        round_summary += "Answers: " + "  ".join(f"{option}: {count}" for option, count in distribution.items()) + "\n\n"
+        
+        if self.scoreboard == "full":
+            round_summary += "Current Scores:\n"
+            # The leaderboard is already sorted by points (highest first)
+            score_lines = []
+            for player in self.leaderboard:
+                score_lines.append(f"{player.GetName()}: {player.GetPoints()} points\n")
+            round_summary += "".join(score_lines)
+            
+            # Send round summary to everyone
+            self.broadcast(f"ROUND_OVER:{round_summary}")
+        else:
+            self.send_summaries("ROUND_OVER:" + round_summary)
+        
+        # Clear answers for next question
+        self.columns.clear_answers()
+        self.current_correct_answer = None
+        self.current_question = None
+        # Replaying the round's answers gives the same points, so the scores aren't journaled one by one
+        self.server.journal.record("round", self.pin)
+        if metrics.enabled:
+            # Scoring and queueing the results - what the server spends on the end of a round
+            metrics.observe("round.results", time.perf_counter() - scoring_start)
+        if self.round_started_at is not None:
+            metrics.observe("round.duration", time.perf_counter() - self.round_started_at)
+            self.round_started_at = None
+        
+        log.info("Round in room %s complete: %d correct, %d wrong", self.pin, correct_count, wrong_count)
+        
+        if self.game_started and self.question_queue:
+            # The admin queued questions ahead of time: the next one follows after a short pause
+            self.advance_timer = self.server.call_later(self.server.queue_pause, self.auto_next, room=self)
+        # With a quiz loaded, the next question can follow by itself after a pause
+        elif self.quiz is not None and self.server.auto_advance is not None and self.game_started:
+            if self.quiz_position < len(self.quiz):
+                self.advance_timer = self.server.call_later(self.server.auto_advance, self.auto_next, room=self)
+            else:
+                self.send_to_admin("QUIZ_END")
+
+    def export_answers(self):
+        """Hand the scored answers of the round to the answer log, for analytics after the game"""
+        columns = self.columns
+        answers = columns.answers
+        correct_code = answer_code(self.current_correct_answer)
+        pin, round_number, text = self.pin, self.round_number, self.current_question.text
+        asked_at = self.question_asked_at
+        events = []
+        for player, received in self.answer_received.items():
+            # Players who left during the round have no answer any more
+            if player.columns is not columns or answers[player.slot] == NO_ANSWER:
+                continue
+            code = answers[player.slot]
+            events.append((received, pin, round_number, text, player.GetName(),
+                           0 if code == OTHER_ANSWER else code, code == correct_code, received - asked_at))
+        self.answer_received.clear()
+        self.server.answer_log.add(events)
+
+    def handle_answer(self, player, answer):
+        """Handle player's answer"""
+        # Answers only count while a question is open
+        if not player.IsAdmin() and self.current_correct_answer is not None:
+            # Check if all players have answered
+            answered_count = self.columns.record_answer(player, answer)
+            if self.server.journal.enabled:
+                self.server.journal.record_answer(self.pin, player.token, answer)
+            if self.server.answer_log.enabled:
+                self.answer_received[player] = time.time()
+            total_players = self.players.non_admin_count
+            
+            log.debug("%s answered: %s (%d/%d players answered)", player.GetName(), answer,
+                      answered_count, total_players, extra=SAMPLE_ANSWERS)
+            
+            if answered_count == total_players:
+                # All players answered - calculate results
+                self.calculate_round_results()
+
+    def stop_game(self):
+        """Stop the game and show statistics"""
+        self.game_started = False
+        self.current_correct_answer = None
+        self.current_question = None
+        self.question_queue.clear()
+        self.cancel_timers()
+        self.server.journal.record("stop", self.pin)
+        
+        # Players sorted by points (from highest to lowest)
+        sorted_players = self.leaderboard.top(len(self.leaderboard))
+        
+        # Create statistics message
+        stats = "\n" + "="*50 + "\n"
+        stats += "           🎮 GAME OVER 🎮\n"
+        stats += "="*50 + "\n\n"
+        stats += "=== FINAL SCORES ===\n"
+        
+        score_lines = []
+        i = 1
+        for player in sorted_players:
+            score_lines.append(f"{i}. {player.GetName()}: {player.GetPoints()} points\n")
+            i += 1
+        
+        if sorted_players:
+            winner = f"\n🏆 WINNER: {sorted_players[0].GetName()}! 🏆\n"
+        else:
+            winner = "\nNo players participated.\n"
+        
+        if self.scoreboard == "full":
+            # Send the whole scoreboard to everyone
+            self.broadcast(f"GAME_OVER:{stats}{''.join(score_lines)}{winner}\n" + "="*50)
+        else:
+            # Everyone gets the top K and their own final place
+            top_lines = "".join(score_lines[:self.top_k])
+            self.send_summaries(f"GAME_OVER:{stats}{top_lines}{winner}", footer="\n" + "="*50, final=True)
+        
+        # The winner goes to the server log, the whole scoreboard only at DEBUG level
+        log.info("Game in room %s is over, %s", self.pin, winner.strip())
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(stats + "".join(score_lines) + winner + "\n" + "="*50)
+
+    def send_text(self, player, message):
+        """Queue a single protocol message for one player, encoded for their protocol"""
+        if player.binary:
+            self.outbox.extend((player.client_socket, encode_text(message)))
+        else:
+            self.outbox.extend((player.client_socket, encode_frame(message)))
+
+    def send_to_admin(self, message):
+        if self.players.admin:
+            self.send_text(self.players.admin, message)
+
+    def broadcast(self, message):
+        """Send message to everyone in the room"""
+        # Encoded once per protocol, every client's buffer shares the same bytes
+        frames = (encode_frame(message), encode_text(message))
+        send = self.outbox.extend
+        for player in self.players.direct_players():
+            send((player.client_socket, frames[player.binary]))
+        for relay in self.relays:
+            relay.broadcast(frames)
+
+    def broadcast_to_players(self, message):
+        """Send message only to non-admin players"""
+        self.send_to_players((encode_frame(message), encode_text(message)))
+
+    def send_to_players(self, frames):
+        """Send a message encoded for both protocols to the non-admin players"""
+        admin = self.players.admin
+        send = self.outbox.extend
+        for player in self.players.direct_players():
+            if player is not admin:
+                send((player.client_socket, frames[player.binary]))
+        # Relayed players are never the admin
+        for relay in self.relays:
+            relay.broadcast(frames)
+
+    def send_summaries(self, header, footer="", final=False):
+        """Send a scoreboard of fixed size per player: the top K plus the player's own place.
+
+        The shared part is encoded once and the same bytes go to every client;
+        only the short "You: ..." line is built per player. Binary clients get the
+        shared part as one TEXT frame and their place as a RANK frame instead.
+        """
+        total = len(self.leaderboard)
+        if final:
+            shared = header
+        else:
+            top_lines = [f"Top {min(self.top_k, total)} of {total}:\n"]
+            rank = 1
+            for player in self.leaderboard.top(self.top_k):
+                top_lines.append(f"{rank}. {player.GetName()}: {player.GetPoints()} points\n")
+                rank += 1
+            shared = header + "".join(top_lines)
+        shared_bytes = shared.encode()
+        footer_bytes = footer.encode()
+        binary_shared = encode_text(shared + footer)
+        # Relays get the shared part once and put it in front of each of their players' own part
+        for relay in self.relays:
+            relay.send_shared(shared_bytes)
+            if not final:
+                relay.broadcast((b"", binary_shared))
+
+        send = self.outbox.extend
+        # Walking the leaderboard in order gives every player's rank without a lookup
+        rank = 0
+        for player in self.leaderboard:
+            rank += 1
+            points = player.GetPoints()
+            previous = self.previous_places.get(player)
+            self.previous_places[player] = (rank, points)
+            relayed = player.client_socket.__class__ is RelayedClient
+            if player.binary:
+                if previous is None or final:
+                    previous = (0, 0)
+                rank_frame = encode_rank(rank, total, points, previous[0], previous[1], final)
+                if relayed:
+                    # The shared part goes to the relay's binary players in one ALL message
+                    send((player.client_socket, rank_frame))
+                    continue
+                # GAME_OVER ends the game for the client, so the final place goes first
+                if final:
+                    send((player.client_socket, rank_frame))
+                    send((player.client_socket, binary_shared))
+                else:
+                    send((player.client_socket, binary_shared))
+                    send((player.client_socket, rank_frame))
+                continue
+
+            personal = f"\nYou: #{rank} of {total} with {points} points"
+            if previous is not None and not final:
+                previous_rank, previous_points = previous
+                change = []
+                if points != previous_points:
+                    change.append(f"{points - previous_points:+} points")
+                if rank < previous_rank:
+                    change.append(f"up {previous_rank - rank}")
+                elif rank > previous_rank:
+                    change.append(f"down {rank - previous_rank}")
+                if change:
+                    personal += f" ({', '.join(change)})"
+            personal_bytes = (personal + "\n").encode() + footer_bytes
+            if relayed:
+                player.client_socket.queue_summary(personal_bytes)
+                continue
+
+            send((player.client_socket, frame_prefix(len(shared_bytes) + len(personal_bytes))))
+            send((player.client_socket, shared_bytes))
+            send((player.client_socket, personal_bytes))
+
+        if final:
+            # GAME_OVER ends the game for binary clients, so it follows their RANK frames
+            for relay in self.relays:
+                relay.broadcast((b"", binary_shared))
+
+        # The admin gets only the shared part
+        admin = self.players.admin
+        if admin:
+            if admin.binary:
+                shared_frame = binary_shared
+            else:
+                shared_frame = frame_prefix(len(shared_bytes) + len(footer_bytes)) + shared_bytes + footer_bytes
+            send((admin.client_socket, shared_frame))
+
+    def remove_player(self, player):
+        """A player disconnected: their session (and points) stay for RESUME"""
+        self.players.remove(player)
+        self.leaderboard.remove(player)
+        self.columns.remove(player)
+        player.client_socket = None
+        if self.current_correct_answer is not None and not player.IsAdmin():
+            # Their answer was dropped with their slot - a recovery must not score it either
+            self.server.journal.record("leave", self.pin, player.token)
+            # The round must not wait for someone who left. Checked from the loop, not in the
+            # middle of whatever noticed the disconnect.
+            self.server.call_later(0, self.close_round_if_complete, self.round_number, room=self)
+
+    def close_round_if_complete(self, round_number):
+        """Timer callback: close the round if everyone still here has answered"""
+        if round_number != self.round_number or self.current_correct_answer is None:
+            return
+        if self.columns.answered >= self.players.non_admin_count:
+            log.info("Round in room %s: everyone left answered (%d players)", self.pin, self.columns.answered)
+            self.calculate_round_results()
+
+    def journal_state(self):
+        """This room in the journal's snapshot format (see Journal.apply_record)"""
+        # A snapshot can be taken in the middle of a round: the answers so far go in with it,
+        # so the "round" record after the snapshot scores them (a restart still drops the round)
+        answers = {}
+        if self.current_correct_answer is not None:
+            columns = self.columns
+            for code in OPTIONS + (OTHER_ANSWER,):
+                for slot in columns.slots_with(code):
+                    token = columns.players[slot].token
+                    if token is not None:
+                        answers[token] = str(code)
+        return {"started": self.game_started, "quiz": self.quiz.name if self.quiz else None,
+                "quiz_position": self.quiz_position, "round": self.round_number,
+                "correct": self.current_correct_answer, "answers": answers,
+                "sessions": {token: [player.GetName(), player.GetPoints(), player.IsAdmin()]
+                             for token, player in self.sessions.items()}}
+
+    def restore(self, state):
+        """Take over a room's state recovered from the journal (every player is disconnected)"""
+        self.game_started = state["started"]
+        self.round_number = state["round"]
+        if state["quiz"]:
+            try:
+                self.quiz = self.server.get_quiz(state["quiz"])
+                self.quiz_position = state["quiz_position"]
+            except (QuizError, OSError) as e:
+                log.warning("Room %s: could not reload quiz '%s': %s", self.pin, state["quiz"], e)
+        for token, (name, points, admin) in state["sessions"].items():
+            player = Player(name, points, admin, None, None)
+            player.token = token
+            self.sessions[token] = player
@@ -0,0 +1,91 @@
+import heapq
+import itertools
+import time
+
+class Timer:
+    """A scheduled call, returned by Scheduler.call_later so it can be cancelled"""
+    __slots__ = ("when", "callback", "args", "cancelled")
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """Deadlines for the server loop, kept in a heap ordered by due time.
+
+    The loop asks next_timeout() how long it may sleep in select(), so it wakes up
+    exactly when the next timer is due instead of polling. Adding a timer is
+    O(log n); cancelling only marks it, and cancelled timers are thrown away when
+    they reach the top of the heap (or all at once if they pile up).
+    """
+
+    def __init__(self, clock=time.monotonic):
+        # Where "now" comes from (a replay runs the timers on the recording's clock instead)
+        self.clock = clock
+        # (when, sequence number, Timer) - the number keeps timers with the same deadline in order
+        self.heap = []
+        self.counter = itertools.count()
+        self.cancelled_count = 0
+
+    def __len__(self):
+        return len(self.heap) - self.cancelled_count
+
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) from the server loop after delay seconds"""
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def call_at(self, when, callback, *args):
+        timer = Timer(when, callback, args)
+        heapq.heappush(self.heap, (when, next(self.counter), timer))
+        return timer
+
+    def cancel(self, timer):
+        if timer is None or timer.cancelled:
+            return
+        timer.cancel()
+        self.cancelled_count += 1
+        # Rebuild the heap when most of it is cancelled timers - in place, a callback in
+        # run_due() can cancel timers while it is working on the same list
+        heap = self.heap
+        if self.cancelled_count > 64 and self.cancelled_count > len(heap) // 2:
+            heap[:] = [entry for entry in heap if not entry[2].cancelled]
+            heapq.heapify(heap)
+            self.cancelled_count = 0
+
+    def drop_cancelled(self):
+        """Remove cancelled timers from the top of the heap"""
+        while self.heap and self.heap[0][2].cancelled:
+            heapq.heappop(self.heap)
+            self.cancelled_count -= 1
+
+    def next_timeout(self, now=None):
+        """Seconds until the next timer is due (0 if one is overdue), None if there are no timers"""
+        self.drop_cancelled()
+        if not self.heap:
+            return None
+        if now is None:
+            now = self.clock()
+        return max(0.0, self.heap[0][0] - now)
+
+    def run_due(self, now=None):
+        """Run every timer whose deadline has passed, returns how many ran"""
+        if now is None:
+            now = self.clock()
+        ran = 0
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            timer = heapq.heappop(heap)[2]
+            if timer.cancelled:
+                self.cancelled_count -= 1
+                continue
+            # Marked so that a late cancel() from the callback's owner doesn't count it twice
+            timer.cancelled = True
+            timer.callback(*timer.args)
+            ran += 1
+        return ran
@@ -1,61 +1,371 @@
+import argparse
+import atexit
+import os
+import random
+import secrets
 import select
+import selectors
 import socket
-from Player import Player
+import time
+from AnswerLog import AnswerLog, NullAnswerLog
+from BinaryProtocol import BinaryDecoder, encode_text, ANSWERS
+from Connection import Connection
+from FrameDecoder import encode_frame
+from Journal import Journal, NullJournal
+from Metrics import Metrics, NullMetrics
+from QuizBank import QuizBank, QuizError
+from Recorder import TrafficRecorder, NullRecorder
+from RelayProtocol import RelayLink, RelayedClient
+from Room import Room, DEFAULT_PIN
+from Scheduler import Scheduler
+from ServerLog import log, setup_logging, dropped_records, SAMPLE_CONNECTIONS, SAMPLE_MESSAGES
+
+# Heartbeat for both protocols, encoded once
+PING_FRAMES = (encode_frame("PING"), encode_text("PING"))
 
 class my_server:
-    def __init__(self, port):
-        self.server_socket = socket.socket()
-        self.server_socket.bind(('', port))
-        self.server_socket.listen()
-        self.players = []
+    def __init__(self, port, engine="selectors", high_watermark=64 * 1024, low_watermark=16 * 1024,
+                 max_output_buffer=1024 * 1024, slow_timeout=10.0, scoreboard="summary", top_k=10,
+                 shard_index=0, shard_count=1, handoff_socket=None, metrics=False, metrics_port=None,
+                 quiz=None, quiz_dir="quizzes", answer_time=None, auto_advance=None, queue_pause=3.0,
+                 backlog=1024, max_connections=None, lobby_interval=0.5,
+                 journal_dir=None, journal_interval=0.05, session_timeout=300.0,
+                 heartbeat_interval=15.0, idle_timeout=60.0, relay_buffer=64 * 1024 * 1024,
+                 record_file=None, answer_log=None, answer_log_format="jsonl"):
+        self.engine = engine
+        # Connections the kernel may queue while the loop is busy, and the most clients
+        # this process serves at once (None = no limit) - clients above it get SERVER_FULL
+        self.backlog = backlog
+        self.max_connections = max_connections
+        # Worker processes of a sharded server don't listen themselves (port=None):
+        # the router process hands them connections through handoff_socket.
+        self.server_socket = None
+        if port is not None:
+            self.server_socket = socket.socket()
+            self.server_socket.bind(('', port))
+            self.server_socket.listen(backlog)
+            # Non-blocking, so handle_new_connection can accept until the queue is empty
+            self.server_socket.setblocking(False)
+        self.handoff_socket = handoff_socket
+        # Latency histograms and counters. Turned off by default: NullMetrics does nothing,
+        # and the hot paths check metrics.enabled before they even read the clock.
+        self.metrics = Metrics() if metrics or metrics_port else NullMetrics()
+        # Local plain-text metrics page (http://127.0.0.1:<metrics_port>/), only reachable from this machine
+        self.metrics_socket = None
+        if metrics_port:
+            self.metrics_socket = socket.socket()
+            self.metrics_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.metrics_socket.bind(('127.0.0.1', metrics_port))
+            self.metrics_socket.listen()
+        # Persistent registrations (epoll on Linux, kqueue on BSD/macOS).
+        # Sockets are added once in handle_new_connection and removed in remove_client,
+        # so there is no per-tick list to rebuild and no FD_SETSIZE (1024) limit.
+        # The asyncio engine has its own event loop and doesn't need one.
+        self.selector = None
+        if engine != "asyncio":
+            self.selector = selectors.DefaultSelector()
+            if self.server_socket:
+                self.selector.register(self.server_socket, selectors.EVENT_READ)
+            if self.handoff_socket:
+                self.selector.register(self.handoff_socket, selectors.EVENT_READ)
+            if self.metrics_socket:
+                self.selector.register(self.metrics_socket, selectors.EVENT_READ)
         self.clients = []
-        self.game_started = False
-        self.waiting_for_answers = {}
-        self.current_correct_answer = None
+        # Messages waiting to be delivered, in the order they were produced. The list is flat -
+        # client socket, bytes, client socket, bytes ... - because a tuple per message that lives
+        # until the delivery keeps the garbage collector busy. Rooms (the game core) fill their
+        # own outboxes; collect() moves them here after each event, deliver() hands the
+        # messages to the connections.
+        self.outbox = []
+        # Games hosted by this process (PIN -> Room) and the room each client joined
+        self.rooms = {}
+        self.room_of = {}
+        # With several worker processes, this one owns the PINs where pin % shard_count == shard_index
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        # Per-client output buffers (socket -> Connection) and the sockets that still have unsent data
+        self.connections = {}
+        self.pending_writes = set()
+        # Clients that negotiated the binary protocol (PROTO:BINARY)
+        self.binary_clients = set()
+        # Relay nodes (RELAY:<pin>): link socket -> RelayLink. A relay carries many clients over
+        # one connection, so it may have up to relay_buffer bytes unsent before it counts as too slow.
+        self.relays = {}
+        self.relay_buffer = relay_buffer
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.max_output_buffer = max_output_buffer
+        self.slow_timeout = slow_timeout
+        # Scoreboard settings for new rooms
+        self.scoreboard = scoreboard
+        self.top_k = top_k
+        # Loaded quiz files (absolute path -> QuizBank), shared by all rooms playing them.
+        # Admins can load files from quiz_dir with LOAD_QUIZ:<file name>; new rooms start with quiz.
+        self.quiz_banks = {}
+        self.quiz_dir = quiz_dir
+        self.default_quiz_path = quiz
+        self.default_quiz = self.load_quiz_file(quiz) if quiz else None
+        # Timed rounds: seconds players get to answer (None = wait for everyone) and the
+        # pause before a quiz moves on to its next question by itself (None = admin sends NEXT)
+        self.answer_time = answer_time
+        self.auto_advance = auto_advance
+        # Pause between a round's results and the next question the admin queued (QUEUE:)
+        self.queue_pause = queue_pause
+        # Joins are announced to the lobby at most once per lobby_interval seconds (0 = every join at once)
+        self.lobby_interval = lobby_interval
+        # Deadlines (answer windows, auto-advance) - the loop sleeps until the next one is due
+        self.scheduler = Scheduler()
+        # Heartbeats: a client that sent nothing for heartbeat_interval seconds gets a PING
+        # (answered with PONG), one silent for idle_timeout seconds is dropped - this is how
+        # half-open connections are noticed. One timer checks every client (0 = off).
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        # socket -> time.monotonic() of the last data from it
+        self.last_seen = {}
+        if heartbeat_interval and idle_timeout:
+            self.call_later(heartbeat_interval, self.check_heartbeats)
+        # Seconds a room without connected players waits for someone to come back before it closes
+        self.session_timeout = session_timeout
+        # Journal of game events (--journal): the games survive a crash or restart of the server
+        self.journal = NullJournal()
+        if journal_dir:
+            self.journal = Journal(journal_dir, self.call_later, journal_interval)
+            self.restore_rooms(self.journal.recover())
+            self.journal.state_provider = self.journal_state
+            # Compact right away: the next restart starts from this snapshot
+            self.journal.snapshot(self.journal_state())
+        # Traffic recording (--record): every received message with its time, for Replay.py
+        self.recorder = NullRecorder()
+        if record_file:
+            self.recorder = TrafficRecorder(record_file, self.call_later, self.game_options())
+            atexit.register(self.recorder.flush)
+        # Answer export (--answer-log): every scored answer, written by a background thread
+        self.answer_log = NullAnswerLog()
+        if answer_log:
+            self.answer_log = AnswerLog(answer_log, self.call_later, answer_log_format)
+            atexit.register(self.answer_log.close)
 
     def run_server(self):
-        print("Kahoot Server is now listening...")
+        if self.engine == "select":
+            self.run_select_loop()
+        else:
+            self.run_selector_loop()
+
+    def run_selector_loop(self):
+        """Main loop using the persistent selectors registrations"""
+        log.info("Kahoot Server (selectors engine) is now listening...")
+
+        metrics = self.metrics
+        while True:
+            # We sleep until a registered socket is ready or the next timer is due - no polling
+            timeout = self.loop_timeout()
+            if metrics.enabled:
+                idle_start = time.perf_counter()
+            ready = self.selector.select(timeout)
+            if metrics.enabled:
+                busy_start = time.perf_counter()
+                metrics.add("loop.idle_seconds", busy_start - idle_start)
+            for key, events in ready:
+                if key.fileobj == self.server_socket:
+                    self.handle_new_connection()
+                    continue
+                if key.fileobj == self.handoff_socket:
+                    self.receive_handoff()
+                    continue
+                if key.fileobj == self.metrics_socket:
+                    self.handle_metrics_request()
+                    continue
+                if events & selectors.EVENT_READ:
+                    self.handle_request(key.fileobj)
+                if events & selectors.EVENT_WRITE and key.fileobj in self.connections:
+                    self.pending_writes.add(key.fileobj)
+
+            self.scheduler.run_due()
+            self.flush_pending()
+            if metrics.enabled:
+                # Time spent handling the sockets select() returned (idle time is not included)
+                busy = time.perf_counter() - busy_start
+                metrics.add("loop.busy_seconds", busy)
+                metrics.observe("loop.iteration", busy)
+
+        if self.server_socket:
+            self.server_socket.close()
+
+    def run_select_loop(self):
+        """Classic select.select() loop, kept for comparison with the selectors engine"""
+        log.info("Kahoot Server (select engine) is now listening...")
 
         while True:
             ready_to_read = self.clients + [self.server_socket]
+            if self.metrics_socket:
+                ready_to_read.append(self.metrics_socket)
             # We use select.select here to efficiently wait/until network sockets are ready for reading,
             # without blocking the whole server forever.
             # Arguments:
             #   - ready_to_read: the list of sockets we want to check for incoming data (clients + the server socket)
             #   - []: we don't care about sockets ready for writing right now
             #   - []: we don't care about sockets with errors right now
-            #   - 0.1: timeout in seconds -- so the server tick loops every 0.1s if nothing happens (non-blocking)
+            #   - timeout: seconds until the next timer is due (None = wait until a socket is ready)
             # select.select returns 3 lists; we only care about the first: readable sockets, so we grab [0].
-            readable_sockets = select.select(ready_to_read, [], [], 0.1)[0]
+            # Sockets with data still waiting in their output buffer are checked for writing too.
+            readable_sockets = select.select(ready_to_read, list(self.pending_writes), [], self.loop_timeout())[0]
 
             for socket_with_data in readable_sockets:
                 if socket_with_data == self.server_socket:
                     self.handle_new_connection()
+                elif socket_with_data == self.metrics_socket:
+                    self.handle_metrics_request()
                 else:
                     self.handle_request(socket_with_data)
 
+            self.scheduler.run_due()
+            self.flush_pending()
+
         self.server_socket.close()
 
+    def loop_timeout(self):
+        """How long the loop may sleep: until the next timer is due.
+
+        While someone has unsent data we wake up at least once a second to check for slow clients.
+        """
+        timeout = self.scheduler.next_timeout()
+        if self.pending_writes and (timeout is None or timeout > 1.0):
+            timeout = 1.0
+        return timeout
+
+    def check_heartbeats(self):
+        """Timer callback: PING quiet clients, drop the ones that stayed silent too long"""
+        self.call_later(self.heartbeat_interval, self.check_heartbeats)
+        now = time.monotonic()
+        expired = []
+        for client_socket, last_seen in list(self.last_seen.items()):
+            idle = now - last_seen
+            if idle >= self.idle_timeout:
+                expired.append(client_socket)
+            elif idle >= self.heartbeat_interval:
+                self.send_bytes(client_socket, PING_FRAMES[client_socket in self.binary_clients])
+        for client_socket in expired:
+            player = self.find_player_by_socket(client_socket)
+            log.info("Dropping %s: silent for %d seconds", f"player '{player.GetName()}'" if player else "a client",
+                     now - self.last_seen[client_socket], extra=SAMPLE_CONNECTIONS)
+            self.metrics.add("connections.timed_out")
+            self.remove_client(client_socket)
+
+    def game_options(self):
+        """The settings that change how games play out - a replay of a recording needs the same ones"""
+        return dict(scoreboard=self.scoreboard, top_k=self.top_k, quiz=self.default_quiz_path,
+                    quiz_dir=self.quiz_dir, answer_time=self.answer_time, auto_advance=self.auto_advance,
+                    queue_pause=self.queue_pause,
+                    lobby_interval=self.lobby_interval, session_timeout=self.session_timeout)
+
+    def journal_state(self):
+        """The state of every room, for journal snapshots"""
+        return {pin: room.journal_state() for pin, room in self.rooms.items()}
+
+    def restore_rooms(self, rooms):
+        """Rebuild the rooms recovered from the journal; their players can come back with RESUME"""
+        for pin, state in rooms.items():
+            room = self.get_room(pin)
+            room.restore(state)
+            self.close_room_later(room)
+        if rooms:
+            log.info("Restored %d rooms with %d player sessions", len(rooms),
+                     sum(len(room.sessions) for room in self.rooms.values()))
+
+    def call_later(self, delay, callback, *args, room=None):
+        """Run callback(*args) in the server loop after delay seconds, returns a handle for cancel_timer.
+
+        A room's timers pass the room: the timer is an event like a message, and what the
+        room produced is collected after it.
+        """
+        return self.scheduler.call_later(delay, self.run_timer, room, callback, args)
+
+    def run_timer(self, room, callback, args):
+        callback(*args)
+        if room is not None:
+            self.collect(room)
+
+    def cancel_timer(self, timer):
+        self.scheduler.cancel(timer)
+
     def handle_new_connection(self):
-        """Handle new client connections"""
-        client_socket, addr = self.server_socket.accept()
+        """Accept every connection that is waiting, not just one per wakeup"""
+        while True:
+            try:
+                client_socket, addr = self.server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                # E.g. out of file descriptors - the rest stay queued until the next wakeup
+                log.warning("Could not accept a connection: %s", e)
+                return
+            if self.is_full():
+                self.reject_client(client_socket)
+                continue
+            self.add_client(client_socket)
+            self.metrics.add("connections.accepted")
+
+            # Ask for name
+            self.send_to(client_socket, "NAME_REQUEST")
+            log.debug("New client connected from %s", addr, extra=SAMPLE_CONNECTIONS)
+
+    def is_full(self):
+        return self.max_connections is not None and len(self.clients) >= self.max_connections
+
+    def reject_client(self, client_socket):
+        """Turn away a client above max_connections"""
+        self.metrics.add("connections.rejected")
+        log.warning("Connection limit of %d reached, rejecting a client", self.max_connections,
+                    extra=SAMPLE_CONNECTIONS)
+        try:
+            client_socket.setblocking(False)
+            client_socket.send(b"SERVER_FULL\n")
+        except OSError:
+            pass
+        client_socket.close()
+
+    def add_client(self, client_socket):
+        """Start serving an accepted client socket"""
+        # Client sockets are non-blocking: all writes go through the per-client Connection buffer
+        client_socket.setblocking(False)
         self.clients.append(client_socket)
-        
-        # Ask for name
-        client_socket.send("NAME_REQUEST\n".encode())
-        print(f"New client connected from {addr}")
+        self.last_seen[client_socket] = time.monotonic()
+        self.connections[client_socket] = Connection(client_socket, self.high_watermark,
+                                                     self.low_watermark, self.max_output_buffer)
+        self.selector.register(client_socket, selectors.EVENT_READ)
+        self.recorder.connected(client_socket)
+
+    def receive_handoff(self):
+        """Adopt a connection the router process passed to this worker"""
+        # The router already sent NAME_REQUEST; data is everything it read from the client so far
+        data, fds, flags, addr = socket.recv_fds(self.handoff_socket, 65536, 1)
+        if not fds:
+            log.warning("Router process is gone, shutting down worker")
+            raise SystemExit(0)
+        client_socket = socket.socket(fileno=fds[0])
+        if self.is_full():
+            self.reject_client(client_socket)
+            return
+        self.add_client(client_socket)
+        self.handle_data(client_socket, data)
 
     def find_player_by_socket(self, client_socket):
         """Find player by their socket"""
-        for player in self.players:
-            if player.client_socket == client_socket:
-                return player
-        return None
+        room = self.room_of.get(client_socket)
+        if room is None:
+            return None
+        return room.players.find_by_socket(client_socket)
 
     def handle_request(self, client_socket):
         """Handle messages from clients"""
+        connection = self.connections.get(client_socket)
+        if connection is None:
+            return
+
         try:
-            data = client_socket.recv(1024).decode()
+            data = client_socket.recv(65536)
+        except BlockingIOError:
+            return
         except:
             data = None
 
@@ -64,270 +374,545 @@ class my_server:
             self.remove_client(client_socket)
             return
 
-        # Handle multiple messages separated by newlines
-        messages = data.strip().split('\n') # strip - מוחק רווחים  split - מחלק לשורות את הרווחים
-        
-        for message in messages:
-            message = message.strip()
-            if not message:
-                continue
-            
-            print(f"Received message: '{message}' from client")
-                
-            player = self.find_player_by_socket(client_socket)
-            
-            # If player doesn't exist yet, this is their name
-            if player is None:
-                self.register_player(client_socket, message)
-                continue
+        self.metrics.add("bytes_in", len(data))
+        self.handle_data(client_socket, data)
+
+    def handle_data(self, client_socket, data):
+        """Decode received bytes and handle every complete message"""
+        connection = self.connections[client_socket]
+        # The decoder keeps any incomplete message until the rest of it arrives
+        try:
+            messages = connection.decoder.feed(data)
+        except ValueError as e:
+            log.warning("Protocol error from client: %s", e)
+            self.remove_client(client_socket)
+            return
+
+        self.handle_messages(client_socket, messages)
 
-            # Handle different message types
-            if message.startswith("START_GAME") and player.IsAdmin():
-                self.start_game()
-            elif message.startswith("QUESTION:") and player.IsAdmin():
-                self.send_question(message)
-            elif message.startswith("STOP_GAME") and player.IsAdmin():
-                self.stop_game()
-            elif message.isdigit() and self.game_started:
-                # Player answered a question
-                print(f"Detected answer: {message} from {player.GetName()}")
-                self.handle_answer(player, message)
+    def handle_messages(self, client_socket, messages):
+        """Handle decoded messages: text lines and, from binary clients, 1-byte answers.
+
+        Returns False if the client was disconnected for sending something invalid.
+        """
+        self.last_seen[client_socket] = time.monotonic()
+        if self.recorder.enabled:
+            self.recorder.messages(client_socket, messages)
+        if self.relays and client_socket in self.relays:
+            self.handle_relay_messages(self.relays[client_socket], messages)
+            return True
+        for message in messages:
+            if message.__class__ is str:
+                self.process_message(client_socket, message)
+            elif message.__class__ is int:
+                self.process_answer(client_socket, message)
             else:
-                print(f"Unknown message type: '{message}'")
+                # Questions, results and ranks only go from the server to clients
+                log.warning("Protocol error from client: unexpected binary frame 0x%02x", message[0])
+                self.remove_client(client_socket)
+                return False
+        return True
 
-    def register_player(self, client_socket, name):
-        """Register a new player with their name"""
-        is_admin = len(self.players) == 0
-        player = Player(name, 0, is_admin, client_socket, None)
-        self.players.append(player)
-        
-        if is_admin:
-            client_socket.send("ROLE:ADMIN\n".encode())
-            print(f"Player '{name}' joined as ADMIN")
-        else:
-            client_socket.send("ROLE:PLAYER\n".encode())
-            print(f"Player '{name}' joined as PLAYER")
-            # Notify only non-admin players about new player
-            self.broadcast_to_players(f"SYSTEM:{name} joined the game!")
-
-    def start_game(self):
-        """Start the game"""
-        self.game_started = True
-        self.broadcast("GAME_STARTED")
-        non_admin_count = 0
-        for p in self.players:
-            if not p.IsAdmin():
-                non_admin_count += 1
-        print(f"Game has started! {non_admin_count} players in the game.")
-
-    def send_question(self, message):
-        """Send question to all players"""
-        # Format: QUESTION:question_text|option1|option2|option3|option4|correct_answer
-        # We split the message only at the first ":" using split(":", 1)
-        # This handles cases where ":" may appear in the question text.
-        # The result is a list: [prefix, the_rest], so [1] extracts everything after the first ":".
-        question_data = message.split(":", 1)[1]
-        parts = question_data.split("|")
-        
-        if len(parts) == 6:
-            # Check how many players are in the game (excluding admin)
-            non_admin_players = []
-            for p in self.players:
-                if not p.IsAdmin():
-                    non_admin_players.append(p)
-            
-            if len(non_admin_players) == 0:
-                print("ERROR: No players in the game! Wait for players to join.")
-                # Send error message to admin
-                admin = None
-                for p in self.players:
-                    if p.IsAdmin():
-                        admin = p
-                        break
-                admin.client_socket.send("ROUND_OVER:\n⚠️ No players in the game! Wait for players to join first.\n\n".encode())
+    def handle_relay_messages(self, link, messages):
+        """Handle the lines a relay sent on behalf of its clients (see RelayProtocol)"""
+        for message in messages:
+            if message.startswith("ANSWERS:"):
+                self.process_relayed_answers(link, message[8:])
+            elif message.startswith("CLOSE:"):
+                # Forgotten first, so the relay isn't told to drop a client it already closed
+                client = link.clients.pop(message[6:], None)
+                if client is not None:
+                    self.remove_client(client)
+            elif message != "PONG":
+                client_id, separator, text = message.partition(":")
+                if not separator:
+                    log.warning("Protocol error from relay: '%s'", message)
+                    continue
+                client = link.client(client_id)
+                if client is None:
+                    # A new client of the relay - it can only play in the relay's game
+                    client = link.add_client(client_id)
+                    self.room_of[client] = link.room
+                self.process_message(client, text)
+            if link.closed:
                 return
-            
-            # Extract correct answer and store it
-            self.current_correct_answer = parts[5]
-            # Send question without the answer to players
-            question_to_send = "|".join(parts[0:5])
-            self.waiting_for_answers = {}
-            
-            # Only send to non-admin players
-            for player in non_admin_players:
-                try:
-                    player.client_socket.send(f"QUESTION:{question_to_send}\n".encode())
-                except:
-                    pass
-            
-            print(f"Question sent to {len(non_admin_players)} players: {parts[0]}")
-            print(f"Correct answer: {self.current_correct_answer}")
-            waiting_names = []
-            for p in non_admin_players:
-                waiting_names.append(p.GetName())
-            print(f"Waiting for players: {waiting_names}")
-
-
-    def calculate_round_results(self):
-        """Calculate results after all players answered"""
-        print("\nAll players answered! Calculating results...")
-        
-        correct_count = 0
-        wrong_count = 0
-        
-        # Check each player's answer
-        for player in self.players:
-            if player.IsAdmin():
-                continue
-            
-            if player.client_socket in self.waiting_for_answers:
-                player_answer = self.waiting_for_answers[player.client_socket]
-                
-                if player_answer == self.current_correct_answer:
-                    player.AddPoint()
-                    player.client_socket.send("RESULT:✓ Correct! +1 point\n".encode())
-                    print(f"  ✓ {player.GetName()} answered correctly!")
-                    correct_count += 1
-                else:
-                    player.client_socket.send("RESULT:✗ Wrong answer!\n".encode())
-                    print(f"  ✗ {player.GetName()} answered wrong.")
-                    wrong_count += 1
-        
-        round_summary = f"\n--- ROUND RESULTS ---\n"
-        round_summary += f"Correct answers: {correct_count}\n"
-        round_summary += f"Wrong answers: {wrong_count}\n\n"
-        round_summary += "Current Scores:\n"
-        
-        # Sort players by points (from highest to lowest)
-        # First, collect all non-admin players
-        non_admin_players = []
-        for p in self.players:
-            if not p.IsAdmin():
-                non_admin_players.append(p)
-        
-        # Sort using manual comparison - bubble sort
-        sorted_players = non_admin_players.copy()
-        for i in range(len(sorted_players)):
-            for j in range(i + 1, len(sorted_players)):
-                # If player at position i has fewer points than player at position j, swap them
-                if sorted_players[i].GetPoints() < sorted_players[j].GetPoints():
-                    # Swap the players
-                    temp = sorted_players[i]
-                    sorted_players[i] = sorted_players[j]
-                    sorted_players[j] = temp
-        
-        for player in sorted_players:
-            round_summary += f"{player.GetName()}: {player.GetPoints()} points\n"
-        
-        # Send round summary to everyone
-        self.broadcast(f"ROUND_OVER:{round_summary}")
-        
-        # Clear answers for next question
-        self.waiting_for_answers = {}
-        self.current_correct_answer = None
-        
-        print("Round complete!\n")
-
-    def handle_answer(self, player, answer):
-        """Handle player's answer"""
-        if not player.IsAdmin():
-            self.waiting_for_answers[player.client_socket] = answer
-            print(f"{player.GetName()} answered: {answer}")
-            
-            # Check if all players have answered
-            non_admin_players = []
-            for p in self.players:
-                if not p.IsAdmin():
-                    non_admin_players.append(p)
-            answered_count = len(self.waiting_for_answers)
-            total_players = len(non_admin_players)
-            
-            print(f"Progress: {answered_count}/{total_players} players answered")
-            
-            if answered_count == total_players:
-                # All players answered - calculate results
-                print("All players have answered! Calculating results...")
-                self.calculate_round_results()
-            else:
-                print(f"Still waiting for {total_players - answered_count} more players...")
 
-    def stop_game(self):
-        """Stop the game and show statistics"""
-        self.game_started = False
-        
-        # Sort players by points (from highest to lowest)
-        # First, collect all non-admin players
-        non_admin_players = []
-        for p in self.players:
-            if not p.IsAdmin():
-                non_admin_players.append(p)
-        
-        # Sort using manual comparison - bubble sort
-        sorted_players = non_admin_players.copy()
-        for i in range(len(sorted_players)):
-            for j in range(i + 1, len(sorted_players)):
-                # If player at position i has fewer points than player at position j, swap them
-                if sorted_players[i].GetPoints() < sorted_players[j].GetPoints():
-                    # Swap the players
-                    temp = sorted_players[i]
-                    sorted_players[i] = sorted_players[j]
-                    sorted_players[j] = temp
-        
-        # Create statistics message
-        stats = "\n" + "="*50 + "\n"
-        stats += "           🎮 GAME OVER 🎮\n"
-        stats += "="*50 + "\n\n"
-        stats += "=== FINAL SCORES ===\n"
+    def process_relayed_answers(self, link, answers):
+        """Handle a batch of answers from a relay: <id>=<answer>,<id>=<answer>,..."""
+        room = link.room
+        if not room.game_started:
+            return
+        if self.metrics.enabled:
+            start = time.perf_counter()
+        clients = link.clients
+        find_player = room.players.find_by_socket
+        for answer in answers.split(","):
+            client_id, _, answer = answer.partition("=")
+            player = find_player(clients.get(client_id))
+            if player is not None and answer.isdigit():
+                room.handle_answer(player, answer)
+        self.collect(room)
+        if self.metrics.enabled:
+            self.metrics.observe("message.ANSWERS", time.perf_counter() - start)
+
+    def process_answer(self, client_socket, option):
+        """Handle a binary answer (option 1-4) - no text to strip or parse"""
+        room = self.room_of.get(client_socket)
+        player = room.players.find_by_socket(client_socket) if room else None
+        if player is None or not room.game_started:
+            return
+        log.debug("Received answer %d from client", option, extra=SAMPLE_MESSAGES)
+        if not self.metrics.enabled:
+            room.handle_answer(player, ANSWERS[option])
+            self.collect(room)
+            return
+        start = time.perf_counter()
+        room.handle_answer(player, ANSWERS[option])
+        self.collect(room)
+        self.metrics.observe("message.ANSWER", time.perf_counter() - start)
+
+    def enable_binary(self, client_socket):
+        """Switch a client to the binary protocol (it asked with PROTO:BINARY)"""
+        # The answer is the last text line this client gets
+        self.send_to(client_socket, "PROTO:BINARY")
+        self.binary_clients.add(client_socket)
+        connection = self.connections.get(client_socket)
+        if connection:
+            connection.decoder = BinaryDecoder()
+
+    def process_message(self, client_socket, message):
+        """Handle a single protocol line from a client (shared by every server engine)"""
+        message = message.strip()
+        if not message:
+            return
         
-        i = 1
-        for player in sorted_players:
-            stats += f"{i}. {player.GetName()}: {player.GetPoints()} points\n"
-            i += 1
+        log.debug("Received message: '%s' from client", message, extra=SAMPLE_MESSAGES)
+
+        if not self.metrics.enabled:
+            self.dispatch_message(client_socket, message)
+            room = self.room_of.get(client_socket)
+            if room is not None:
+                self.collect(room)
+            return
+        start = time.perf_counter()
+        message_type = self.dispatch_message(client_socket, message)
+        room = self.room_of.get(client_socket)
+        if room is not None:
+            self.collect(room)
+        self.metrics.observe(f"message.{message_type}", time.perf_counter() - start)
+
+    def dispatch_message(self, client_socket, message):
+        """Route a message to the client's room, returns the message type (used for the metrics)"""
+        if message == "PONG":
+            # Answer to a heartbeat - receiving it was all that mattered
+            return "PONG"
+
+        if message == "PROTO:BINARY":
+            # Only before the client has a name - players are told their format when they join
+            if self.find_player_by_socket(client_socket) is None and client_socket not in self.binary_clients:
+                self.enable_binary(client_socket)
+            return "PROTO"
+
+        room = self.room_of.get(client_socket)
+        if room is None:
+            # Before their name, clients may pick a game with ROOM:<pin> or host one with ROOM:NEW
+            if message.startswith("ROOM:"):
+                self.join_room(client_socket, message.split(":", 1)[1].strip())
+                return "ROOM"
+            # ... or come back to their game with the token they got when they joined
+            if message.startswith("RESUME:"):
+                self.resume_session(client_socket, None, message.split(":", 1)[1].strip())
+                return "RESUME"
+            # A relay node serving the players of a game from its own connections
+            if message.startswith("RELAY:"):
+                self.attach_relay(client_socket, message.split(":", 1)[1].strip())
+                return "RELAY"
+            # Clients that don't ask for a PIN play in the default game
+            room = self.get_room(DEFAULT_PIN)
+            self.room_of[client_socket] = room
+
+        player = room.players.find_by_socket(client_socket)
         
-        if sorted_players:
-            stats += f"\n🏆 WINNER: {sorted_players[0].GetName()}! 🏆\n"
+        # If player doesn't exist yet, this is their name
+        if player is None:
+            if message.startswith("RESUME:"):
+                self.resume_session(client_socket, room, message.split(":", 1)[1].strip())
+                return "RESUME"
+            room.register_player(client_socket, message, client_socket in self.binary_clients)
+            return "NAME"
+
+        return room.handle_message(player, message)
+
+    def resume_session(self, client_socket, room, token):
+        """Put a returning player back in their game (RESUME:<token>)"""
+        if room is None:
+            # The token starts with the PIN of its room
+            room = self.rooms.get(token.split("-", 1)[0])
+        if room is None:
+            self.send_to(client_socket, "SESSION_NOT_FOUND")
+            return
+        resumed = room.resume_player(client_socket, token, client_socket in self.binary_clients)
+        # A connection the session had before is closed here (and taken off room_of)
+        self.collect(room)
+        if not resumed:
+            self.send_to(client_socket, "SESSION_NOT_FOUND")
+            return
+        self.room_of[client_socket] = room
+
+    def attach_relay(self, client_socket, pin):
+        """Turn a connection into a relay link for the game with this PIN (it must have an admin)"""
+        room = self.rooms.get(pin)
+        if room is None or room.players.admin is None:
+            self.send_to(client_socket, f"ROOM_NOT_FOUND:{pin}")
+            return
+        link = RelayLink(self, client_socket, room)
+        self.relays[client_socket] = link
+        room.relays.append(link)
+        self.set_relay_buffer(client_socket)
+        self.send_to(client_socket, f"RELAY:{pin}")
+        log.info("Relay attached to room %s", pin)
+
+    def set_relay_buffer(self, client_socket):
+        connection = self.connections.get(client_socket)
+        if connection:
+            connection.high_watermark = self.relay_buffer // 4
+            connection.low_watermark = self.relay_buffer // 16
+            connection.max_buffer = self.relay_buffer
+
+    def detach_relay(self, link):
+        """A relay disconnected: all of its clients are gone too"""
+        link.closed = True
+        if link in link.room.relays:
+            link.room.relays.remove(link)
+        log.info("Relay of room %s disconnected with %d clients", link.room.pin, len(link.clients))
+        for client in list(link.clients.values()):
+            self.remove_client(client)
+
+    def join_room(self, client_socket, pin):
+        """Put a client in the room with this PIN (or in a brand new room for "NEW")"""
+        if pin.upper() == "NEW":
+            room = self.get_room(self.new_pin())
+            log.info("Room %s created", room.pin)
+        elif pin in self.rooms or pin == DEFAULT_PIN:
+            room = self.get_room(pin)
         else:
-            stats += "\nNo players participated.\n"
-        
-        stats += "\n" + "="*50
-        
-        # Send to everyone
-        self.broadcast(f"GAME_OVER:{stats}")
-        
-        # Print on server
-        print(stats)
+            self.send_to(client_socket, f"ROOM_NOT_FOUND:{pin}")
+            return
+        self.room_of[client_socket] = room
+        self.send_to(client_socket, f"ROOM:{room.pin}")
+
+    def get_room(self, pin):
+        """Find a room by PIN, creating it if needed"""
+        room = self.rooms.get(pin)
+        if room is None:
+            room = Room(pin, self, self.scoreboard, self.top_k, self.default_quiz)
+            self.rooms[pin] = room
+        return room
+
+    def load_quiz_file(self, path):
+        """Load a quiz file once, later calls return the same QuizBank"""
+        path = os.path.abspath(path)
+        bank = self.quiz_banks.get(path)
+        if bank is None:
+            bank = QuizBank(path)
+            self.quiz_banks[path] = bank
+        return bank
+
+    def get_quiz(self, name):
+        """Quiz an admin asked for by file name - only files directly in quiz_dir are allowed"""
+        if not name or os.path.basename(name) != name or name.startswith("."):
+            raise QuizError("not a file name in the quiz directory")
+        return self.load_quiz_file(os.path.join(self.quiz_dir, name))
+
+    def new_pin(self):
+        """Pick an unused 6 digit PIN that belongs to this worker process"""
+        while True:
+            pin = random.randint(100000, 999999)
+            pin += self.shard_index - pin % self.shard_count
+            if 100000 <= pin <= 999999 and str(pin) not in self.rooms:
+                self.recorder.pin(str(pin))
+                return str(pin)
+
+    def new_token(self):
+        """Random part of a new session token"""
+        token = secrets.token_hex(8)
+        self.recorder.token(token)
+        return token
+
+    def collect(self, room):
+        """Carry out what an event of the room produced: close the connections it dropped,
+        then take its messages over into the outbox, behind what is already there"""
+        disconnects = room.disconnects
+        while disconnects:
+            self.remove_client(disconnects.pop())
+        outbox = room.outbox
+        if outbox:
+            self.outbox += outbox
+            outbox.clear()
+
+    def send_to(self, client_socket, message):
+        """Queue a single protocol message for one client (written out by flush_pending)"""
+        if client_socket in self.binary_clients:
+            self.send_bytes(client_socket, encode_text(message))
+        else:
+            self.send_bytes(client_socket, encode_frame(message))
+
+    def send_bytes(self, client_socket, data):
+        """Queue already encoded data for one client (behind everything already in the outbox)"""
+        self.outbox.extend((client_socket, data))
+
+    def deliver(self):
+        """Hand everything in the outbox to the clients' output buffers, in order"""
+        outbox = self.outbox
+        if not outbox:
+            return
+        connections = self.connections
+        pending_writes = self.pending_writes
+        pairs = iter(outbox)
+        for client_socket, data in zip(pairs, pairs):
+            connection = connections.get(client_socket)
+            if connection is None:
+                if client_socket.__class__ is RelayedClient:
+                    # Goes over the relay's connection
+                    client_socket.queue(data)
+                continue
+            connection.queue(data)
+            pending_writes.add(client_socket)
+        outbox.clear()
+
+    def write_bytes(self, client_socket, data):
+        """Put data in one client's output buffer right away, bypassing the outbox"""
+        connection = self.connections.get(client_socket)
+        if connection is not None:
+            connection.queue(data)
+            self.pending_writes.add(client_socket)
+
+    def flush_pending(self):
+        """Deliver the outbox, write out buffered data, watch for write-readiness where needed
+        and evict slow clients"""
+        self.deliver()
+        now = time.monotonic()
+        for client_socket in list(self.pending_writes):
+            connection = self.connections.get(client_socket)
+            if connection is None:
+                self.pending_writes.discard(client_socket)
+                continue
 
-    def broadcast(self, message):
-        """Send message to all connected clients"""
-        for client in self.clients:
             try:
-                client.send((message + "\n").encode())
-            except:
-                pass
-    
-    def broadcast_to_players(self, message):
-        """Send message only to non-admin players"""
-        for player in self.players:
-            if not player.IsAdmin():
-                try:
-                    player.client_socket.send((message + "\n").encode())
-                except:
-                    pass
+                sent = connection.flush()
+            except OSError:
+                self.remove_client(client_socket)
+                continue
+            self.metrics.add("bytes_out", sent)
+
+            if not connection.has_pending():
+                self.pending_writes.discard(client_socket)
+                self.set_write_interest(connection, False)
+            elif connection.is_too_slow(now, self.slow_timeout):
+                player = self.find_player_by_socket(client_socket)
+                name = player.GetName() if player else "unnamed client"
+                log.warning("Evicting slow client '%s' (%d bytes not delivered)", name, connection.buffered)
+                self.remove_client(client_socket)
+            else:
+                self.set_write_interest(connection, True)
+
+    def set_write_interest(self, connection, wanted):
+        """Register/unregister a socket for write-readiness in the selector"""
+        if self.selector is None or connection.write_registered == wanted:
+            return
+        events = selectors.EVENT_READ
+        if wanted:
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(connection.client_socket, events)
+        connection.write_registered = wanted
+
+    def metrics_gauges(self):
+        """Current values that are read on demand instead of being counted"""
+        gauges = {
+            "connections": len(self.clients),
+            "players": sum(len(room.players) for room in self.rooms.values()),
+            "rooms": len(self.rooms),
+            "relays": len(self.relays),
+            "pending_writes": len(self.pending_writes),
+            "log.dropped_records": dropped_records(),
+            "answer_log.dropped": self.answer_log.dropped,
+        }
+        if self.metrics.enabled:
+            idle = self.metrics.counters.get("loop.idle_seconds", 0.0)
+            busy = self.metrics.counters.get("loop.busy_seconds", 0.0)
+            if idle + busy > 0:
+                gauges["loop.idle_ratio"] = f"{idle / (idle + busy):.4f}"
+        return gauges
+
+    def render_metrics(self):
+        """Metrics report as plain text (for STATS and the metrics port)"""
+        return self.metrics.render(self.metrics_gauges())
+
+    def handle_metrics_request(self):
+        """Answer one request on the local metrics port and close the connection"""
+        metrics_client, addr = self.metrics_socket.accept()
+        # Tiny local request/response - a short blocking exchange is fine here
+        metrics_client.settimeout(1.0)
+        try:
+            metrics_client.recv(4096)
+            body = self.render_metrics().encode()
+            metrics_client.sendall(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; charset=utf-8\r\n"
+                                   + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        except OSError:
+            pass
+        metrics_client.close()
 
     def remove_client(self, client_socket):
         """Remove disconnected client"""
-        player = self.find_player_by_socket(client_socket)
-        if player:
-            print(f"Player '{player.GetName()}' disconnected")
-            self.players.remove(player)
+        self.recorder.disconnected(client_socket)
+        link = self.relays.pop(client_socket, None)
+        if link is not None:
+            self.detach_relay(link)
+        room = self.room_of.pop(client_socket, None)
+        if room:
+            player = room.players.find_by_socket(client_socket)
+            if player:
+                log.info("Player '%s' disconnected", player.GetName(), extra=SAMPLE_CONNECTIONS)
+                room.remove_player(player)
+            if len(room.players) == 0:
+                self.close_room_later(room)
         
+        self.connections.pop(client_socket, None)
+        self.pending_writes.discard(client_socket)
+        self.binary_clients.discard(client_socket)
+        self.last_seen.pop(client_socket, None)
         if client_socket in self.clients:
             self.clients.remove(client_socket)
+            if self.selector:
+                self.selector.unregister(client_socket)
         client_socket.close()
+        if room:
+            # A relayed client's close tells its relay (DROP) through the room
+            self.collect(room)
+
+
+    def close_room_later(self, room):
+        """Close an empty room once its players had session_timeout seconds to come back"""
+        if room.pin == DEFAULT_PIN:
+            return
+        if room.sessions and self.session_timeout:
+            room.cancel_timers()
+            room.close_timer = self.call_later(self.session_timeout, self.close_room_if_empty, room)
+        else:
+            self.close_room(room)
+
+    def close_room_if_empty(self, room):
+        room.close_timer = None
+        if len(room.players) == 0 and self.rooms.get(room.pin) is room:
+            self.close_room(room)
+
+    def close_room(self, room):
+        log.info("Room %s closed", room.pin)
+        room.cancel_timers()
+        # Relays of the game have nothing left to serve
+        for link in list(room.relays):
+            self.remove_client(link.link_socket)
+        del self.rooms[room.pin]
+        self.journal.record("close", room.pin)
 
 
 if __name__ == "__main__":
-    port = 12345
-    server = my_server(port)
-    print(f"Starting Kahoot Server on port {port}...")
-    server.run_server()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Cyber Kahoot server")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--engine", choices=["selectors", "select", "asyncio"], default="selectors",
+                        help="selectors = epoll/kqueue registrations, select = classic select() polling loop, "
+                             "asyncio = asyncio streams")
+    parser.add_argument("--high-watermark", type=int, default=64 * 1024,
+                        help="bytes buffered for one client before it counts as slow")
+    parser.add_argument("--low-watermark", type=int, default=16 * 1024,
+                        help="a slow client is fine again once its buffer drains below this")
+    parser.add_argument("--max-output-buffer", type=int, default=1024 * 1024,
+                        help="a client with more unsent bytes than this is disconnected at once")
+    parser.add_argument("--slow-timeout", type=float, default=10.0,
+                        help="seconds a client may stay above the high watermark before it is disconnected")
+    parser.add_argument("--scoreboard", choices=["summary", "full"], default="summary",
+                        help="summary = top K plus each player's own place, full = every player's score")
+    parser.add_argument("--top-k", type=int, default=10, help="players listed in summary scoreboards")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes for the rooms (more than 1 needs Linux/macOS and the selectors engine)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="collect latency histograms and counters (admins can ask for them with STATS)")
+    parser.add_argument("--metrics-port", type=int,
+                        help="also serve the metrics as plain text on 127.0.0.1:<port> (turns --metrics on); "
+                             "worker N of a sharded server uses port + N")
+    parser.add_argument("--quiz", help="quiz file (.json, .jsonl or .csv) that every new game starts with")
+    parser.add_argument("--quiz-dir", default="quizzes",
+                        help="directory admins can load quizzes from with 'load <file name>'")
+    parser.add_argument("--answer-time", type=float,
+                        help="seconds players get to answer; the round closes when the time is up "
+                             "(default: wait until everyone answered)")
+    parser.add_argument("--auto-advance", type=float,
+                        help="with a quiz loaded, send the next question this many seconds after a round ends")
+    parser.add_argument("--queue-pause", type=float, default=3.0,
+                        help="seconds between a round's results and the next question the admin queued ahead of time")
+    parser.add_argument("--backlog", type=int, default=1024,
+                        help="connections the kernel queues while the server is busy (listen backlog)")
+    parser.add_argument("--max-connections", type=int,
+                        help="most clients served at once (per worker process); others get SERVER_FULL")
+    parser.add_argument("--lobby-interval", type=float, default=0.5,
+                        help="seconds between batched 'players joined' lobby updates (0 = one message per join)")
+    parser.add_argument("--journal", metavar="DIR",
+                        help="keep a journal of the games in this directory; a restarted server continues them")
+    parser.add_argument("--journal-interval", type=float, default=0.05,
+                        help="seconds between journal writes (one fsync for all events in between; "
+                             "0 = before the replies of each loop iteration are sent)")
+    parser.add_argument("--session-timeout", type=float, default=300.0,
+                        help="seconds an empty game waits for its players to come back (RESUME) before it closes")
+    parser.add_argument("--heartbeat", type=float, default=15.0,
+                        help="seconds of silence after which a client gets a PING (0 = no heartbeats)")
+    parser.add_argument("--idle-timeout", type=float, default=60.0,
+                        help="a client that sent nothing (not even PONG) for this many seconds is disconnected")
+    parser.add_argument("--relay-buffer", type=int, default=64 * 1024 * 1024,
+                        help="bytes a relay node may have unsent before it is disconnected as too slow")
+    parser.add_argument("--record", metavar="FILE",
+                        help="record every received message to FILE, for Replay.py (contains session tokens; "
+                             "worker N of a sharded server writes FILE.worker-N)")
+    parser.add_argument("--answer-log", metavar="FILE",
+                        help="append every scored answer to FILE for Analytics.py "
+                             "(worker N of a sharded server writes FILE.worker-N)")
+    parser.add_argument("--answer-log-format", choices=["jsonl", "csv", "columns"], default="jsonl",
+                        help="format of the answer log: JSON lines, CSV or compact binary columns")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="INFO",
+                        help="DEBUG logs every message and answer, INFO only joins, rounds and games")
+    parser.add_argument("--log-sample", type=int, default=1,
+                        help="log only every Nth message/answer/connection record (1 = all of them)")
+    parser.add_argument("--log-file", help="write the log to this file instead of the terminal")
+    args = parser.parse_args()
+
+    server_options = dict(high_watermark=args.high_watermark, low_watermark=args.low_watermark,
+                          max_output_buffer=args.max_output_buffer, slow_timeout=args.slow_timeout,
+                          scoreboard=args.scoreboard, top_k=args.top_k,
+                          metrics=args.metrics, metrics_port=args.metrics_port,
+                          quiz=args.quiz, quiz_dir=args.quiz_dir,
+                          answer_time=args.answer_time, auto_advance=args.auto_advance,
+                          queue_pause=args.queue_pause,
+                          backlog=args.backlog, max_connections=args.max_connections,
+                          lobby_interval=args.lobby_interval,
+                          journal_dir=args.journal, journal_interval=args.journal_interval,
+                          session_timeout=args.session_timeout,
+                          heartbeat_interval=args.heartbeat, idle_timeout=args.idle_timeout,
+                          relay_buffer=args.relay_buffer, record_file=args.record,
+                          answer_log=args.answer_log, answer_log_format=args.answer_log_format)
+    log_options = dict(level=args.log_level, sample_every=args.log_sample, log_file=args.log_file)
+    setup_logging(**log_options)
+    if args.quiz:
+        # Check the quiz file before any game starts (every worker process loads its own copy)
+        try:
+            QuizBank(args.quiz)
+        except (QuizError, OSError) as e:
+            parser.error(f"--quiz {args.quiz}: {e}")
+    if args.workers > 1:
+        from Sharding import room_router
+        server = room_router(args.port, args.workers, server_options, log_options)
+    elif args.engine == "asyncio":
+        from AsyncServer import async_server
+        server = async_server(args.port, **server_options)
+    else:
+        server = my_server(args.port, args.engine, **server_options)
+    log.info("Starting Kahoot Server on port %d (%s engine)...", args.port, args.engine)
+    server.run_server()
@@ -0,0 +1,147 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+# Server logging. The game code logs through `log` instead of print():
+#  - levels: every message and every answer is DEBUG, joins/rounds/games are INFO and
+#    problems are WARNING, so the default level (INFO) keeps the per-answer paths quiet
+#  - records are put on a queue and a background thread formats and writes them,
+#    so the game loop never waits for the terminal or the disk
+#  - sampling: records of chatty events (see the SAMPLE_* extras) can be logged
+#    only every Nth time with --log-sample N. The skipped ones are dropped before a
+#    LogRecord is even made - making it is most of what a log call costs
+
+# Pass one of these as extra= to make a record part of a sampled event
+SAMPLE_CONNECTIONS = {"event": "connections"}
+SAMPLE_MESSAGES = {"event": "messages"}
+SAMPLE_ANSWERS = {"event": "answers"}
+
+# Records waiting for the writer thread; more than this and new records are dropped
+MAX_QUEUED_RECORDS = 100000
+
+# The running writer thread (a QueueListener), None until setup_logging is called
+listener = None
+
+class Sampler:
+    """Keeps only every Nth record of each sampled event (other records always pass)"""
+
+    def __init__(self, every):
+        self.every = every
+        # event name -> records seen so far
+        self.counts = {}
+
+    def keep(self, extra):
+        event = extra.get("event")
+        if event is None:
+            return True
+        count = self.counts.get(event, 0)
+        self.counts[event] = count + 1
+        return count % self.every == 0
+
+
+class SampledLogger(logging.Logger):
+    """Logger that skips sampled records in the log call itself, before any record is made"""
+
+    # A Sampler while --log-sample is above 1
+    sampler = None
+
+    def _log(self, level, msg, args, exc_info=None, extra=None, stack_info=False, stacklevel=1):
+        if extra is not None and self.sampler is not None and not self.sampler.keep(extra):
+            return
+        # One frame more (this one) between the caller and the logging module
+        super()._log(level, msg, args, exc_info, extra, stack_info, stacklevel + 1)
+
+
+# The game's logger is a SampledLogger - the class is switched just for creating it
+logger_class = logging.getLoggerClass()
+logging.setLoggerClass(SampledLogger)
+log = logging.getLogger("kahoot")
+logging.setLoggerClass(logger_class)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the writer thread falls behind.
+
+    Losing log lines is better than letting the queue eat all the memory
+    or blocking the game loop.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The queue never leaves the process: the record goes as it is and the writer
+        # thread formats it (the stdlib version formats and copies it here, in the game loop)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level="INFO", sample_every=1, log_file=None):
+    """Send the server log through a background writer thread (to stdout or log_file).
+
+    Called once per process - worker processes of a sharded server call it again,
+    because a forked child doesn't get the parent's writer thread.
+    """
+    global listener
+    stop_logging()
+    if log_file:
+        target = logging.FileHandler(log_file)
+    else:
+        target = logging.StreamHandler(sys.stdout)
+    target.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+
+    log_queue = queue.Queue(MAX_QUEUED_RECORDS)
+    log.addHandler(DroppingQueueHandler(log_queue))
+    log.sampler = Sampler(sample_every) if sample_every > 1 else None
+    log.setLevel(level)
+    log.propagate = False
+
+    listener = logging.handlers.QueueListener(log_queue, target)
+    listener.start()
+    return listener
+
+
+def stop_logging():
+    """Write out everything still queued, stop the writer thread and unconfigure the log"""
+    global listener
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        listener = None
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+    log.sampler = None
+    log.setLevel(logging.NOTSET)
+    log.propagate = True
+
+
+# Whatever is still queued when the process exits is written out
+atexit.register(stop_logging)
+
+
+def forget_parent_logging():
+    """Runs in a forked child: the parent's writer thread doesn't exist there, so its
+    queue is dropped without touching it (setup_logging starts a new one)"""
+    global listener
+    listener = None
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=forget_parent_logging)
+
+
+def dropped_records():
+    """How many log records were dropped because the writer thread couldn't keep up"""
+    return sum(getattr(handler, "dropped", 0) for handler in log.handlers)
@@ -0,0 +1,150 @@
+import multiprocessing
+import os
+import selectors
+import socket
+from Room import DEFAULT_PIN
+from Server import my_server
+from ServerLog import log, setup_logging
+
+# Process-per-core sharding: one router process owns the listening port and a pool
+# of worker processes owns the rooms. A room's PIN decides its worker
+# (pin % worker_count), so all players of one game end up in the same process.
+#
+# The router only reads the first line of each new connection (ROOM:<pin>, ROOM:NEW
+# or a plain name for the default game) and then passes the socket itself to the
+# right worker with socket.send_fds - after that, no byte of that client goes
+# through the router again. Needs a Unix-like OS (file descriptor passing).
+
+class room_router:
+    """Front process that accepts connections and hands them to the worker owning their room"""
+
+    def __init__(self, port, worker_count, server_options, log_options):
+        self.server_socket = socket.socket()
+        self.server_socket.bind(('', port))
+        self.server_socket.listen(server_options.get("backlog", 1024))
+        self.server_socket.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server_socket, selectors.EVENT_READ)
+        # Clients that haven't sent their first line yet (socket -> bytes received so far)
+        self.waiting = {}
+        # ROOM:NEW requests are spread over the workers in turn
+        self.next_new_room_worker = 0
+
+        # One socket pair per worker; SOCK_SEQPACKET keeps every handoff a separate message
+        pairs = [socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET) for _ in range(worker_count)]
+        self.workers = [router_end for router_end, worker_end in pairs]
+        self.processes = []
+        for index in range(worker_count):
+            worker_end = pairs[index][1]
+            # A forked worker inherits every socket of the pairs - it has to close the ones that
+            # aren't its own, otherwise it never notices that the router went away
+            not_mine = [s for pair in pairs for s in pair if s is not worker_end]
+            process = multiprocessing.Process(target=run_worker, daemon=True,
+                                              args=(index, worker_count, worker_end, server_options, log_options, not_mine))
+            process.start()
+            self.processes.append(process)
+        for router_end, worker_end in pairs:
+            worker_end.close()
+
+    def run_server(self):
+        log.info("Kahoot room router is now listening (%d worker processes)...", len(self.workers))
+        while True:
+            for key, events in self.selector.select():
+                if key.fileobj == self.server_socket:
+                    self.handle_new_connection()
+                else:
+                    self.handle_first_line(key.fileobj)
+
+    def handle_new_connection(self):
+        """Accept every waiting client and ask for its name (the worker takes it from there)"""
+        while True:
+            try:
+                client_socket, addr = self.server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                log.warning("Could not accept a connection: %s", e)
+                return
+            client_socket.setblocking(False)
+            try:
+                client_socket.send(b"NAME_REQUEST\n")
+            except OSError:
+                client_socket.close()
+                continue
+            self.waiting[client_socket] = b""
+            self.selector.register(client_socket, selectors.EVENT_READ)
+
+    def handle_first_line(self, client_socket):
+        """Collect data until the first line arrived, then route the client"""
+        try:
+            data = client_socket.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        if not data:
+            self.drop(client_socket)
+            return
+
+        data = self.waiting[client_socket] + data
+        if b"\n" not in data:
+            if len(data) > 4096:
+                self.drop(client_socket)
+            else:
+                self.waiting[client_socket] = data
+            return
+
+        first_line = data.split(b"\n", 1)[0].strip().decode(errors="replace")
+        worker = self.workers[self.pick_worker(first_line)]
+        # Pass the socket together with everything already read from it
+        socket.send_fds(worker, [data], [client_socket.fileno()])
+        self.drop(client_socket)
+
+    def pick_worker(self, first_line):
+        """Index of the worker process that owns the room this client asks for"""
+        if first_line.startswith("RESUME:"):
+            # Session tokens start with the PIN of their room
+            pin = first_line.split(":", 1)[1].strip().split("-", 1)[0]
+        elif not first_line.startswith(("ROOM:", "RELAY:")):
+            pin = DEFAULT_PIN
+        else:
+            pin = first_line.split(":", 1)[1].strip()
+            if pin.upper() == "NEW":
+                index = self.next_new_room_worker
+                self.next_new_room_worker = (index + 1) % len(self.workers)
+                return index
+        if not pin.isdigit():
+            # Unknown PIN - any worker can answer ROOM_NOT_FOUND
+            return 0
+        return int(pin) % len(self.workers)
+
+    def drop(self, client_socket):
+        """Forget a client in the router (the worker keeps its own copy of the socket)"""
+        self.waiting.pop(client_socket, None)
+        self.selector.unregister(client_socket)
+        client_socket.close()
+
+
+def run_worker(index, worker_count, handoff_socket, server_options, log_options, not_mine):
+    """Entry point of one worker process"""
+    for other_socket in not_mine:
+        other_socket.close()
+    # The writer thread of the parent's log doesn't exist in this process
+    setup_logging(**log_options)
+    if server_options.get("metrics_port"):
+        # Every worker serves its own metrics page
+        server_options = dict(server_options, metrics_port=server_options["metrics_port"] + index)
+    if server_options.get("journal_dir"):
+        # ... and keeps its own journal
+        server_options = dict(server_options, journal_dir=os.path.join(server_options["journal_dir"], f"worker-{index}"))
+    if server_options.get("record_file"):
+        # ... and records its own traffic
+        server_options = dict(server_options, record_file=f"{server_options['record_file']}.worker-{index}")
+    if server_options.get("answer_log"):
+        # ... and exports its own answers
+        server_options = dict(server_options, answer_log=f"{server_options['answer_log']}.worker-{index}")
+    server = my_server(None, "selectors", shard_index=index, shard_count=worker_count,
+                       handoff_socket=handoff_socket, **server_options)
+    log.info("Worker %d ready", index)
+    server.run_server()
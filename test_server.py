@@ -0,0 +1,120 @@
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from Journal import Journal
+from Server import my_server
+
+# Regression tests against a real server process: python -m pytest -q (or python -m unittest)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def read_until(client, text, timeout=5.0):
+    """Everything the server sent until text shows up (or the timeout)"""
+    data = b""
+    deadline = time.monotonic() + timeout
+    while text.encode() not in data and time.monotonic() < deadline:
+        client.settimeout(max(0.01, deadline - time.monotonic()))
+        try:
+            chunk = client.recv(65536)
+        except TimeoutError:
+            break
+        if not chunk:
+            break
+        data += chunk
+    return data.decode()
+
+
+class RunningServerTest(unittest.TestCase):
+    def setUp(self):
+        self.port = free_port()
+        self.server = subprocess.Popen([sys.executable, os.path.join(HERE, "Server.py"), "--port", str(self.port),
+                                        "--log-level", "WARNING"])
+        self.addCleanup(self.stop_server)
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", self.port)).close()
+                break
+            except ConnectionRefusedError:
+                time.sleep(0.05)
+
+    def stop_server(self):
+        self.server.terminate()
+        self.server.wait()
+
+    def connect(self):
+        client = socket.create_connection(("127.0.0.1", self.port))
+        self.addCleanup(client.close)
+        read_until(client, "NAME_REQUEST")
+        return client
+
+    def test_oversized_question_is_rejected(self):
+        admin = self.connect()
+        admin.sendall(b"ROOM:NEW\nadmin\n")
+        read_until(admin, "ROLE:ADMIN")
+        # Longer than the 2-byte field lengths of the binary QUESTION frame
+        admin.sendall(f"QUESTION:{'x' * 70000}|1|2|3|4|1\n".encode())
+        self.assertIn("QUIZ_ERROR:Invalid question", read_until(admin, "QUIZ_ERROR"))
+        admin.sendall(b"QUEUE:QUESTION:2+2?|3|4|5|" + "é".encode() * 40000 + b"|2\n")
+        self.assertIn("QUIZ_ERROR:Invalid question", read_until(admin, "QUIZ_ERROR"))
+        # The server is still up and serving the room
+        self.assertIsNone(self.server.poll())
+        admin.sendall(b"QUESTION:2+2?|3|4|5|6|2\n")
+        self.assertNotIn("QUIZ_ERROR", read_until(admin, "QUESTION", timeout=0.5))
+        self.connect()
+
+
+class JournalRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.server = my_server(0, journal_dir=self.directory)
+        self.addCleanup(self.server.server_socket.close)
+
+    def join(self, lines):
+        """A client connected over a socket pair, sending its first lines"""
+        client_socket, peer = socket.socketpair()
+        self.addCleanup(client_socket.close)
+        self.addCleanup(peer.close)
+        self.server.add_client(client_socket)
+        self.server.handle_messages(client_socket, lines)
+        return client_socket
+
+    def test_snapshot_in_the_middle_of_a_round(self):
+        server = self.server
+        server.journal.snapshot_every = 5
+        admin = self.join(["ROOM:NEW", "admin"])
+        room = server.room_of[admin]
+        players = [self.join([f"ROOM:{room.pin}", f"player{i}"]) for i in range(10)]
+        server.handle_messages(admin, ["START_GAME", "QUESTION:2+2?|3|4|5|6|2"])
+        for player in players[:5]:
+            server.handle_messages(player, ["2"])
+        # The commit timer: more than snapshot_every records, so a snapshot is taken during the round
+        generation = server.journal.generation
+        server.journal.commit()
+        self.assertEqual(server.journal.generation, generation + 1)
+        # Recovery has to replay the rest of the round on top of that snapshot
+        server.journal.snapshot_every = 100000
+        for player in players[5:]:
+            server.handle_messages(player, ["2"])
+        server.journal.commit()
+
+        live = {token: player.GetPoints() for token, player in room.sessions.items()}
+        self.assertEqual(sorted(live.values()), [0] + [1] * 10)
+        recovered = Journal(self.directory, None).recover()[room.pin]["sessions"]
+        self.assertEqual({token: points for token, (name, points, admin) in recovered.items()}, live)
+
+
+if __name__ == "__main__":
+    unittest.main()